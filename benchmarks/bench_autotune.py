@@ -0,0 +1,91 @@
+#######
+# Benchmark: adaptive concurrency (src/limiter.py) vs fixed worker counts
+# Sends the same batch of requests to the fake server
+# (benchmarks/fake_openai_server.py) through fixed limits and through the
+# AIMD limiter, and prints throughput, 429s and the limit the limiter settled on.
+# Uses plain urllib, so it runs without the openai package.
+#
+# USAGE:
+#   From the project root directory:
+#     python benchmarks/bench_autotune.py [requests] [max_concurrent]
+#######
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from fake_openai_server import Throttle, start_server
+from limiter import AdaptiveLimiter
+
+
+class FixedLimiter(AdaptiveLimiter):
+    """Same interface, never changes its limit"""
+
+    def on_success(self, latency, output_tokens, started=None):
+        pass
+
+    def on_throttle(self, started=None):
+        with self._cond:
+            self.throttled += 1
+
+
+def call(url, limiter, text):
+    """One request through the limiter, retrying 429s with a short backoff"""
+    body = json.dumps({'model': 'fake', 'input': [{'role': 'user', 'content': text}]}).encode('utf-8')
+    for attempt in range(30):
+        with limiter:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(
+                        url, body, {'Content-Type': 'application/json'})) as response:
+                    usage = json.load(response)['usage']
+            except urllib.error.HTTPError as e:
+                if e.code != 429:
+                    raise
+                limiter.on_throttle(started)
+                throttled = True
+            else:
+                limiter.on_success(time.perf_counter() - started, usage['output_tokens'], started)
+                return usage['output_tokens']
+        if throttled:
+            time.sleep(min(0.05 * 2 ** attempt, 0.5))
+    raise RuntimeError("Gave up after repeated 429s")
+
+
+def run(url, limiter, texts):
+    """Returns (seconds, output tokens/s)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        tokens = sum(pool.map(lambda text: call(url, limiter, text), texts))
+    elapsed = time.perf_counter() - started
+    return elapsed, tokens / elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    max_concurrent = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    throttle = Throttle(max_concurrent=max_concurrent, capacity=max_concurrent - 2,
+                        base_latency=0.05, tokens_per_s=4000, contention=0.5)
+    server = start_server(throttle)
+    url = f"http://127.0.0.1:{server.server_port}/v1/responses"
+    texts = ["x" * (400 + 37 * (i % 11)) for i in range(count)]
+
+    print(f"{count} requests, server caps at {max_concurrent} in flight "
+          f"(latency grows past {throttle.capacity})")
+    print(f"{'limiter':<16} {'seconds':>8} {'tok/s':>8} {'429s':>6} {'final limit':>12}")
+    for name, limiter in [("fixed 1", FixedLimiter("fake", 1)),
+                          ("fixed 4", FixedLimiter("fake", 4)),
+                          ("fixed 16", FixedLimiter("fake", 16)),
+                          ("adaptive from 1", AdaptiveLimiter("fake", 1)),
+                          ("adaptive from 16", AdaptiveLimiter("fake", 16))]:
+        elapsed, throughput = run(url, limiter, texts)
+        print(f"{name:<16} {elapsed:>8.2f} {throughput:>8.0f} {limiter.throttled:>6} {limiter.limit:>12}")
+
+    server.shutdown()
@@ -0,0 +1,89 @@
+#######
+# Benchmark: hedged vs plain requests (src/llm.py enable_hedging)
+# Sends the same batch of requests through create_response() to the fake
+# server (benchmarks/fake_openai_server.py), where a share of requests
+# straggle, first without hedging and then with it, and prints p50/p95/p99
+# latency, how many requests were hedged and the extra tokens that cost.
+# The first pass also gives hedging the latency history it triggers on.
+# Needs the openai package, like the pipelines.
+#
+# USAGE:
+#   From the project root directory:
+#     python benchmarks/bench_hedging.py [requests] [straggle] [budget]
+#
+#   Example: 3% of requests straggle, duplicates capped at 10% of the tokens
+#     python benchmarks/bench_hedging.py 400 0.03 0.1
+#######
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from fake_openai_server import Throttle, start_server
+
+WORKERS = 4
+STRAGGLE_LATENCY = 0.5
+
+
+def timed_call(create_response, text):
+    started = time.perf_counter()
+    create_response("translate", input=[{"role": "user", "content": text}], temperature=0)
+    return time.perf_counter() - started
+
+
+def run(create_response, texts):
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        return list(pool.map(lambda text: timed_call(create_response, text), texts))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    straggle = float(sys.argv[2]) if len(sys.argv) > 2 else 0.03
+    budget = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    # No concurrency cap or contention: only the stragglers are slow
+    throttle = Throttle(max_concurrent=0, capacity=64, base_latency=0.05, tokens_per_s=4000,
+                        straggle=straggle, straggle_latency=STRAGGLE_LATENCY)
+    server = start_server(throttle)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "fake"
+
+    import llm
+    from limiter import freeze_tuning, limiter_for
+    from tracing import percentile
+
+    # Keep the real run's tuning file and usage report untouched
+    freeze_tuning()
+    llm.USAGE_REPORT = Path("outputs/bench_hedging_usage.json")
+    # Leave room for every request and its duplicate, so limiter queueing doesn't blur the comparison
+    model = llm.stage_model("translate")
+    limiter = limiter_for(model)
+    limiter.min_limit = limiter.limit = 2 * WORKERS
+
+    texts = ["x" * (400 + 37 * (i % 11)) for i in range(count)]
+    print(f"{count} requests, {WORKERS} at a time, {straggle:.0%} straggle by {STRAGGLE_LATENCY}s, "
+          f"hedge budget {budget:.0%}")
+    print(f"{'':<10} {'p50':>7} {'p95':>7} {'p99':>7} {'hedges':>7} {'won':>5} {'tokens':>8}")
+
+    plain = run(llm.create_response, texts)
+    print(f"{'plain':<10} {percentile(plain, 50):>6.3f}s {percentile(plain, 95):>6.3f}s "
+          f"{percentile(plain, 99):>6.3f}s {'-':>7} {'-':>5} {'-':>8}")
+
+    before = llm.usage_report()[model]
+    llm.enable_hedging(budget)
+    hedged = run(llm.create_response, texts)
+    # Abandoned requests are accounted once they finish
+    time.sleep(STRAGGLE_LATENCY * 2)
+    after = llm.usage_report()[model]
+
+    spent = (after['input_tokens'] + after['output_tokens']) - (before['input_tokens'] + before['output_tokens'])
+    overhead = (after['hedge_tokens'] - before['hedge_tokens']) / spent if spent else 0.0
+    print(f"{'hedged':<10} {percentile(hedged, 50):>6.3f}s {percentile(hedged, 95):>6.3f}s "
+          f"{percentile(hedged, 99):>6.3f}s {after['hedges'] - before['hedges']:>7} "
+          f"{after['hedge_wins'] - before['hedge_wins']:>5} {overhead:>+8.1%}")
+
+    server.shutdown()
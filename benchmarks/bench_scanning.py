@@ -0,0 +1,85 @@
+#######
+# Benchmark: ChapterScan vs the per-query regexes in the verifier
+# Runs every verification heuristic over each chapter of a corpus both ways,
+# checks that the answers are identical and prints the timings.
+#
+# USAGE:
+#   From the project root directory:
+#     python benchmarks/bench_scanning.py [input_directory] [repeats]
+#######
+
+from pathlib import Path
+import re
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from chapter_index import ChapterIndex
+from scanning import (ChapterScan, regex_pronouns_near_name,
+                      MALE_PRONOUNS, FEMALE_PRONOUNS, MALE_NOUNS, FEMALE_NOUNS)
+
+
+def word_count_regex(text, words):
+    return len(re.findall(r'\b(' + '|'.join(map(re.escape, sorted(words))) + r')\b', text, re.IGNORECASE))
+
+
+def queries_regex(text):
+    """The heuristics as separate regex scans, like the verifier did"""
+    return (
+        regex_pronouns_near_name(text),
+        text.lower().count("shepard"),
+        word_count_regex(text, MALE_PRONOUNS),
+        word_count_regex(text, FEMALE_PRONOUNS),
+        word_count_regex(text, MALE_NOUNS),
+        word_count_regex(text, FEMALE_NOUNS),
+    )
+
+
+def queries_scan(text):
+    """The same heuristics from one ChapterScan"""
+    scan = ChapterScan(text)
+    return (
+        scan.pronouns_near_name(),
+        len(scan.substring_positions("shepard")),
+        scan.count(MALE_PRONOUNS),
+        scan.count(FEMALE_PRONOUNS),
+        scan.count(MALE_NOUNS),
+        scan.count(FEMALE_NOUNS),
+    )
+
+
+def bench(fn, texts, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    input_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("inputs/adamo")
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    chapter_index = ChapterIndex.load(input_dir)
+    texts = [chapter_index.path(e).read_text(encoding='utf-8') for e in chapter_index]
+    total_chars = sum(len(t) for t in texts)
+
+    mismatches = [i for i, t in enumerate(texts) if queries_regex(t) != queries_scan(t)]
+    print(f"Corpus: {input_dir} ({len(texts)} chapters, {total_chars / 1e6:.2f} M chars)")
+    print(f"Results identical: {'yes' if not mismatches else f'NO (chapters {mismatches})'}")
+
+    regex_time = bench(queries_regex, texts, repeats)
+    scan_time = bench(queries_scan, texts, repeats)
+    print(f"  regex, one scan per query : {regex_time * 1000:8.1f} ms")
+    print(f"  ChapterScan, one pass     : {scan_time * 1000:8.1f} ms  ({regex_time / scan_time:.2f}x)")
+
+    # Worst case for the backtracking regex: long sentences with many
+    # Shepard mentions and no pronoun in range
+    adversarial = ("Shepard " + "walked " * 30) * 20000
+    regex_time = bench(queries_regex, [adversarial], 1)
+    scan_time = bench(queries_scan, [adversarial], 1)
+    print(f"Adversarial text ({len(adversarial) / 1e6:.1f} M chars, no sentence breaks):")
+    print(f"  regex                     : {regex_time * 1000:8.1f} ms")
+    print(f"  ChapterScan               : {scan_time * 1000:8.1f} ms  ({regex_time / scan_time:.2f}x)")
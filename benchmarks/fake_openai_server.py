@@ -0,0 +1,204 @@
+#######
+# Fake OpenAI Responses API server with configurable throttling
+# Answers POST /v1/responses (and /v1/chat/completions, like a local
+# OpenAI-compatible server) by echoing the last user message back as the
+# model output, with latency that grows with the output size and with the
+# number of requests in flight, and returns 429s past a concurrency cap or a
+# requests-per-minute budget. A share of requests can be made to straggle
+# (a fixed extra delay), as hedging is meant for. Lets the pipelines, the
+# concurrency limiter (src/limiter.py) and hedging (src/llm.py) be exercised
+# without an API key or cost.
+#
+# USAGE:
+#   From the project root directory:
+#     python benchmarks/fake_openai_server.py [--port 8765] [--max-concurrent 6] [--rpm 600] [...]
+#
+#   Then point the scripts at it:
+#     OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python src/regender_v2.py inputs/adamo
+#######
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class Throttle:
+    """Server-side limits and latency model, shared by all handler threads"""
+
+    def __init__(self, max_concurrent=6, rpm=0, capacity=4, base_latency=0.2,
+                 tokens_per_s=400.0, contention=0.5, straggle=0.0, straggle_latency=1.0, seed=0):
+        self.max_concurrent = max_concurrent
+        self.rpm = rpm
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self.tokens_per_s = tokens_per_s
+        self.contention = contention
+        self.straggle = straggle
+        self.straggle_latency = straggle_latency
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.recent = collections.deque()
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """True if the request may run; False means answer 429"""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if (self.max_concurrent and self.in_flight >= self.max_concurrent) or \
+                    (self.rpm and len(self.recent) >= self.rpm):
+                self.counts['throttled'] += 1
+                return False
+            self.recent.append(now)
+            self.in_flight += 1
+            self.counts['served'] += 1
+            return True
+
+    def done(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def latency(self, output_tokens):
+        """Fixed overhead plus generation time, slowed down past the server's capacity, plus any straggle"""
+        with self.lock:
+            overload = max(0, self.in_flight - self.capacity)
+            straggling = self.random.random() < self.straggle
+            if straggling:
+                self.counts['straggled'] += 1
+        latency = (self.base_latency + output_tokens / self.tokens_per_s) * (1 + self.contention * overload)
+        return latency + self.straggle_latency if straggling else latency
+
+
+def response_body(model, text, input_tokens, output_tokens):
+    """Minimal Responses API object the openai client can parse"""
+    return {
+        'id': f"resp_{uuid.uuid4().hex}",
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': model,
+        'output': [{
+            'type': 'message',
+            'id': f"msg_{uuid.uuid4().hex}",
+            'status': 'completed',
+            'role': 'assistant',
+            'content': [{'type': 'output_text', 'text': text, 'annotations': []}],
+        }],
+        'parallel_tool_calls': True,
+        'tool_choice': 'auto',
+        'tools': [],
+        'usage': {
+            'input_tokens': input_tokens,
+            'input_tokens_details': {'cached_tokens': 0},
+            'output_tokens': output_tokens,
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': input_tokens + output_tokens,
+        },
+    }
+
+
+def chat_completion_body(model, text, input_tokens, output_tokens):
+    """Minimal chat.completions object, for backends without the Responses API"""
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': text}}],
+        'usage': {'prompt_tokens': input_tokens, 'completion_tokens': output_tokens,
+                  'total_tokens': input_tokens + output_tokens},
+    }
+
+
+def last_user_text(payload):
+    messages = payload.get('input', payload.get('messages'))
+    if isinstance(messages, str):
+        return messages
+    for message in reversed(messages or []):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            return content if isinstance(content, str) else ''.join(part.get('text', '') for part in content)
+    return ''
+
+
+def make_handler(throttle):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            chat = self.path.rstrip('/').endswith('/chat/completions')
+            if not chat and not self.path.rstrip('/').endswith('/responses'):
+                self._send(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+                return
+
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not throttle.admit():
+                self._send(429, {'error': {'message': 'Rate limit reached (fake server)', 'type': 'requests',
+                                           'code': 'rate_limit_exceeded'}},
+                           [('retry-after', '1')])
+                return
+
+            try:
+                text = last_user_text(payload)
+                input_tokens = max(1, len(json.dumps(payload.get('input', payload.get('messages', '')))) // 4)
+                output_tokens = max(1, len(text) // 4)
+                latency = throttle.latency(output_tokens)
+                time.sleep(latency)
+                body = chat_completion_body if chat else response_body
+                self._send(200, body(payload.get('model', 'fake'), text, input_tokens, output_tokens),
+                           [('openai-processing-ms', str(int(latency * 1000)))])
+            finally:
+                throttle.done()
+
+    return Handler
+
+
+def start_server(throttle, port=0):
+    """Serve in a background thread; returns the server (server.server_port has the port)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(throttle))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI Responses API with configurable throttling")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-concurrent", type=int, default=6, help="429 past this many requests in flight (0: no cap)")
+    parser.add_argument("--rpm", type=int, default=0, help="429 past this many requests per minute (0: no cap)")
+    parser.add_argument("--capacity", type=int, default=4, help="Requests in flight before latency starts to grow")
+    parser.add_argument("--base-latency", type=float, default=0.2, help="Seconds of overhead per request")
+    parser.add_argument("--tokens-per-s", type=float, default=400.0, help="Generation speed of one request")
+    parser.add_argument("--contention", type=float, default=0.5,
+                        help="Extra latency fraction per request in flight past capacity")
+    parser.add_argument("--straggle", type=float, default=0.0, help="Share of requests that straggle")
+    parser.add_argument("--straggle-latency", type=float, default=1.0, help="Extra seconds of a straggling request")
+    args = parser.parse_args()
+
+    throttle = Throttle(args.max_concurrent, args.rpm, args.capacity, args.base_latency,
+                        args.tokens_per_s, args.contention, args.straggle, args.straggle_latency)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(throttle))
+    print(f"Fake OpenAI server on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nServed {throttle.counts['served']}, throttled {throttle.counts['throttled']}")
@@ -0,0 +1,262 @@
+#######
+# Export script
+# This script takes in a directory of text files representing chapters
+# and generates a single EPUB3 e-book: one XHTML file per chapter plus a
+# generated navigation document, written straight into the zip.
+#
+# On rebuild, chapters whose XHTML didn't change are copied over from the
+# previous e-book still compressed, so only edited chapters get recompressed.
+# zipfile can't append already-compressed data, so the e-book is written by
+# ZipWriter, a small writer for the documented zip format (.ZIP APPNOTE 6.3);
+# zipfile only reads the previous build.
+#######
+
+from datetime import datetime, timezone
+import hashlib
+import html
+import struct
+import uuid
+import zipfile
+import zlib
+
+from export_core import load_book
+from progress import log
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+    <rootfiles>
+        <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+    </rootfiles>
+</container>
+"""
+
+STYLE_CSS = """body {
+    font-family: serif;
+    line-height: 1.5;
+}
+
+h1 {
+    text-align: center;
+    margin: 2em 0 1.5em 0;
+}
+
+p {
+    margin: 0 0 0.8em 0;
+    text-align: justify;
+}
+"""
+
+XHTML_HEAD = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="en" xml:lang="en">
+<head>
+    <meta charset="utf-8"/>
+    <title>{title}</title>
+    <link rel="stylesheet" type="text/css" href="{css}"/>
+</head>
+"""
+
+# Fixed-size parts of zip records, see the .ZIP APPNOTE sections 4.3.7, 4.3.12 and 4.3.16
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<4s4H2LH')
+
+ZIP_VERSION = 20             # 2.0: deflate
+UTF8_NAMES = 0x800           # general purpose flag bit 11
+FILE_ATTRIBUTES = 0o644 << 16
+ZIP32_LIMIT = 0xFFFFFFFF     # no ZIP64: sizes and offsets must stay under 4 GiB
+
+
+def dos_date_time(date_time):
+    """(date, time) fields of a zip header from a (year, month, day, hour, minute, second) tuple"""
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+class ZipWriter:
+    """Writes a zip archive front to back: local header and data per entry, then the central directory"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.entries = []   # (name, method, crc, compressed size, size, date, time, comment, offset)
+
+    def write(self, name, data, compress=True, comment=b'', date_time=None):
+        """Add one entry, deflated unless compress is False"""
+        if compress:
+            packer = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            raw = packer.compress(data) + packer.flush()
+        else:
+            raw = data
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        date_time = date_time or datetime.now().timetuple()[:6]
+        self.write_raw(name, raw, method, zlib.crc32(data), len(data), comment, date_time)
+
+    def write_raw(self, name, raw, method, crc, size, comment=b'', date_time=(1980, 1, 1, 0, 0, 0)):
+        """Add one entry whose data is already compressed with method"""
+        offset = self.fp.tell()
+        if max(offset, len(raw), size) > ZIP32_LIMIT:
+            raise ValueError(f"{name}: e-book too large for a zip without ZIP64")
+        encoded = name.encode('utf-8')
+        date, time = dos_date_time(date_time)
+        self.fp.write(LOCAL_HEADER.pack(b'PK\x03\x04', ZIP_VERSION, UTF8_NAMES, method, time, date,
+                                        crc, len(raw), size, len(encoded), 0))
+        self.fp.write(encoded)
+        self.fp.write(raw)
+        self.entries.append((encoded, method, crc, len(raw), size, date, time, comment, offset))
+
+    def close(self):
+        """Write the central directory and its end record"""
+        start = self.fp.tell()
+        for encoded, method, crc, compressed, size, date, time, comment, offset in self.entries:
+            self.fp.write(CENTRAL_HEADER.pack(b'PK\x01\x02', ZIP_VERSION, ZIP_VERSION, UTF8_NAMES, method,
+                                              time, date, crc, compressed, size, len(encoded), 0,
+                                              len(comment), 0, 0, FILE_ATTRIBUTES, offset))
+            self.fp.write(encoded)
+            self.fp.write(comment)
+        end = self.fp.tell()
+        if len(self.entries) > 0xFFFF or end > ZIP32_LIMIT:
+            raise ValueError("E-book too large for a zip without ZIP64")
+        self.fp.write(END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, len(self.entries), len(self.entries),
+                                                    end - start, start, 0))
+
+
+def create_epub_from_chapters(input_dir, epub_filename="compiled_chapters.epub"):
+    """Create a single EPUB from all text files in input_dir"""
+    log(f"\n{'='*60}")
+    log(f"Creating EPUB from chapters in {input_dir}")
+    log('='*60)
+
+    book = load_book(input_dir)
+    if book is None:
+        return None
+
+    return render_epub(book, epub_filename)
+
+
+def render_chapter_xhtml(chapter):
+    """One chapter as an XHTML content document"""
+    parts = [XHTML_HEAD.format(title=html.escape(chapter.title), css="../style.css")]
+    parts.append('<body>\n<section epub:type="chapter">\n')
+    parts.append(f'<h1>{html.escape(chapter.title)}</h1>\n')
+    for para in chapter.paragraphs:
+        parts.append('<p>' + html.escape(para).replace('\n', '<br/>\n') + '</p>\n')
+    parts.append('</section>\n</body>\n</html>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def render_nav_xhtml(book):
+    """EPUB3 navigation document (the e-reader's table of contents)"""
+    items = ''.join(
+        f'            <li><a href="chapters/{ch.stem}.xhtml">{html.escape(ch.title)}</a></li>\n'
+        for ch in book.chapters
+    )
+    return (XHTML_HEAD.format(title="Contents", css="style.css")
+            + '<body>\n    <nav epub:type="toc" id="toc">\n        <h1>Contents</h1>\n        <ol>\n'
+            + items
+            + '        </ol>\n    </nav>\n</body>\n</html>\n').encode('utf-8')
+
+
+def render_content_opf(book, book_id):
+    """Package document: metadata, manifest and reading order"""
+    modified = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    manifest = ''.join(
+        f'        <item id="chapter-{ch.stem}" href="chapters/{ch.stem}.xhtml" media-type="application/xhtml+xml"/>\n'
+        for ch in book.chapters
+    )
+    spine = ''.join(f'        <itemref idref="chapter-{ch.stem}"/>\n' for ch in book.chapters)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="en">
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+        <dc:identifier id="book-id">urn:uuid:{book_id}</dc:identifier>
+        <dc:title>{html.escape(book.name)}</dc:title>
+        <dc:language>en</dc:language>
+        <meta property="dcterms:modified">{modified}</meta>
+    </metadata>
+    <manifest>
+        <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+        <item id="css" href="style.css" media-type="text/css"/>
+{manifest}    </manifest>
+    <spine>
+{spine}    </spine>
+</package>
+""".encode('utf-8')
+
+
+def read_reusable_entries(epub_path):
+    """Map entry name -> (ZipInfo, raw compressed bytes) from a previous build
+
+    Each chapter entry's comment holds the sha256 of its XHTML, so unchanged
+    chapters can be matched without decompressing them.
+    """
+    reusable = {}
+    try:
+        with zipfile.ZipFile(epub_path) as old, open(epub_path, 'rb') as f:
+            for info in old.infolist():
+                if not info.filename.startswith("OEBPS/chapters/") or not info.comment:
+                    continue
+                f.seek(info.header_offset)
+                header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+                name_length, extra_length = header[-2], header[-1]
+                f.seek(name_length + extra_length, 1)
+                reusable[info.filename] = (info, f.read(info.compress_size))
+    except (FileNotFoundError, zipfile.BadZipFile):
+        pass
+    return reusable
+
+
+def render_epub(book, epub_filename="compiled_chapters.epub"):
+    """Render an already-parsed Book into an EPUB3 next to its chapters"""
+    epub_path = book.source_dir / epub_filename
+    book_id = uuid.uuid5(uuid.NAMESPACE_URL, f"a04:{book.name}")
+
+    # Read what can be reused before the old file is overwritten
+    reusable = read_reusable_entries(epub_path)
+    reused = 0
+
+    with open(epub_path, 'wb') as f:
+        zf = ZipWriter(f)
+        # The mimetype must come first and be stored uncompressed
+        zf.write("mimetype", b"application/epub+zip", compress=False)
+        zf.write("META-INF/container.xml", CONTAINER_XML.encode('utf-8'))
+        zf.write("OEBPS/content.opf", render_content_opf(book, book_id))
+        zf.write("OEBPS/nav.xhtml", render_nav_xhtml(book))
+        zf.write("OEBPS/style.css", STYLE_CSS.encode('utf-8'))
+
+        for chapter in book.chapters:
+            name = f"OEBPS/chapters/{chapter.stem}.xhtml"
+            xhtml = render_chapter_xhtml(chapter)
+            digest = hashlib.sha256(xhtml).hexdigest().encode('ascii')
+
+            previous = reusable.get(name)
+            if previous and previous[0].comment == digest:
+                info, raw = previous
+                zf.write_raw(name, raw, info.compress_type, info.CRC, info.file_size, digest, info.date_time)
+                reused += 1
+                continue
+
+            log(f"  Adding {chapter.source_file} to EPUB...")
+            zf.write(name, xhtml, comment=digest)
+        zf.close()
+
+    log(f"✓ EPUB created: {epub_path}")
+    log(f"  Total chapters: {len(book.chapters)} ({reused} reused from previous build)")
+    return epub_path
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Default to outputs/rekindling directory, or use command line argument
+    if len(sys.argv) > 1:
+        input_dir = sys.argv[1]
+    else:
+        input_dir = "outputs/rekindling"
+
+    # Optional: custom EPUB filename
+    if len(sys.argv) > 2:
+        epub_filename = sys.argv[2]
+    else:
+        epub_filename = "compiled_chapters.epub"
+
+    create_epub_from_chapters(input_dir, epub_filename)
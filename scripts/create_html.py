@@ -6,38 +6,15 @@
 # As of 2025-12-26, it's good but doesn't work well with Safari reader mode. 
 ####### 
 
-from pathlib import Path
 import html
-import re
 
+from export_core import load_book, write_precompressed
+from progress import log
 
-def natural_sort_key(path):
-    """Extract numbers from filename for natural sorting"""
-    filename = path.name
-    # Extract all numbers from the filename
-    numbers = re.findall(r'\d+', filename)
-    if numbers:
-        return int(numbers[0])
-    return 0
 
+WRITE_BUFFER_SIZE = 1 << 16
 
-def create_html_from_chapters(input_dir, output_filename="compiled_chapters.html"):
-    """Create a single HTML file from all text files in input_dir"""
-    print(f"\n{'='*60}")
-    print(f"Creating HTML from chapters in {input_dir}")
-    print('='*60)
-    
-    input_path = Path(input_dir)
-    
-    # Get all text files sorted naturally (ch1, ch2, ..., ch10, ch11, ch12)
-    chapter_files = sorted(input_path.glob("*.txt"), key=natural_sort_key)
-    
-    if not chapter_files:
-        print("  ⚠️  No text files found in input directory")
-        return None
-    
-    # Start building HTML
-    html_content = """<!DOCTYPE html>
+HTML_HEAD = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -124,69 +101,67 @@ def create_html_from_chapters(input_dir, output_filename="compiled_chapters.html
         <h2>Table of Contents</h2>
         <ul>
 """
+
+
+def create_html_from_chapters(input_dir, output_filename="compiled_chapters.html", precompress=()):
+    """Create a single HTML file from all text files in input_dir"""
+    log(f"\n{'='*60}")
+    log(f"Creating HTML from chapters in {input_dir}")
+    log('='*60)
     
-    # Read all chapters and build content
-    chapters_data = []
-    for i, chapter_file in enumerate(chapter_files):
-        print(f"  Reading {chapter_file.name}...")
-        
-        with open(chapter_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        if not lines:
-            continue
-        
-        # First line is the title
-        title = lines[0].strip()
-        content = ''.join(lines[1:]).strip()
-        
-        chapter_id = f"chapter-{i+1}"
-        chapters_data.append({
-            'id': chapter_id,
-            'title': title,
-            'content': content,
-            'file': chapter_file.name
-        })
+    book = load_book(input_dir)
+    if book is None:
+        return None
     
-    # Build table of contents
-    for chapter in chapters_data:
-        html_content += f'            <li><a href="#{chapter["id"]}">{html.escape(chapter["title"])}</a></li>\n'
+    return render_html(book, output_filename, precompress)
+
+
+def render_html(book, output_filename="compiled_chapters.html", precompress=()):
+    """Render an already-parsed Book into a single HTML file next to its chapters
+
+    precompress lists encodings ("gzip", "br") to also write as static-hosting siblings
+    """
+    output_path = book.source_dir / output_filename
     
-    html_content += """        </ul>
+    # Stream the document chapter by chapter through a buffered writer, so
+    # memory use doesn't grow with the size of the book
+    with open(output_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        write = f.write
+        write(HTML_HEAD)
+        
+        # Table of contents
+        for chapter in book.chapters:
+            write(f'            <li><a href="#chapter-{chapter.index + 1}">{html.escape(chapter.title)}</a></li>\n')
+        
+        write("""        </ul>
     </div>
     
-"""
-    
-    # Build chapter content
-    for i, chapter in enumerate(chapters_data):
-        print(f"  Adding {chapter['file']} to HTML...")
-        
-        html_content += f'    <div class="chapter" id="{chapter["id"]}">\n'
-        html_content += f'        <h2 class="chapter-title">{html.escape(chapter["title"])}</h2>\n'
-        html_content += '        <div class="chapter-content">\n'
-        
-        # Split content into paragraphs
-        paragraphs = chapter['content'].split('\n\n')
-        for para in paragraphs:
-            if para.strip():
+""")
+        
+        # Chapter content
+        for chapter in book.chapters:
+            log(f"  Adding {chapter.source_file} to HTML...")
+            
+            write(f'    <div class="chapter" id="chapter-{chapter.index + 1}">\n')
+            write(f'        <h2 class="chapter-title">{html.escape(chapter.title)}</h2>\n')
+            write('        <div class="chapter-content">\n')
+            
+            for para in chapter.paragraphs:
                 # Escape HTML and convert line breaks within paragraphs
-                clean_para = html.escape(para.strip()).replace('\n', '<br>\n            ')
-                html_content += f'            <p>{clean_para}</p>\n'
+                clean_para = html.escape(para).replace('\n', '<br>\n            ')
+                write(f'            <p>{clean_para}</p>\n')
+            
+            write('        </div>\n')
+            write('    </div>\n\n')
         
-        html_content += '        </div>\n'
-        html_content += '    </div>\n\n'
-    
-    # Close HTML
-    html_content += """</body>
-</html>"""
+        write("""</body>
+</html>""")
     
-    # Write HTML file
-    output_path = input_path / output_filename
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    for compressed_path in write_precompressed(output_path, precompress):
+        log(f"  Precompressed: {compressed_path}")
     
-    print(f"\n✓ HTML created: {output_path}")
-    print(f"  Total chapters: {len(chapters_data)}")
+    log(f"\n✓ HTML created: {output_path}")
+    log(f"  Total chapters: {len(book.chapters)}")
     return output_path
 
 
@@ -205,7 +180,13 @@ if __name__ == "__main__":
     else:
         output_filename = "compiled_chapters.html"
     
-    result = create_html_from_chapters(input_dir, output_filename)
+    # Optional: comma-separated precompressed siblings to write (gzip, br)
+    if len(sys.argv) > 3:
+        precompress = sys.argv[3].split(',')
+    else:
+        precompress = ()
+    
+    result = create_html_from_chapters(input_dir, output_filename, precompress)
     
     if result:
-        print(f"\nOpen the file in Safari and use Reader Mode for the best experience!")
+        log(f"\nOpen the file in Safari and use Reader Mode for the best experience!")
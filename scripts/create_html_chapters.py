@@ -3,233 +3,294 @@
 # This script takes in a directory of text files representing chapters
 # and generates separate HTML pages for each, including navigation elements. 
 # 
+# The stylesheet and chapter list are written once as shared assets
+# (style.css, toc.json, nav.js) that every page links to, so browsers cache them.
+# 
 # As of 2025-12-26, it's the best for deploying on github pages.
 ####### 
 
 from pathlib import Path
+from string import Template
 import html
-import re
+import json
 
+from export_core import load_book
+from progress import log
+from search_index import write_search_index
 
-def natural_sort_key(path):
-    """Extract numbers from filename for natural sorting"""
-    filename = path.name
-    # Extract all numbers from the filename
-    numbers = re.findall(r'\d+', filename)
-    if numbers:
-        return int(numbers[0])
-    return 0
 
+STYLE_CSS = """body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
+    line-height: 1.6;
+    max-width: 800px;
+    margin: 0 auto;
+    padding: 20px;
+    color: #333;
+    background-color: #fff;
+}
 
-def create_chapter_html_files(input_dir, output_subdir=None):
-    """Create individual HTML files for each chapter with navigation"""
-    print(f"\n{'='*60}")
-    print(f"Creating HTML files from chapters in {input_dir}")
-    print('='*60)
-    
-    input_path = Path(input_dir)
-    
-    # Determine output directory: docs/{output_subdir or input_dir_name}/
-    if output_subdir is None:
-        output_subdir = input_path.name
-    
-    output_path = Path("docs") / output_subdir
-    output_path.mkdir(parents=True, exist_ok=True)
-    
-    # Get all text files sorted naturally (ch1, ch2, ..., ch10, ch11, ch12)
-    chapter_files = sorted(input_path.glob("*.txt"), key=natural_sort_key)
-    
-    if not chapter_files:
-        print("  ⚠️  No text files found in input directory")
-        return None
-    
-    # Read all chapters first to build the dropdown
-    chapters_data = []
-    for i, chapter_file in enumerate(chapter_files):
-        print(f"  Reading {chapter_file.name}...")
-        
-        with open(chapter_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        if not lines:
-            continue
-        
-        # First line is the title
-        title = lines[0].strip()
-        content = ''.join(lines[1:]).strip()
-        
-        # Generate HTML filename
-        html_filename = chapter_file.stem + ".html"
-        
-        chapters_data.append({
-            'index': i,
-            'title': title,
-            'content': content,
-            'source_file': chapter_file.name,
-            'html_file': html_filename
+.chapter-nav {
+    position: sticky;
+    top: 0;
+    background-color: #fff;
+    border-bottom: 2px solid #ddd;
+    padding: 15px 0;
+    margin-bottom: 30px;
+    z-index: 100;
+    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+}
+
+.nav-controls {
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    gap: 15px;
+    flex-wrap: wrap;
+}
+
+.nav-button {
+    padding: 10px 20px;
+    background-color: #0066cc;
+    color: white;
+    text-decoration: none;
+    border-radius: 4px;
+    border: none;
+    cursor: pointer;
+    font-size: 14px;
+    transition: background-color 0.2s;
+}
+
+.nav-button:hover {
+    background-color: #0052a3;
+}
+
+.nav-button:disabled {
+    background-color: #ccc;
+    cursor: not-allowed;
+}
+
+.chapter-select {
+    padding: 10px;
+    font-size: 14px;
+    border: 1px solid #ddd;
+    border-radius: 4px;
+    background-color: white;
+    cursor: pointer;
+    flex-grow: 1;
+    max-width: 400px;
+}
+
+.chapter-title {
+    font-size: 2em;
+    text-align: center;
+    margin: 40px 0 30px 0;
+    color: #1a1a1a;
+}
+
+.chapter-content p {
+    margin: 1.2em 0;
+    text-align: justify;
+}
+
+.search {
+    margin-top: 10px;
+}
+
+.chapter-search {
+    width: 100%;
+    box-sizing: border-box;
+    padding: 8px 10px;
+    font-size: 14px;
+    border: 1px solid #ddd;
+    border-radius: 4px;
+}
+
+.search-results {
+    list-style-type: none;
+    padding-left: 0;
+    margin: 0;
+    max-height: 40vh;
+    overflow-y: auto;
+}
+
+.search-results li {
+    margin: 6px 0;
+}
+
+.search-results a {
+    color: #0066cc;
+    text-decoration: none;
+}
+
+.chapter-content p:target {
+    background-color: #fff3b0;
+}
+
+@media (max-width: 600px) {
+    .nav-controls {
+        flex-direction: column;
+    }
+
+    .chapter-select {
+        width: 100%;
+        max-width: none;
+    }
+}
+
+@media print {
+    .chapter-nav {
+        display: none;
+    }
+}
+"""
+
+# Fills the chapter dropdown from toc.json and handles navigation. Static, so it
+# only changes when this script does, not when chapters are added.
+NAV_JS = """document.addEventListener('DOMContentLoaded', function () {
+    var select = document.querySelector('.chapter-select');
+    if (!select) return;
+
+    select.addEventListener('change', function () {
+        if (this.value) window.location.href = this.value;
+    });
+
+    fetch('toc.json')
+        .then(function (response) { return response.json(); })
+        .then(function (toc) {
+            var current = select.value;
+            select.innerHTML = '';
+            toc.forEach(function (chapter) {
+                var option = new Option(chapter.title, chapter.file);
+                option.selected = chapter.file === current;
+                select.appendChild(option);
+            });
         })
-    
-    # Generate HTML for each chapter
-    html_files_created = []
-    
-    for i, chapter in enumerate(chapters_data):
-        print(f"  Creating {chapter['html_file']}...")
-        
-        # Build HTML
-        html_content = f"""<!DOCTYPE html>
+        .catch(function () { /* keep the single-chapter fallback */ });
+});
+"""
+
+# Compiled once and reused for every page
+PAGE_TEMPLATE = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{html.escape(chapter['title'])}</title>
-    <style>
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-            line-height: 1.6;
-            max-width: 800px;
-            margin: 0 auto;
-            padding: 20px;
-            color: #333;
-            background-color: #fff;
-        }}
-        
-        .chapter-nav {{
-            position: sticky;
-            top: 0;
-            background-color: #fff;
-            border-bottom: 2px solid #ddd;
-            padding: 15px 0;
-            margin-bottom: 30px;
-            z-index: 100;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        }}
-        
-        .nav-controls {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            gap: 15px;
-            flex-wrap: wrap;
-        }}
-        
-        .nav-button {{
-            padding: 10px 20px;
-            background-color: #0066cc;
-            color: white;
-            text-decoration: none;
-            border-radius: 4px;
-            border: none;
-            cursor: pointer;
-            font-size: 14px;
-            transition: background-color 0.2s;
-        }}
-        
-        .nav-button:hover {{
-            background-color: #0052a3;
-        }}
-        
-        .nav-button:disabled {{
-            background-color: #ccc;
-            cursor: not-allowed;
-        }}
-        
-        .chapter-select {{
-            padding: 10px;
-            font-size: 14px;
-            border: 1px solid #ddd;
-            border-radius: 4px;
-            background-color: white;
-            cursor: pointer;
-            flex-grow: 1;
-            max-width: 400px;
-        }}
-        
-        .chapter-title {{
-            font-size: 2em;
-            text-align: center;
-            margin: 40px 0 30px 0;
-            color: #1a1a1a;
-        }}
-        
-        .chapter-content p {{
-            margin: 1.2em 0;
-            text-align: justify;
-        }}
-        
-        @media (max-width: 600px) {{
-            .nav-controls {{
-                flex-direction: column;
-            }}
-            
-            .chapter-select {{
-                width: 100%;
-                max-width: none;
-            }}
-        }}
-        
-        @media print {{
-            .chapter-nav {{
-                display: none;
-            }}
-        }}
-    </style>
+    <title>$title</title>
+    <link rel="stylesheet" href="style.css">
+    <script src="nav.js" defer></script>
+    <script src="search.js" defer></script>
 </head>
 <body>
     <nav class="chapter-nav">
         <div class="nav-controls">
-"""
-        
-        # Previous button
-        if i > 0:
-            prev_chapter = chapters_data[i-1]
-            html_content += f'            <a href="{prev_chapter["html_file"]}" class="nav-button">← Previous</a>\n'
-        else:
-            html_content += '            <button class="nav-button" disabled>← Previous</button>\n'
-        
-        # Dropdown
-        html_content += '            <select class="chapter-select" onchange="if(this.value) window.location.href=this.value">\n'
-        for idx, ch in enumerate(chapters_data):
-            selected = ' selected' if idx == i else ''
-            html_content += f'                <option value="{ch["html_file"]}"{selected}>{html.escape(ch["title"])}</option>\n'
-        html_content += '            </select>\n'
-        
-        # Next button
-        if i < len(chapters_data) - 1:
-            next_chapter = chapters_data[i+1]
-            html_content += f'            <a href="{next_chapter["html_file"]}" class="nav-button">Next →</a>\n'
-        else:
-            html_content += '            <button class="nav-button" disabled>Next →</button>\n'
-        
-        html_content += """        </div>
+            $prev_link
+            <select class="chapter-select" aria-label="Chapter">
+                <option value="$html_file" selected>$title</option>
+            </select>
+            $next_link
+        </div>
+        <div class="search">
+            <input type="search" class="chapter-search" placeholder="Search the book..." aria-label="Search">
+            <ul class="search-results"></ul>
+        </div>
     </nav>
     
-"""
-        
-        # Chapter content
-        html_content += f'    <h1 class="chapter-title">{html.escape(chapter["title"])}</h1>\n'
-        html_content += '    <div class="chapter-content">\n'
-        
-        # Split content into paragraphs
-        paragraphs = chapter['content'].split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                # Escape HTML and convert line breaks within paragraphs
-                clean_para = html.escape(para.strip()).replace('\n', '<br>\n        ')
-                html_content += f'        <p>{clean_para}</p>\n'
-        
-        html_content += """    </div>
+    <h1 class="chapter-title">$title</h1>
+    <div class="chapter-content">
+$paragraphs
+    </div>
 </body>
-</html>"""
+</html>""")
+
+PREV_DISABLED = '<button class="nav-button" disabled>← Previous</button>'
+NEXT_DISABLED = '<button class="nav-button" disabled>Next →</button>'
+LINE_BREAK = '<br>\n        '
+
+
+def create_chapter_html_files(input_dir, output_subdir=None):
+    """Create individual HTML files for each chapter with navigation"""
+    log(f"\n{'='*60}")
+    log(f"Creating HTML files from chapters in {input_dir}")
+    log('='*60)
+    
+    book = load_book(input_dir)
+    if book is None:
+        return None
+    
+    return render_chapter_html_files(book, output_subdir)
+
+
+def render_chapter_page(chapter, prev_chapter, next_chapter):
+    """Fill the page template for one chapter"""
+    if prev_chapter is not None:
+        prev_link = f'<a href="{prev_chapter.stem}.html" class="nav-button">← Previous</a>'
+    else:
+        prev_link = PREV_DISABLED
+    
+    if next_chapter is not None:
+        next_link = f'<a href="{next_chapter.stem}.html" class="nav-button">Next →</a>'
+    else:
+        next_link = NEXT_DISABLED
+    
+    # Escape HTML and convert line breaks within paragraphs
+    # Paragraph ids are the anchors search results link to
+    paragraphs = '\n'.join(
+        f'        <p id="p{n}">' + html.escape(para).replace('\n', LINE_BREAK) + '</p>'
+        for n, para in enumerate(chapter.paragraphs)
+    )
+    
+    return PAGE_TEMPLATE.substitute(
+        title=html.escape(chapter.title),
+        html_file=f"{chapter.stem}.html",
+        prev_link=prev_link,
+        next_link=next_link,
+        paragraphs=paragraphs,
+    )
+
+
+def write_shared_assets(chapters, output_path):
+    """Write style.css, toc.json and nav.js once for all pages"""
+    toc = [{'file': f"{ch.stem}.html", 'title': ch.title} for ch in chapters]
+    
+    (output_path / "style.css").write_text(STYLE_CSS, encoding='utf-8')
+    (output_path / "nav.js").write_text(NAV_JS, encoding='utf-8')
+    with open(output_path / "toc.json", 'w', encoding='utf-8') as f:
+        json.dump(toc, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def render_chapter_html_files(book, output_subdir=None):
+    """Render an already-parsed Book into one HTML page per chapter under docs/"""
+    # Determine output directory: docs/{output_subdir or input_dir_name}/
+    if output_subdir is None:
+        output_subdir = book.name
+    
+    chapters = book.chapters
+    if not chapters:
+        log("  ⚠️  Every chapter file is empty, no HTML files to create")
+        return []
+    
+    output_path = Path("docs") / output_subdir
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    write_shared_assets(chapters, output_path)
+    shard_count = write_search_index(chapters, output_path)
+    
+    def write_page(i):
+        chapter = chapters[i]
+        prev_chapter = chapters[i-1] if i > 0 else None
+        next_chapter = chapters[i+1] if i < len(chapters) - 1 else None
         
-        # Write HTML file
-        output_file = output_path / chapter['html_file']
+        output_file = output_path / f"{chapter.stem}.html"
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        html_files_created.append(output_file)
+            f.write(render_chapter_page(chapter, prev_chapter, next_chapter))
+        return output_file
+    
+    # Rendering is pure-Python string work: threads would only contend for the GIL
+    html_files_created = [write_page(i) for i in range(len(chapters))]
     
-    print(f"\n✓ Created {len(html_files_created)} HTML files in {output_path}")
-    print(f"  Open {chapters_data[0]['html_file']} to start reading")
+    log(f"\n✓ Created {len(html_files_created)} HTML files in {output_path}")
+    log(f"  Shared assets: style.css, toc.json, nav.js, search.js ({shard_count} index shards)")
+    log(f"  Open {chapters[0].stem}.html to start reading")
     return html_files_created
 
 
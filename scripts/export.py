@@ -0,0 +1,99 @@
+#######
+# Export script
+# This script reads a directory of chapter text files once and hands the parsed
+# book to every requested exporter (PDF, single HTML, per-chapter HTML, EPUB) in parallel.
+#
+# USAGE:
+#   From the project root directory:
+#     python scripts/export.py [input_directory] [format ...] [--progress json]
+#
+#   Examples:
+#     python scripts/export.py                          # All formats for outputs/rekindling
+#     python scripts/export.py outputs/adamo            # All formats for adamo
+#     python scripts/export.py outputs/adamo html pdf   # Only the single-file exports
+#
+#   --progress json prints one JSON event per line instead of the log (see src/progress.py)
+#   Set TRACE_FILE to also record a timing trace (see src/tracing.py)
+#######
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import importlib
+import sys
+
+# The renderers are sibling scripts, progress and tracing live in src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from export_core import load_book
+from progress import MODES as PROGRESS_MODES, log, progress
+from tracing import span
+
+
+# Format name -> (module, render function). Each render function takes the parsed
+# Book as its only required argument. Modules are imported lazily so a missing
+# optional dependency (e.g. reportlab) only affects its own format.
+RENDERERS = {
+    "pdf": ("create_pdf", "render_pdf"),
+    "html": ("create_html", "render_html"),
+    "chapters": ("create_html_chapters", "render_chapter_html_files"),
+    "epub": ("create_epub", "render_epub"),
+}
+
+
+def render(name, book):
+    """Import the renderer for one format and run it on the parsed book"""
+    module_name, function_name = RENDERERS[name]
+    progress.item_start(name)
+    try:
+        with span(f"export.{name}", chapters=len(book.chapters)):
+            renderer = getattr(importlib.import_module(module_name), function_name)
+            return renderer(book)
+    finally:
+        # A failed format still counts as done, so the progress total is reached
+        progress.item_done(name)
+
+
+def export(input_dir, formats=None):
+    """Parse input_dir once and run every requested renderer concurrently"""
+    formats = list(formats or RENDERERS)
+    unknown = [f for f in formats if f not in RENDERERS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(unknown)} (choose from {', '.join(RENDERERS)})")
+
+    log(f"\n{'='*60}")
+    log(f"Exporting {input_dir} as {', '.join(formats)}")
+    log('='*60)
+
+    with span("export.load", input_dir=str(input_dir)):
+        book = load_book(input_dir)
+    if book is None:
+        return None
+
+    results = {}
+    progress.start(len(formats), "formats", str(input_dir))
+    with ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        futures = {name: pool.submit(render, name, book) for name in formats}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                log(f"  ⚠️  {name} export failed: {e}")
+                results[name] = None
+
+    progress.finish()
+    log(f"\n✓ Exported {len(book.chapters)} chapters: "
+          f"{', '.join(name for name, result in results.items() if result)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a directory of chapters to every requested format")
+    parser.add_argument("input_dir", nargs="?", default="outputs/rekindling", help="Directory of chapter .txt files")
+    parser.add_argument("formats", nargs="*", help=f"Formats to export (default: all of {', '.join(RENDERERS)})")
+    parser.add_argument("--progress", choices=PROGRESS_MODES, default="auto",
+                        help="json: one JSON event per line on stdout (see src/progress.py)")
+    args = parser.parse_args()
+    progress.set_mode(args.progress)
+
+    export(args.input_dir, args.formats or None)
@@ -0,0 +1,133 @@
+#######
+# Shared export core
+# Reads a directory of chapter text files once into a small document model
+# (a title and a list of paragraphs per chapter) that every exporter renders from.
+#
+# The create_* scripts use this instead of each parsing the corpus on their own.
+#######
+
+from dataclasses import dataclass
+from pathlib import Path
+import gzip
+import shutil
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from chapter_index import ChapterIndex
+from mapped_text import MappedText
+from progress import log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COPY_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(frozen=True, slots=True)
+class Chapter:
+    """One chapter: first line of the file is the title, blank lines separate paragraphs"""
+    index: int
+    stem: str
+    source_file: str
+    sha256: str
+    title: str
+    paragraphs: tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class Book:
+    """All chapters of one input directory, in reading order"""
+    name: str
+    source_dir: Path
+    chapters: tuple[Chapter, ...]
+
+
+def read_chapter(path):
+    """Split a chapter file into (title, paragraphs), or None for an empty file
+
+    The file is memory-mapped and decoded one paragraph at a time, so the
+    whole chapter never exists as one str next to its split copy.
+    """
+    with MappedText(path) as mapped:
+        if not mapped.size:
+            return None
+
+        title_end = mapped.find(b'\n')
+        if title_end == -1:
+            return mapped.decode().strip(), ()
+
+        paragraphs = tuple(p for p in (para.strip() for para in mapped.paragraphs(title_end + 1)) if p)
+        return mapped.decode(0, title_end).strip(), paragraphs
+
+
+def load_book(input_dir):
+    """Read every chapter in input_dir once and return a Book, or None if there are none"""
+    input_path = Path(input_dir)
+
+    # Shared chapter index: natural order (ch1, ch1_part2, ch2, ..., ch10), nested dirs included
+    chapter_index = ChapterIndex.load(input_path)
+
+    if not chapter_index:
+        log("  ⚠️  No text files found in input directory")
+        return None
+
+    chapters = []
+    for i, entry in enumerate(chapter_index):
+        log(f"  Reading {entry.relpath}...")
+
+        parsed = read_chapter(chapter_index.path(entry))
+
+        if parsed is None:
+            continue
+
+        title, paragraphs = parsed
+        chapters.append(Chapter(
+            index=i,
+            stem=entry.slug,
+            source_file=entry.relpath,
+            sha256=entry.sha256,
+            title=title,
+            paragraphs=paragraphs,
+        ))
+
+    return Book(name=input_path.name, source_dir=input_path, chapters=tuple(chapters))
+
+
+def escape_reportlab(text):
+    """Escape the characters reportlab's Paragraph markup treats specially"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def write_precompressed(path, encodings):
+    """Write gzip (.gz) and/or brotli (.br) siblings of path for static hosting
+
+    Compression streams the file in fixed-size chunks, so memory stays flat.
+    Returns the paths written.
+    """
+    path = Path(path)
+    written = []
+
+    for encoding in encodings:
+        if encoding == "gzip":
+            target = path.with_name(path.name + ".gz")
+            # mtime=0 keeps the output byte-identical across rebuilds of the same content
+            with open(path, 'rb') as src, open(target, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        elif encoding in ("br", "brotli"):
+            if brotli is None:
+                raise RuntimeError("brotli precompression needs the 'brotli' package (pip install brotli)")
+            target = path.with_name(path.name + ".br")
+            compressor = brotli.Compressor(quality=11)
+            with open(path, 'rb') as src, open(target, 'wb') as dst:
+                while chunk := src.read(COPY_CHUNK_SIZE):
+                    dst.write(compressor.process(chunk))
+                dst.write(compressor.finish())
+        else:
+            raise ValueError(f"Unknown precompression encoding: {encoding} (use gzip or br)")
+        written.append(target)
+
+    return written
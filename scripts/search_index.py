@@ -0,0 +1,198 @@
+#######
+# Client-side search index
+# Builds a prebuilt inverted index over a parsed book at export time, sharded by
+# term prefix, plus a small loader (search.js) that only fetches the shards a
+# query needs. Used by create_html_chapters.py for the github pages site.
+#
+# Layout under docs/<book>/search/:
+#   manifest.json   {"v": 1, "prefix": 2, "shards": ["ab", "ac", ...]}
+#   <prefix>.json   {"term": [[chapter, paragraph, pos, pos, ...], ...], ...}
+# Chapter numbers index into toc.json; positions are word offsets in the paragraph.
+#######
+
+from collections import defaultdict
+import json
+import re
+
+
+INDEX_VERSION = 1
+PREFIX_LENGTH = 2
+
+_WORD_RE = re.compile(r'\w+')
+
+# Too common to be useful on their own, and they'd make the largest shards
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her him his i if in into is it its
+me my not of on or our she so that the their them then there they this to was we were
+what when which who will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens, the same way search.js splits a query"""
+    return _WORD_RE.findall(text.lower())
+
+
+def shard_name(term):
+    """File-safe name of the shard a term lives in"""
+    prefix = term[:PREFIX_LENGTH]
+    return ''.join(c if c.isascii() and c.isalnum() else f"_{ord(c):x}" for c in prefix)
+
+
+def build_search_index(chapters):
+    """Map each shard name to {term: [[chapter, paragraph, positions...], ...]}"""
+    postings = defaultdict(list)
+
+    for c, chapter in enumerate(chapters):
+        # The title is paragraph -1 so headings are searchable too
+        for p, para in enumerate((chapter.title, *chapter.paragraphs), -1):
+            positions = defaultdict(list)
+            for pos, word in enumerate(tokenize(para)):
+                if word not in STOPWORDS:
+                    positions[word].append(pos)
+            for word, word_positions in positions.items():
+                postings[word].append([c, p, *word_positions])
+
+    shards = defaultdict(dict)
+    for term in sorted(postings):
+        shards[shard_name(term)][term] = postings[term]
+    return shards
+
+
+def write_search_index(chapters, output_path):
+    """Write search/manifest.json, the shards and search.js; returns the shard count"""
+    search_path = output_path / "search"
+    search_path.mkdir(parents=True, exist_ok=True)
+
+    shards = build_search_index(chapters)
+
+    # Drop shards left over from a previous build with different terms
+    for stale in search_path.glob("*.json"):
+        if stale.stem != "manifest" and stale.stem not in shards:
+            stale.unlink()
+
+    for name, terms in shards.items():
+        with open(search_path / f"{name}.json", 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(',', ':'))
+
+    with open(search_path / "manifest.json", 'w', encoding='utf-8') as f:
+        json.dump({'v': INDEX_VERSION, 'prefix': PREFIX_LENGTH, 'shards': sorted(shards)},
+                  f, separators=(',', ':'))
+
+    (output_path / "search.js").write_text(SEARCH_JS, encoding='utf-8')
+    return len(shards)
+
+
+# Loader: splits the query like tokenize(), fetches only the shards for its
+# terms, intersects the postings per paragraph and ranks exact phrases first
+# (terms at the same word distances as in the query, stopwords counted).
+SEARCH_JS = """(function () {
+    var STOPWORDS = new Set(%(stopwords)s);
+    var manifest = null;
+    var toc = null;
+    var shardCache = {};
+
+    function shardName(term) {
+        return Array.from(term).slice(0, manifest.prefix).map(function (c) {
+            return /^[a-z0-9]$/.test(c) ? c : '_' + c.codePointAt(0).toString(16);
+        }).join('');
+    }
+
+    function loadJSON(url) {
+        return fetch(url).then(function (response) {
+            if (!response.ok) throw new Error(url);
+            return response.json();
+        });
+    }
+
+    function loadShard(name) {
+        if (!shardCache[name]) {
+            shardCache[name] = manifest.shards.indexOf(name) === -1
+                ? Promise.resolve({})
+                : loadJSON('search/' + name + '.json');
+        }
+        return shardCache[name];
+    }
+
+    function ready() {
+        if (manifest) return Promise.resolve();
+        return Promise.all([loadJSON('search/manifest.json'), loadJSON('toc.json')])
+            .then(function (results) { manifest = results[0]; toc = results[1]; });
+    }
+
+    function search(query) {
+        // Keep each term's word offset in the query, stopwords included, to
+        // match the indexed positions (tokenize() counts stopwords too)
+        var terms = [];
+        var offsets = [];
+        (query.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || []).forEach(function (word, pos) {
+            if (!STOPWORDS.has(word)) {
+                terms.push(word);
+                offsets.push(pos);
+            }
+        });
+        if (!terms.length) return Promise.resolve([]);
+
+        return ready().then(function () {
+            return Promise.all(terms.map(function (t) { return loadShard(shardName(t)); }));
+        }).then(function (shards) {
+            // paragraph key -> positions of each query term
+            var hits = null;
+            terms.forEach(function (term, i) {
+                var found = {};
+                (shards[i][term] || []).forEach(function (posting) {
+                    var key = posting[0] + ':' + posting[1];
+                    if (hits === null || key in hits) {
+                        found[key] = (hits ? hits[key] : []).concat([posting.slice(2)]);
+                    }
+                });
+                hits = found;
+            });
+
+            return Object.keys(hits).map(function (key) {
+                var lists = hits[key];
+                var parts = key.split(':');
+                var phrase = lists[0].some(function (start) {
+                    return lists.every(function (positions, i) {
+                        return positions.indexOf(start + offsets[i] - offsets[0]) !== -1;
+                    });
+                });
+                var count = lists.reduce(function (n, positions) { return n + positions.length; }, 0);
+                return { chapter: +parts[0], paragraph: +parts[1], score: (phrase ? 1000 : 0) + count };
+            }).sort(function (a, b) {
+                return b.score - a.score || a.chapter - b.chapter || a.paragraph - b.paragraph;
+            });
+        });
+    }
+
+    function render(results, list) {
+        list.innerHTML = '';
+        results.slice(0, 50).forEach(function (r) {
+            var chapter = toc[r.chapter];
+            var link = document.createElement('a');
+            link.href = chapter.file + (r.paragraph >= 0 ? '#p' + r.paragraph : '');
+            link.textContent = chapter.title + (r.paragraph >= 0 ? ' \\u2014 paragraph ' + (r.paragraph + 1) : '');
+            var item = document.createElement('li');
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+        if (!results.length) list.innerHTML = '<li>No matches</li>';
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var input = document.querySelector('.chapter-search');
+        var list = document.querySelector('.search-results');
+        if (!input || !list) return;
+
+        var pending = 0;
+        input.addEventListener('input', function () {
+            var query = input.value;
+            var ticket = ++pending;
+            if (!query.trim()) { list.innerHTML = ''; return; }
+            search(query).then(function (results) {
+                if (ticket === pending) render(results, list);
+            });
+        });
+    });
+})();
+""" % {'stopwords': json.dumps(sorted(STOPWORDS))}
@@ -0,0 +1,109 @@
+#######
+# Model backends and per-stage routing
+# A backend is an OpenAI-compatible endpoint plus what it can do; a route
+# sends one pipeline stage (identify, translate, ...) to a backend and model.
+# src/llm.py resolves every create_response() call through route_for().
+#
+# Backends without the Responses API (most local servers: llama.cpp,
+# vLLM, Ollama, LM Studio) are called through chat.completions instead.
+# A request estimated to exceed a backend's max_context goes to the
+# stage's default route.
+#
+# USAGE:
+#   Point LLM_ROUTING (environment or .env) at a JSON file that adds
+#   backends and overrides routes, e.g. to run the cheap v1 stages locally:
+#     {"backends": {"local": {"base_url": "http://127.0.0.1:8080/v1",
+#                             "responses_api": false, "max_context": 8192}},
+#      "routes": {"identify": {"backend": "local", "model": "qwen2.5-7b-instruct"},
+#                 "vote": {"backend": "local", "model": "qwen2.5-7b-instruct"}}}
+#######
+
+from dataclasses import dataclass, replace
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True, slots=True)
+class Backend:
+    """An OpenAI-compatible endpoint and its capabilities"""
+    name: str
+    base_url: str | None = None       # None: the OpenAI default (or OPENAI_BASE_URL)
+    api_key_env: str = "OPENAI_API_KEY"
+    max_context: int = 1_000_000      # tokens
+    responses_api: bool = True
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    backend: str
+    model: str
+
+
+DEFAULT_BACKENDS = {
+    "openai": Backend("openai"),
+}
+
+# Stage name (as passed to create_response) -> where it runs by default
+DEFAULT_ROUTES = {
+    # regender_v1
+    "identify": Route("openai", "gpt-4.1-mini"),
+    "disambiguate": Route("openai", "gpt-4.1-mini"),
+    "vote": Route("openai", "gpt-4.1-mini"),
+    "tiebreak": Route("openai", "gpt-4.1"),
+    "edits": Route("openai", "gpt-4.1-mini"),
+    # regender_v2
+    "translate": Route("openai", "gpt-4.1"),
+    "retry": Route("openai", "gpt-4.1"),
+    "context": Route("openai", "gpt-4.1-mini"),
+    # both (see src/character_registry.py)
+    "registry": Route("openai", "gpt-4.1-mini"),
+}
+
+
+def load_routing(path=None):
+    """(backends, routes): the defaults merged with the LLM_ROUTING file, if any"""
+    backends = dict(DEFAULT_BACKENDS)
+    routes = dict(DEFAULT_ROUTES)
+
+    path = path or os.getenv("LLM_ROUTING")
+    if not path:
+        return backends, routes
+
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    for name, fields in config.get('backends', {}).items():
+        base = backends.get(name, Backend(name))
+        backends[name] = replace(base, **fields)
+    for stage, fields in config.get('routes', {}).items():
+        current = routes.get(stage)
+        route = Route(backend=fields.get('backend', current.backend if current else "openai"),
+                      model=fields.get('model', current.model if current else None))
+        if route.model is None:
+            raise ValueError(f"Route for '{stage}' needs a model")
+        if route.backend not in backends:
+            raise ValueError(f"Route for '{stage}' uses unknown backend '{route.backend}'")
+        routes[stage] = route
+
+    return backends, routes
+
+
+BACKENDS, ROUTES = load_routing()
+
+
+def route_for(stage, estimated_tokens=0):
+    """(Backend, model) for a stage; requests too large for the routed backend use the default route"""
+    base_stage = stage.split('.', 1)[0]
+    route = ROUTES.get(base_stage) or ROUTES.get(stage)
+    if route is None:
+        raise KeyError(f"No route for stage '{stage}' (add it to backends.DEFAULT_ROUTES or LLM_ROUTING)")
+
+    backend = BACKENDS[route.backend]
+    if estimated_tokens > backend.max_context and base_stage in DEFAULT_ROUTES:
+        route = DEFAULT_ROUTES[base_stage]
+        backend = BACKENDS[route.backend]
+    return backend, route.model
@@ -0,0 +1,90 @@
+#######
+# Record/replay of model calls
+# In record mode every request src/llm.py sends, with its answer, usage and
+# timing, is appended to a cassette: gzip-compressed JSON lines, one per
+# call. In replay mode the same requests are answered from the cassette
+# without touching the network, optionally taking as long as they did when
+# recorded, so chunking, stitching, verification and export changes can be
+# compared run to run on any machine, for free.
+#
+# Requests are matched on their content (model, input, temperature, ...).
+# Identical requests (e.g. votes) get their recorded answers in order; once
+# those run out the last one is repeated. A request that was never recorded
+# is an error.
+#
+# USAGE:
+#   From the project root directory:
+#     LLM_CASSETTE=outputs/adamo.cassette.jsonl.gz LLM_CASSETTE_MODE=record python src/regender_v2.py inputs/adamo
+#     LLM_CASSETTE=outputs/adamo.cassette.jsonl.gz LLM_CASSETTE_MODE=replay python src/regender_v2.py inputs/adamo
+#
+#   LLM_REPLAY_TIMING=1 replays with the recorded latencies (0.5: twice as
+#   fast); by default answers come back immediately.
+#######
+
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import threading
+
+
+MODES = ('record', 'replay')
+
+
+def request_key(kwargs):
+    """Stable hash of a request's arguments"""
+    canonical = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Recorded model calls, keyed by request"""
+
+    def __init__(self, path, mode, timing=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {', '.join(MODES)} (got {mode!r})")
+        self.path = Path(path)
+        self.mode = mode
+        self.timing = timing
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> recorded answers, in order
+        self._file = None
+
+        if mode == 'replay':
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['key'], []).append(entry)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def record(self, stage, kwargs, answer):
+        """Append one call; answer holds output_text, status, tokens and timing"""
+        entry = {'key': request_key(kwargs), 'stage': stage, 'request': kwargs, **answer}
+        line = json.dumps(entry, ensure_ascii=False, default=str, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self.calls += 1
+
+    def replay(self, stage, kwargs):
+        """The recorded answer for a request"""
+        key = request_key(kwargs)
+        with self._lock:
+            answers = self._entries.get(key)
+            if not answers:
+                raise KeyError(f"No recorded answer for this '{stage}' request in {self.path} "
+                               f"(the prompt, input or route changed since it was recorded)")
+            self.calls += 1
+            return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,124 @@
+#######
+# Chapter index
+# Discovers the chapter files of a book once, in a stable natural order
+# (ch1, ch1_part2, ch2, ..., ch10, including nested part/volume directories),
+# and caches each file's size, mtime and content hash next to the chapters.
+#
+# Every stage (regendering, verification, export) uses this, so they all agree
+# on chapter order; an unchanged file's hash comes from the cache after a stat()
+# call instead of rereading it.
+#######
+
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import json
+import re
+
+from mapped_text import MappedText
+
+
+CACHE_FILENAME = ".chapter_index.json"
+
+_NUMBER_RE = re.compile(r'(\d+)')
+
+
+def natural_sort_key(path):
+    """Multi-key natural sort over every part of a (relative) path
+
+    Text and numbers alternate in the key, so "ch1" < "ch1_part2" < "ch2" < "ch10",
+    and "part2/ch1" sorts after every chapter in "part1/".
+    """
+    path = Path(path)
+    parts = [*path.parent.parts, path.stem]
+    key = []
+    for part in parts:
+        pieces = _NUMBER_RE.split(part.lower())
+        # re.split with a capture group yields text at even and numbers at odd
+        # positions, so every key compares str to str and int to int
+        key.append(tuple(int(p) if i % 2 else p for i, p in enumerate(pieces)))
+    return tuple(key)
+
+
+def file_sha256(path):
+    """Hash a file straight from a read-only memory map"""
+    with MappedText(path) as mapped:
+        return mapped.sha256()
+
+
+@dataclass(frozen=True, slots=True)
+class ChapterEntry:
+    """One chapter file and its cached metadata"""
+    relpath: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+    @property
+    def slug(self):
+        """Flat, filesystem-safe name: "ch3" or "part2-ch3" for nested books"""
+        return Path(self.relpath).with_suffix('').as_posix().replace('/', '-')
+
+
+class ChapterIndex:
+    """Ordered chapter files of one book directory, with cached metadata"""
+
+    def __init__(self, root, entries):
+        self.root = Path(root)
+        self.entries = entries
+
+    @classmethod
+    def load(cls, root, pattern="*.txt"):
+        """Discover chapters under root, reusing cached hashes for unchanged files"""
+        root = Path(root)
+        cache = _read_cache(root)
+
+        entries = []
+        paths = [p for p in root.rglob(pattern)
+                 if p.is_file() and not any(part.startswith('.') for part in p.relative_to(root).parts)]
+        for path in sorted(paths, key=lambda p: (natural_sort_key(p.relative_to(root)), p.as_posix())):
+            relpath = path.relative_to(root).as_posix()
+            stat = path.stat()
+            cached = cache.get(relpath)
+
+            if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+                sha256 = cached['sha256']
+            else:
+                sha256 = file_sha256(path)
+
+            entries.append(ChapterEntry(relpath, stat.st_size, stat.st_mtime_ns, sha256))
+
+        index = cls(root, entries)
+        if {e.relpath: asdict(e) for e in entries} != cache:
+            index.save()
+        return index
+
+    def save(self):
+        """Persist the metadata cache next to the chapters"""
+        data = {e.relpath: asdict(e) for e in self.entries}
+        try:
+            with open(self.root / CACHE_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except OSError:
+            # Read-only inputs are fine, we just rehash next time
+            pass
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        return self.entries[i]
+
+    def path(self, entry):
+        """Absolute path of an entry's file"""
+        return self.root / entry.relpath
+
+
+def _read_cache(root):
+    try:
+        with open(root / CACHE_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
@@ -0,0 +1,163 @@
+#######
+# Per-book character registry
+# One cheap pass over a sample of every chapter lists the book's characters:
+# names, aliases, titles, gender and who they usually share scenes with. The
+# registry is cached in outputs/<book>.characters.json (next to
+# outputs/<book>/) and rebuilt only when the chapters change.
+#
+# Both pipelines put its compact form (registry_block) in their requests, so
+# the model knows from the first call who "the Commander" is and which other
+# men are around; most pronouns are settled at identification and v1's
+# disambiguation round-trip is needed far less often.
+#######
+
+from pathlib import Path
+import hashlib
+import json
+
+from llm import create_response
+from progress import log
+from tracing import span
+
+
+REGISTRY_VERSION = 1
+
+# Characters of the book sampled for the registry pass, spread over all chapters
+SAMPLE_CHARS = 120_000
+MIN_CHAPTER_SAMPLE = 2000
+
+REGISTRY_PROMPT = """List the recurring characters of this book from the excerpts below (the start of every chapter).
+
+For each character give:
+- "name": their full name
+- "gender": "male", "female" or "unknown", as the text currently presents them
+- "aliases": other names, nicknames and how they are addressed (e.g. "Shepard", "Commander")
+- "titles": ranks, roles or descriptions used instead of their name (e.g. "the Spectre", "the turian")
+- "partners": names of the characters they most often share scenes with
+
+Return ONLY a JSON array:
+[{"name": "", "gender": "", "aliases": [], "titles": [], "partners": []}]"""
+
+
+def registry_path(book):
+    return Path("outputs") / f"{book}.characters.json"
+
+
+def book_fingerprint(chapter_index):
+    """Changes whenever a chapter is added, removed or edited"""
+    digest = hashlib.sha256()
+    for entry in chapter_index:
+        digest.update(f"{entry.relpath}\0{entry.sha256}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def sample_book(chapter_index):
+    """The start of every chapter, cut at a paragraph boundary, within SAMPLE_CHARS"""
+    share = max(MIN_CHAPTER_SAMPLE, SAMPLE_CHARS // max(len(chapter_index), 1))
+    excerpts = []
+    for entry in chapter_index:
+        with open(chapter_index.path(entry), 'r', encoding='utf-8') as f:
+            text = f.read(share + 1)
+        if len(text) > share:
+            text = text[:share].rsplit('\n\n', 1)[0]
+        excerpts.append(f"[{entry.relpath}]\n{text}")
+    return '\n\n'.join(excerpts)
+
+
+def _strings(value):
+    return [str(v) for v in value] if isinstance(value, list) else []
+
+
+def parse_registry(output_text):
+    """Characters from the model's answer; malformed entries are dropped"""
+    output = output_text.strip()
+    if output.startswith("```"):
+        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
+
+    characters = []
+    for item in json.loads(output):
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name'].strip():
+            continue
+        characters.append({
+            'name': item['name'].strip(),
+            'gender': item.get('gender') if item.get('gender') in ('male', 'female') else 'unknown',
+            'aliases': _strings(item.get('aliases')),
+            'titles': _strings(item.get('titles')),
+            'partners': _strings(item.get('partners')),
+        })
+    return characters
+
+
+def build_registry(chapter_index):
+    """One "registry" call over a sample of the book"""
+    sample = sample_book(chapter_index)
+    log(f"  Building character registry from {len(chapter_index)} chapters ({len(sample)} chars)...")
+
+    with span("registry", chapters=len(chapter_index), chars=len(sample)):
+        response = create_response(
+            "registry",
+            input=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a careful reader cataloguing the characters of a story.\n"
+                        "Return ONLY valid JSON.\n"
+                        "Do not include markdown, code fences, or explanations."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": f"{REGISTRY_PROMPT}\n\nExcerpts:\n{sample}"
+                }
+            ],
+            temperature=0
+        )
+    return parse_registry(response.output_text)
+
+
+def load_registry(book, chapter_index, refresh=False):
+    """The book's characters, from the cache unless the chapters changed (or refresh)
+
+    If the registry can't be built, returns an empty list: the pipelines work
+    without it, just with more disambiguation.
+    """
+    path = registry_path(book)
+    fingerprint = book_fingerprint(chapter_index)
+
+    if not refresh:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == REGISTRY_VERSION and cached.get('fingerprint') == fingerprint:
+                log(f"Character registry: {len(cached['characters'])} characters ({path})")
+                return cached['characters']
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    try:
+        characters = build_registry(chapter_index)
+    except (json.JSONDecodeError, TypeError) as e:
+        log(f"  ⚠️  Character registry answer wasn't usable ({e}), continuing without it")
+        return []
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'version': REGISTRY_VERSION, 'book': book, 'fingerprint': fingerprint,
+                   'characters': characters}, f, indent=2, ensure_ascii=False)
+    log(f"✓ Character registry: {len(characters)} characters -> {path}")
+    return characters
+
+
+def registry_block(characters):
+    """Compact form for prompts: one line per character ('' without a registry)"""
+    if not characters:
+        return ''
+    lines = []
+    for c in characters:
+        also = ', '.join(dict.fromkeys(c['aliases'] + c['titles']))
+        line = f"{c['name']} | {c['gender']} | {also or '-'}"
+        if c['partners']:
+            line += f" | with {', '.join(c['partners'])}"
+        lines.append(line)
+    return ("Characters of this book (name | gender | also called | usually with). "
+            "Use them to decide who each pronoun and title refers to:\n" + '\n'.join(lines))
@@ -0,0 +1,116 @@
+#######
+# Coreference index
+# Persists, per chapter, every resolved Shepard mention and generated edit with
+# exact character offsets, keyed by the sha256 of the paragraph it sits in
+# together with the sha256 of its neighbours: "He nodded." after a Shepard
+# paragraph and "He nodded." after a Garrus paragraph are different entries.
+#
+# regender_v1.py consults it before calling the API: paragraphs whose key is
+# already indexed reuse their stored mentions and edits, and only new or edited
+# paragraphs (or ones whose neighbours changed) go through identification,
+# disambiguation and edit generation.
+#
+# The index also records a namespace (a hash of the prompts and the character
+# registry); when either changes, the whole index is stale. A paragraph whose
+# edits didn't all apply is stored as unresolved: its placed edits are still
+# used, but it counts as stale and goes through the stages again next run.
+#
+# File layout (outputs/analysis_log/<chapter>_coref.json):
+#   {"version": 3, "namespace": "<sha256>",
+#    "paragraphs": {"<sha256>:<sha256>": {"mentions": [...], "edits": [...], "resolved": true}}}
+# Offsets in mentions and edits are relative to the start of their paragraph.
+#######
+
+import hashlib
+import json
+
+
+INDEX_VERSION = 3
+PARAGRAPH_SEPARATOR = '\n\n'
+
+
+def paragraph_hash(paragraph):
+    return hashlib.sha256(paragraph.encode('utf-8')).hexdigest()
+
+
+def paragraph_spans(text):
+    """(start, end) of every paragraph, splitting on blank lines like the rest of the pipeline"""
+    spans = []
+    start = 0
+    while True:
+        end = text.find(PARAGRAPH_SEPARATOR, start)
+        if end == -1:
+            spans.append((start, len(text)))
+            return spans
+        spans.append((start, end))
+        start = end + len(PARAGRAPH_SEPARATOR)
+
+
+def paragraph_key(text, spans, i):
+    """Index key of paragraph i: its own hash and the hash of the paragraphs around it"""
+    start, end = spans[i]
+    previous = text[spans[i - 1][0]:spans[i - 1][1]] if i > 0 else ''
+    following = text[spans[i + 1][0]:spans[i + 1][1]] if i + 1 < len(spans) else ''
+    neighbours = previous + '\0' + following
+    return f"{paragraph_hash(text[start:end])}:{paragraph_hash(neighbours)}"
+
+
+class CorefIndex:
+    """Per-chapter store of resolved mentions and edits, keyed by paragraph and neighbours"""
+
+    def __init__(self, path, paragraphs=None, namespace=''):
+        self.path = path
+        self.paragraphs = paragraphs or {}
+        self.namespace = namespace
+
+    @classmethod
+    def load(cls, path, namespace=''):
+        """The stored index, or an empty one if it's missing, outdated or from another namespace"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path, namespace=namespace)
+
+        if data.get('version') != INDEX_VERSION or data.get('namespace') != namespace:
+            return cls(path, namespace=namespace)
+        return cls(path, data.get('paragraphs', {}), namespace)
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'namespace': self.namespace, 'paragraphs': self.paragraphs},
+                      f, indent=2)
+
+    def get(self, text, spans, i):
+        return self.paragraphs.get(paragraph_key(text, spans, i))
+
+    def store(self, text, spans, i, mentions, edits, resolved=True):
+        self.paragraphs[paragraph_key(text, spans, i)] = {'mentions': mentions, 'edits': edits,
+                                                          'resolved': resolved}
+
+    def stale_paragraphs(self, text, spans):
+        """Indices of paragraphs with no entry yet (new, edited, or with edited neighbours) or an unresolved one"""
+        stale = []
+        for i, (start, end) in enumerate(spans):
+            if not text[start:end].strip():
+                continue
+            entry = self.get(text, spans, i)
+            if entry is None or not entry['resolved']:
+                stale.append(i)
+        return stale
+
+    def chapter_records(self, text, spans, key):
+        """All stored mentions or edits for the chapter, with absolute offsets"""
+        records = []
+        for i, (start, end) in enumerate(spans):
+            entry = self.get(text, spans, i)
+            if entry is None:
+                continue
+            for record in entry[key]:
+                records.append({**record, 'start': record['start'] + start, 'end': record['end'] + start})
+        return records
+
+    def prune(self, text, spans):
+        """Drop entries for paragraphs no longer in the chapter"""
+        live = {paragraph_key(text, spans, i) for i in range(len(spans))}
+        self.paragraphs = {key: entry for key, entry in self.paragraphs.items() if key in live}
@@ -0,0 +1,223 @@
+#######
+# Adaptive concurrency limiter (AIMD) for model calls
+# One limiter per model bounds the requests in flight. After every round of
+# `limit` completed calls it compares output tokens/sec with the previous
+# round: while throughput keeps improving it allows one more request in
+# flight (additive increase); a 429 or a latency spike halves the limit
+# (multiplicative decrease), once per burst: calls that were already in
+# flight when the limit was cut don't cut it again. Latency is compared with a baseline per output
+# size bucket (powers of two of output tokens), so a short JSON answer and a
+# full chapter aren't judged against each other. Every sample, spikes
+# included, moves the baseline, so a lasting shift (a slower model, a busy
+# provider) stops counting as a spike after a few calls.
+#
+# The learned limit is saved per model in outputs/.model_tuning.json at exit
+# and used as the starting point of the next run, along with the model's
+# chunk budget: the input size (characters) a chunked request is allowed,
+# lowered whenever the model runs out of output tokens on a chunk, and raised
+# again (up to the caller's default) after a run of chunks that weren't cut off.
+#######
+
+from pathlib import Path
+import atexit
+import json
+import threading
+import time
+
+
+TUNING_FILE = Path("outputs/.model_tuning.json")
+
+DEFAULT_LIMIT = 4
+MIN_LIMIT = 1
+MAX_LIMIT = 32
+
+# A call slower than this multiple of its size bucket's baseline is a spike
+SPIKE_FACTOR = 2.5
+# Throughput must improve by this fraction for the limit to keep growing
+IMPROVEMENT = 0.05
+# Weight of a new observation in the latency baseline
+BASELINE_ALPHA = 0.2
+
+# A truncated request's budget becomes this share of what the model managed
+CHUNK_BUDGET_MARGIN = 0.9
+MIN_CHUNK_BUDGET = 2000
+# After this many complete answers in a row on chunks of at least half the
+# budget, a lowered budget grows by CHUNK_BUDGET_GROWTH
+CHUNK_BUDGET_STREAK = 5
+CHUNK_BUDGET_GROWTH = 1.25
+
+
+def size_bucket(output_tokens):
+    """Requests of similar size share a latency baseline: 0, 1, 2-3, 4-7, ... tokens"""
+    return max(int(output_tokens), 0).bit_length()
+
+
+class AdaptiveLimiter:
+    """Bounds requests in flight for one model and tunes the bound from what it observes"""
+
+    def __init__(self, model, limit=DEFAULT_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT):
+        self.model = model
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(max_limit, limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+        self._baseline = {}  # size bucket -> EWMA of latency in seconds
+        self._best_throughput = 0.0
+        self._round_started = time.perf_counter()
+        self._round_tokens = 0
+        self._round_calls = 0
+        self._last_decrease = float('-inf')
+        self.throttled = 0
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _decrease(self, started):
+        if started is not None and started < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit // 2)
+        self._last_decrease = time.perf_counter()
+        self._best_throughput = 0.0
+        self._start_round()
+
+    def _start_round(self):
+        self._round_started = time.perf_counter()
+        self._round_tokens = 0
+        self._round_calls = 0
+
+    def on_success(self, latency, output_tokens, started=None):
+        """Record a completed call; may grow the limit or cut it on a latency spike
+
+        started is the call's time.perf_counter() start, used to skip cuts for
+        calls that began before the last one.
+        """
+        with self._cond:
+            bucket = size_bucket(output_tokens)
+            baseline = self._baseline.get(bucket)
+            self._baseline[bucket] = latency if baseline is None else (
+                (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * latency)
+            if baseline is not None and latency > baseline * SPIKE_FACTOR:
+                self._decrease(started)
+                return
+
+            self._round_tokens += output_tokens
+            self._round_calls += 1
+            if self._round_calls < self.limit:
+                return
+
+            throughput = self._round_tokens / max(time.perf_counter() - self._round_started, 1e-6)
+            if throughput > self._best_throughput * (1 + IMPROVEMENT) and self.limit < self.max_limit:
+                self.limit += 1
+                self._cond.notify_all()
+            self._best_throughput = max(self._best_throughput, throughput)
+            self._start_round()
+
+    def on_throttle(self, started=None):
+        """Record a 429: halve the limit"""
+        with self._cond:
+            self.throttled += 1
+            self._decrease(started)
+
+
+def load_tuning(path=TUNING_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_tuning(limiters, chunk_budgets=None, path=TUNING_FILE):
+    """Merge the current limit (and chunk budget) of each model into the tuning file"""
+    chunk_budgets = chunk_budgets or {}
+    if not limiters and not chunk_budgets:
+        return
+    tuning = load_tuning(path)
+    updated = time.strftime('%Y-%m-%dT%H:%M:%S')
+    for model, limiter in limiters.items():
+        tuning[model] = {**tuning.get(model, {}), 'limit': limiter.limit, 'throttled': limiter.throttled,
+                         'updated': updated}
+    for model, budget in chunk_budgets.items():
+        tuning[model] = {**tuning.get(model, {}), 'chunk_budget': budget, 'updated': updated}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, indent=2)
+
+
+_limiters = {}
+_chunk_budgets = {}
+_chunk_streaks = {}  # model -> complete answers since the budget last changed
+_limiters_lock = threading.Lock()
+_persist = {'enabled': True}
+
+
+def freeze_tuning():
+    """Leave the tuning file untouched at exit (e.g. when calls are replayed, not measured)"""
+    _persist['enabled'] = False
+
+
+def limiter_for(model):
+    """The process-wide limiter of one model, starting from its persisted limit"""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            learned = load_tuning().get(model, {}).get('limit', DEFAULT_LIMIT)
+            limiter = _limiters[model] = AdaptiveLimiter(model, learned)
+        return limiter
+
+
+def chunk_budget(model, default):
+    """Characters of input per chunked request for a model: default, unless it was lowered"""
+    with _limiters_lock:
+        budget = _chunk_budgets.get(model)
+        if budget is None:
+            budget = load_tuning().get(model, {}).get('chunk_budget')
+        return min(default, budget) if budget else default
+
+
+def reduce_chunk_budget(model, completed_chars, default):
+    """After a truncated answer: keep later chunks under what the model completed; returns the new budget"""
+    budget = max(MIN_CHUNK_BUDGET, int(completed_chars * CHUNK_BUDGET_MARGIN))
+    current = chunk_budget(model, default)
+    with _limiters_lock:
+        _chunk_budgets[model] = min(current, budget)
+        _chunk_streaks[model] = 0
+        return _chunk_budgets[model]
+
+
+def grow_chunk_budget(model, completed_chars, default):
+    """After an answer that wasn't cut off: returns the raised budget once a streak allows it, else None"""
+    current = chunk_budget(model, default)
+    if current >= default or completed_chars < current / 2:
+        return None
+    with _limiters_lock:
+        streak = _chunk_streaks.get(model, 0) + 1
+        if streak < CHUNK_BUDGET_STREAK:
+            _chunk_streaks[model] = streak
+            return None
+        _chunk_streaks[model] = 0
+        _chunk_budgets[model] = min(default, int(current * CHUNK_BUDGET_GROWTH))
+        return _chunk_budgets[model]
+
+
+@atexit.register
+def _save_at_exit():
+    if _persist['enabled']:
+        save_tuning(_limiters, _chunk_budgets)
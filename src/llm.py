@@ -0,0 +1,452 @@
+#######
+# Shared model access for the regendering scripts
+# Every model call goes through create_response(stage, ...): the stage is
+# routed to a backend and model (see src/backends.py), timed (see
+# src/tracing.py) and bounded by the model's adaptive concurrency limit (see
+# src/limiter.py). 429s are retried with backoff after cutting the limit.
+# Backends without the Responses API are called through chat.completions and
+# their answers wrapped to look like a Responses API result.
+#
+# Optional hedging (enable_hedging): once a model has enough history for a
+# request size, a request still running at that size's p95 latency gets a
+# duplicate, and whichever finishes first is used. The synchronous client
+# can't abort a request in flight, so the loser is abandoned: it keeps its
+# concurrency slot until it really finishes (or is never sent, if it was
+# still queued for one), only the winner reaches the limiter's statistics
+# and the cassette, and its tokens are counted as overhead before the usage
+# report is written. Duplicates are capped at a share of the tokens spent;
+# replayed runs aren't hedged.
+# benchmarks/bench_hedging.py measures the effect on p99 latency.
+#
+# Every answer's status is checked: one cut off by the output limit is
+# counted (and traced) as truncated; callers that can continue it use
+# is_truncated() and the model's chunk budget (see limiter.chunk_budget).
+#
+# The usage report (tokens per model, truncations, hedges, their overhead and
+# the p99 with and without hedging) is written to outputs/usage_report.json at exit.
+#
+# OPENAI_BASE_URL points the client elsewhere, e.g. at the fake server in
+# benchmarks/fake_openai_server.py. LLM_CASSETTE records every call to a
+# file or answers them from one instead (see src/cassette.py).
+#######
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+import atexit
+import json
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+from openai import OpenAI, RateLimitError
+
+from backends import route_for
+from cassette import Cassette
+from limiter import freeze_tuning, limiter_for, size_bucket
+from progress import log, progress
+from tracing import percentile, record
+
+load_dotenv()
+
+MAX_RETRIES = 6
+BACKOFF_SECONDS = 1.0
+
+USAGE_REPORT = Path("outputs/usage_report.json")
+
+# Hedging: latencies kept per (model, size bucket), and how many are needed
+# before its p95 is trusted as a trigger
+LATENCY_HISTORY = 200
+HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_BUDGET = 0.05
+
+_hedging = {'enabled': False, 'budget': DEFAULT_HEDGE_BUDGET}
+_hedge_pool = None
+_latencies = {}
+_usage = {}
+_clients = {}
+_lock = threading.Lock()
+# Abandoned hedge copies still running; the usage report waits for them
+_unsettled = set()
+_settled = threading.Condition(_lock)
+
+_cassette = None
+if os.getenv("LLM_CASSETTE"):
+    _cassette = Cassette(os.getenv("LLM_CASSETTE"), os.getenv("LLM_CASSETTE_MODE", "replay"),
+                         float(os.getenv("LLM_REPLAY_TIMING", "0")))
+    atexit.register(_cassette.close)
+    # Replayed latencies say nothing about the live API
+    if _cassette.replaying:
+        freeze_tuning()
+
+
+@dataclass(frozen=True, slots=True)
+class ChatUsage:
+    input_tokens: int
+    output_tokens: int
+
+
+@dataclass(frozen=True, slots=True)
+class ChatResponse:
+    """The parts of a Responses API result the pipelines use, built from a chat completion"""
+    output_text: str
+    usage: ChatUsage | None
+    status: str
+    incomplete_details: dict | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ReplayedRaw:
+    """Stands in for the raw HTTP response of a replayed call"""
+    headers: dict
+
+
+def client_for(backend):
+    """One OpenAI client per backend"""
+    with _lock:
+        client = _clients.get(backend.name)
+        if client is None:
+            # Local servers usually ignore the key, but the client requires one
+            api_key = os.getenv(backend.api_key_env) or "unused"
+            client = _clients[backend.name] = OpenAI(api_key=api_key, base_url=backend.base_url)
+        return client
+
+
+def _create_chat(client, kwargs):
+    """Responses-style kwargs through chat.completions; returns (raw, ChatResponse)"""
+    messages = kwargs['input']
+    if isinstance(messages, str):
+        messages = [{'role': 'user', 'content': messages}]
+    params = {'model': kwargs['model'], 'messages': [{'role': m['role'], 'content': m['content']} for m in messages]}
+    if 'temperature' in kwargs:
+        params['temperature'] = kwargs['temperature']
+    if 'max_output_tokens' in kwargs:
+        params['max_tokens'] = kwargs['max_output_tokens']
+
+    raw = client.chat.completions.with_raw_response.create(**params)
+    completion = raw.parse()
+    choice = completion.choices[0]
+    usage = completion.usage and ChatUsage(completion.usage.prompt_tokens, completion.usage.completion_tokens)
+    if choice.finish_reason == 'length':
+        return raw, ChatResponse(choice.message.content or '', usage, 'incomplete', {'reason': 'max_output_tokens'})
+    return raw, ChatResponse(choice.message.content or '', usage, 'completed')
+
+
+def _replay(stage, kwargs):
+    """(raw, response) for a request, from the cassette"""
+    answer = _cassette.replay(stage, kwargs)
+    if _cassette.timing:
+        time.sleep(answer['latency'] * _cassette.timing)
+    usage = None
+    if answer.get('input_tokens') is not None:
+        usage = ChatUsage(answer['input_tokens'], answer['output_tokens'])
+    reason = answer.get('incomplete_reason')
+    response = ChatResponse(answer['output_text'], usage, answer['status'], {'reason': reason} if reason else None)
+    headers = {} if answer.get('processing_ms') is None else {'openai-processing-ms': str(answer['processing_ms'])}
+    return ReplayedRaw(headers), response
+
+
+def _record(stage, kwargs, raw, response, latency):
+    usage = getattr(response, 'usage', None)
+    processing_ms = raw.headers.get('openai-processing-ms')
+    _cassette.record(stage, kwargs, {
+        'output_text': response.output_text,
+        'status': getattr(response, 'status', None) or 'completed',
+        'incomplete_reason': incomplete_reason(response),
+        'input_tokens': usage.input_tokens if usage is not None else None,
+        'output_tokens': usage.output_tokens if usage is not None else None,
+        'latency': round(latency, 4),
+        'processing_ms': int(processing_ms) if processing_ms is not None else None,
+    })
+
+
+def enable_hedging(budget=DEFAULT_HEDGE_BUDGET):
+    """Hedge slow requests; duplicates may cost at most budget x the tokens of the rest"""
+    global _hedge_pool
+    _hedging.update(enabled=True, budget=budget)
+    if _hedge_pool is None:
+        _hedge_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+
+
+def estimated_size(kwargs):
+    """Rough token count of a request; the output of these stages scales with it"""
+    return len(json.dumps(kwargs.get('input', ''), ensure_ascii=False)) // 4
+
+
+def _model_usage(model):
+    return _usage.setdefault(model, {
+        'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'truncated': 0,
+        'hedges': 0, 'hedge_wins': 0, 'hedge_tokens': 0,
+        'latencies': [], 'unhedged_latencies': [],
+    })
+
+
+def incomplete_reason(response):
+    """Why an answer stopped early (e.g. 'max_output_tokens'), or None if it completed"""
+    if getattr(response, 'status', None) != 'incomplete':
+        return None
+    details = getattr(response, 'incomplete_details', None)
+    reason = details.get('reason') if isinstance(details, dict) else getattr(details, 'reason', None)
+    return reason or 'unknown'
+
+
+def is_truncated(response):
+    """True if the answer was cut off by the output token limit"""
+    return incomplete_reason(response) == 'max_output_tokens'
+
+
+class _Race:
+    """The two copies of a hedged request: the first to finish counts, the other is abandoned"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner = None
+
+    @property
+    def decided(self):
+        return self.winner is not None
+
+    def claim(self, copy):
+        """True for the first copy to finish"""
+        with self._lock:
+            if self.winner is None:
+                self.winner = copy
+            return self.winner == copy
+
+
+def _call(stage, kwargs, backend, race=None):
+    """One request with 429 retries; returns (response, seconds for the successful attempt)
+
+    race is shared by the copies of a hedged request (the stage names tell
+    them apart); a copy that was never sent because the other one had
+    already answered returns (None, 0.0).
+    """
+    client = client_for(backend)
+    limiter = limiter_for(_model_key(backend, kwargs['model']))
+
+    for attempt in range(MAX_RETRIES + 1):
+        queued = time.perf_counter()
+        with limiter:
+            if race is not None and race.decided:
+                return None, 0.0
+            started = time.perf_counter()
+            record(f"{stage}.queue", queued, started, limit=limiter.limit)
+            try:
+                if _cassette is not None and _cassette.replaying:
+                    raw, response = _replay(stage, kwargs)
+                elif backend.responses_api:
+                    raw = client.responses.with_raw_response.create(**kwargs)
+                    response = raw.parse()
+                else:
+                    raw, response = _create_chat(client, kwargs)
+            except RateLimitError:
+                limiter.on_throttle(started)
+                record(f"{stage}.throttled", started, time.perf_counter(), limit=limiter.limit)
+                if attempt == MAX_RETRIES:
+                    raise
+                throttled = True
+            else:
+                throttled = False
+            finished = time.perf_counter()
+
+        if not throttled:
+            break
+        if race is not None and race.decided:
+            return None, 0.0
+        delay = BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+        log(f"    ⚠️  Rate limited ({kwargs.get('model')}), limit now {limiter.limit}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    # An abandoned copy's answer is dropped: it mustn't be replayed or tune the limit
+    counted = race is None or race.claim(stage)
+    if counted and _cassette is not None and not _cassette.replaying:
+        _record(stage, kwargs, raw, response, finished - started)
+
+    args = {'model': kwargs['model'], 'backend': backend.name}
+    processing_ms = raw.headers.get('openai-processing-ms')
+    if processing_ms is not None:
+        args['processing_ms'] = int(processing_ms)
+        args['transport_ms'] = round((finished - started) * 1000 - int(processing_ms), 1)
+    reason = incomplete_reason(response)
+    if reason is not None:
+        args['incomplete'] = reason
+    usage = getattr(response, 'usage', None)
+    if counted:
+        limiter.on_success(finished - started, usage.output_tokens if usage is not None else 0, started)
+    else:
+        args['abandoned'] = True
+    if usage is not None:
+        args['input_tokens'] = usage.input_tokens
+        args['output_tokens'] = usage.output_tokens
+        args['output_tokens_per_s'] = round(usage.output_tokens / max(finished - started, 1e-6), 1)
+        progress.add_tokens(usage.output_tokens)
+    record(f"{stage}.api", started, finished, **args)
+
+    return response, finished - started
+
+
+def _tokens(response):
+    usage = getattr(response, 'usage', None)
+    return (usage.input_tokens, usage.output_tokens) if usage is not None else (0, 0)
+
+
+def _account(model, response, latency, unhedged_latency=None, hedge_response=None, hedge_won=False):
+    """Add one logical request (and its duplicate, if any) to the usage report
+
+    response is the original request's answer (None if it failed); the
+    duplicate's tokens count as hedge overhead.
+    """
+    with _lock:
+        usage = _model_usage(model)
+        usage['calls'] += 1
+        input_tokens, output_tokens = _tokens(response)
+        usage['input_tokens'] += input_tokens
+        usage['output_tokens'] += output_tokens
+        if response is not None and incomplete_reason(response) is not None:
+            usage['truncated'] += 1
+        usage['latencies'].append(latency)
+        usage['unhedged_latencies'].append(latency if unhedged_latency is None else unhedged_latency)
+        if hedge_response is not None:
+            usage['hedge_tokens'] += sum(_tokens(hedge_response))
+        if hedge_won:
+            usage['hedge_wins'] += 1
+
+
+def _observe(model, bucket, latency):
+    with _lock:
+        history = _latencies.setdefault((model, bucket), deque(maxlen=LATENCY_HISTORY))
+        history.append(latency)
+
+
+def _hedge_after(model, bucket):
+    """Seconds to wait before hedging, or None if this request shouldn't be hedged"""
+    with _lock:
+        history = _latencies.get((model, bucket))
+        if history is None or len(history) < HEDGE_MIN_SAMPLES:
+            return None
+        usage = _model_usage(model)
+        spent = usage['input_tokens'] + usage['output_tokens']
+        # Tokens of abandoned requests are only known once they finish, so the
+        # share of hedged requests is capped as well
+        if usage['hedge_tokens'] > _hedging['budget'] * spent or \
+                usage['hedges'] + 1 > _hedging['budget'] * (usage['calls'] + 1):
+            return None
+        return percentile(list(history), 95)
+
+
+def _model_key(backend, model):
+    """How a model is named in the limiter, tuning file and usage report"""
+    return model if backend.name == "openai" else f"{backend.name}/{model}"
+
+
+def stage_model(stage):
+    """The model a stage is routed to, as named in the limiter and tuning file"""
+    backend, model = route_for(stage)
+    return _model_key(backend, model)
+
+
+def create_response(stage, **kwargs):
+    """responses.create(**kwargs) on the stage's routed backend and model, recorded under the stage name
+
+    kwargs are Responses API arguments without the model, which comes from the route.
+    """
+    size = estimated_size(kwargs)
+    backend, kwargs['model'] = route_for(stage, size)
+    model = _model_key(backend, kwargs['model'])
+    bucket = size_bucket(size)
+    # A replayed run has one recorded answer per call, and no stragglers to hedge
+    replaying = _cassette is not None and _cassette.replaying
+    hedge_after = _hedge_after(model, bucket) if _hedging['enabled'] and not replaying else None
+
+    if hedge_after is None:
+        response, latency = _call(stage, kwargs, backend)
+        _observe(model, bucket, latency)
+        _account(model, response, latency)
+        return response
+
+    started = time.perf_counter()
+    race = _Race()
+    primary = _hedge_pool.submit(_call, stage, kwargs, backend, race)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        response, latency = primary.result()
+        _observe(model, bucket, latency)
+        _account(model, response, time.perf_counter() - started)
+        return response
+
+    with _lock:
+        _model_usage(model)['hedges'] += 1
+    hedge = _hedge_pool.submit(_call, f"{stage}.hedge", kwargs, backend, race)
+    pending = {primary, hedge}
+    while pending and not race.decided:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    if not race.decided:
+        # Both failed: surface the primary's error
+        primary.result()
+
+    # The copy that claimed the race is the answer; the other one is abandoned
+    winner, loser = (primary, hedge) if race.winner == stage else (hedge, primary)
+    response, latency = winner.result()
+    effective = time.perf_counter() - started
+    _observe(model, bucket, latency)
+    with _lock:
+        _unsettled.add(loser)
+
+    def settle(future):
+        """Account the abandoned request once it finishes"""
+        loser_response = future.result()[0] if future.exception() is None else None
+        if winner is primary:
+            _account(model, response, effective, effective, loser_response, False)
+        else:
+            # Without the hedge, the caller would have waited for the primary until now
+            _account(model, loser_response, effective, time.perf_counter() - started, response, True)
+        with _settled:
+            _unsettled.discard(future)
+            _settled.notify_all()
+
+    loser.add_done_callback(settle)
+    return response
+
+
+def usage_report():
+    """Per model: tokens, hedging overhead, and latency percentiles with and without hedging"""
+    report = {}
+    with _lock:
+        for model, usage in _usage.items():
+            entry = {k: usage[k] for k in ('calls', 'input_tokens', 'output_tokens', 'truncated',
+                                           'hedges', 'hedge_wins', 'hedge_tokens')}
+            spent = usage['input_tokens'] + usage['output_tokens']
+            entry['hedge_overhead'] = round(usage['hedge_tokens'] / spent, 4) if spent else 0.0
+            for name in ('latencies', 'unhedged_latencies'):
+                values = usage[name]
+                if values:
+                    prefix = 'latency' if name == 'latencies' else 'unhedged_latency'
+                    for q in (50, 95, 99):
+                        entry[f'{prefix}_p{q}_s'] = round(percentile(values, q), 3)
+            report[model] = entry
+    return report
+
+
+@atexit.register
+def _write_usage_report():
+    with _settled:
+        _settled.wait_for(lambda: not _unsettled)
+    report = usage_report()
+    if not report:
+        return
+    USAGE_REPORT.parent.mkdir(parents=True, exist_ok=True)
+    with open(USAGE_REPORT, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    for model, entry in report.items():
+        line = f"  {model}: {entry['calls']} calls, {entry['input_tokens']} in / {entry['output_tokens']} out tokens"
+        if entry['truncated']:
+            line += f", {entry['truncated']} truncated"
+        if entry['hedges']:
+            line += (f", {entry['hedges']} hedged ({entry['hedge_wins']} won, "
+                     f"+{entry['hedge_overhead'] * 100:.1f}% tokens), "
+                     f"p99 {entry['unhedged_latency_p99_s']:.2f}s -> {entry['latency_p99_s']:.2f}s")
+        log(line)
+    log(f"Usage report: {USAGE_REPORT}")
@@ -0,0 +1,79 @@
+#######
+# Memory-mapped chapter reader
+# Maps a UTF-8 chapter file read-only and walks its blank-line separated
+# paragraphs as byte spans, without reading the file into a str or splitting
+# it. Hashing works on the mapping itself (zero-copy); only the paragraphs a
+# caller asks for are decoded.
+#
+# The paragraph separator b'\n\n' can't occur inside a multi-byte UTF-8
+# sequence, so every span decodes on its own.
+#######
+
+import hashlib
+import mmap
+import os
+
+
+PARAGRAPH_SEPARATOR = b'\n\n'
+
+
+class MappedText:
+    """Read-only view of a UTF-8 text file; use as a context manager"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self.size = os.fstat(self._file.fileno()).st_size
+            # mmap can't map an empty file
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        except BaseException:
+            self._file.close()
+            raise
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def find(self, sub, start=0, end=None):
+        if self._map is None:
+            return -1
+        return self._map.find(sub, start, self.size if end is None else end)
+
+    def paragraph_spans(self, start=0):
+        """Yield (start, end) byte offsets of every paragraph from start on, like str.split('\\n\\n')"""
+        if self._map is None:
+            yield (0, 0)
+            return
+        while True:
+            end = self._map.find(PARAGRAPH_SEPARATOR, start)
+            if end == -1:
+                yield (start, self.size)
+                return
+            yield (start, end)
+            start = end + len(PARAGRAPH_SEPARATOR)
+
+    def decode(self, start=0, end=None):
+        """Decode one byte span to str"""
+        if self._map is None:
+            return ''
+        return self._map[start:self.size if end is None else end].decode('utf-8')
+
+    def paragraphs(self, start=0):
+        """Yield each paragraph decoded on its own"""
+        for span in self.paragraph_spans(start):
+            yield self.decode(*span)
+
+    def sha256(self):
+        """Hex digest of the file, hashed straight from the mapping"""
+        digest = hashlib.sha256()
+        if self._map is not None:
+            digest.update(self._map)
+        return digest.hexdigest()
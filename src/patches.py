@@ -0,0 +1,231 @@
+#######
+# Reversible transformation patches
+# Records what a regendering run changed as span-level replacements against the
+# original chapter, so the change can be re-applied, reverted or re-targeted
+# (e.g. "Jane" -> another first name) locally, without another LLM pass.
+#
+# Patch format (JSON):
+#   {"version": 1,
+#    "source_sha256": "...", "target_sha256": "...",
+#    "edits": [[start, end, "original span", "replacement"], ...]}
+# start/end are character offsets into the original text, in ascending order.
+#
+# USAGE:
+#   From the project root directory:
+#     python src/patches.py create inputs/adamo outputs/adamo    # Patch every existing output
+#     python src/patches.py apply  inputs/adamo/ch1.txt patch.json out.txt
+#     python src/patches.py revert outputs/adamo/ch1.txt patch.json out.txt
+#     python src/patches.py retarget patch.json Jane Alex new_patch.json
+#######
+
+from pathlib import Path
+import difflib
+import hashlib
+import json
+import re
+import sys
+
+from chapter_index import ChapterIndex
+
+
+PATCH_VERSION = 1
+PARAGRAPH_SEPARATOR = '\n\n'
+
+# Words, runs of whitespace and single punctuation marks, so edits land on
+# whole words and "his" -> "her" stays a one-token change
+_TOKEN_RE = re.compile(r'\w+|\s+|[^\w\s]')
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _split_with_offsets(text, pattern=None):
+    """Split into paragraphs (or tokens, given a pattern) and their start offsets"""
+    if pattern is not None:
+        pieces = pattern.findall(text)
+    else:
+        pieces = text.split(PARAGRAPH_SEPARATOR)
+    starts = []
+    position = 0
+    for piece in pieces:
+        starts.append(position)
+        position += len(piece) + (0 if pattern is not None else len(PARAGRAPH_SEPARATOR))
+    return pieces, starts
+
+
+def _diff_tokens(original, translated, base):
+    """Token-level edits between two (short) texts, offsets shifted by base"""
+    a, a_starts = _split_with_offsets(original, _TOKEN_RE)
+    b = _TOKEN_RE.findall(translated)
+    a_starts.append(len(original))
+
+    edits = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        start, end = a_starts[i1], a_starts[i2]
+        edits.append([base + start, base + end, original[start:end], ''.join(b[j1:j2])])
+    return edits
+
+
+def make_patch(original, translated):
+    """Span-level replacements that turn original into translated
+
+    Paragraphs are matched first, so only paragraphs that actually changed get
+    the (quadratic) token-level diff.
+    """
+    a, a_starts = _split_with_offsets(original)
+    b, _ = _split_with_offsets(translated)
+    a_starts.append(len(original) + len(PARAGRAPH_SEPARATOR))
+
+    edits = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        # Changed, inserted or deleted paragraphs: diff the block as one text
+        start = a_starts[i1]
+        end = max(start, a_starts[i2] - len(PARAGRAPH_SEPARATOR))
+        old_block = PARAGRAPH_SEPARATOR.join(a[i1:i2])
+        new_block = PARAGRAPH_SEPARATOR.join(b[j1:j2])
+        if i1 == i2:
+            # Pure insertion before paragraph i1 (or at the end)
+            if i1 < len(a):
+                new_block += PARAGRAPH_SEPARATOR
+            else:
+                start = end = len(original)
+                new_block = PARAGRAPH_SEPARATOR + new_block
+            edits.append([start, end, '', new_block])
+        elif j1 == j2:
+            # Pure deletion, including the separator that followed the block
+            end = min(a_starts[i2], len(original))
+            if i2 == len(a) and i1 > 0:
+                start -= len(PARAGRAPH_SEPARATOR)
+            edits.append([start, end, original[start:end], ''])
+        else:
+            edits.extend(_diff_tokens(old_block, new_block, start))
+
+    return {
+        'version': PATCH_VERSION,
+        'source_sha256': text_sha256(original),
+        'target_sha256': text_sha256(translated),
+        'edits': edits,
+    }
+
+
+def apply_patch(original, patch, check=True):
+    """Re-create the transformed text from the original and a patch"""
+    if check and text_sha256(original) != patch['source_sha256']:
+        raise ValueError("Patch does not match this original text (source hash differs)")
+
+    parts = []
+    position = 0
+    for start, end, _, replacement in patch['edits']:
+        parts.append(original[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(original[position:])
+    return ''.join(parts)
+
+
+def revert_patch(translated, patch, check=True):
+    """Recover the original text from the transformed text and its patch"""
+    if check and patch['target_sha256'] and text_sha256(translated) != patch['target_sha256']:
+        raise ValueError("Patch does not match this transformed text (target hash differs)")
+
+    parts = []
+    position = 0
+    shift = 0
+    for start, end, original_span, replacement in patch['edits']:
+        target_start = start + shift
+        parts.append(translated[position:target_start])
+        parts.append(original_span)
+        position = target_start + len(replacement)
+        shift += len(replacement) - (end - start)
+    parts.append(translated[position:])
+    return ''.join(parts)
+
+
+def retarget_patch(patch, mapping, original=None):
+    """Rewrite the replacements of a patch, e.g. {"Jane": "Alex"}, without any API calls
+
+    Only whole words inside replacement text are rewritten. If the original text
+    is given, the target hash is refreshed; otherwise it is cleared and revert
+    skips the target check.
+    """
+    patterns = [(re.compile(rf'\b{re.escape(old)}\b'), new) for old, new in mapping.items()]
+
+    edits = []
+    for start, end, original_span, replacement in patch['edits']:
+        for pattern, new in patterns:
+            replacement = pattern.sub(new, replacement)
+        edits.append([start, end, original_span, replacement])
+
+    retargeted = {**patch, 'edits': edits}
+    if original is not None:
+        retargeted['target_sha256'] = text_sha256(apply_patch(original, retargeted))
+    else:
+        retargeted['target_sha256'] = None
+    return retargeted
+
+
+def save_patch(patch, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(patch, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_patch(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def patch_path(book_name, entry):
+    """Where regender_v2 keeps the patch for one chapter"""
+    return Path("outputs/patches") / book_name / f"{entry.slug}.json"
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python src/patches.py create|apply|revert|retarget ...")
+        sys.exit(1)
+
+    command, args = sys.argv[1], sys.argv[2:]
+
+    if command == "create":
+        input_dir, output_dir = Path(args[0]), Path(args[1])
+        chapter_index = ChapterIndex.load(input_dir)
+        for entry in chapter_index:
+            output_file = output_dir / entry.relpath
+            if not output_file.exists():
+                continue
+            patch = make_patch(_read(chapter_index.path(entry)), _read(output_file))
+            target = patch_path(input_dir.name, entry)
+            save_patch(patch, target)
+            print(f"  {entry.relpath}: {len(patch['edits'])} edits -> {target}")
+    elif command == "apply":
+        _write(args[2], apply_patch(_read(args[0]), load_patch(args[1])))
+        print(f"✓ Applied patch to {args[0]} -> {args[2]}")
+    elif command == "revert":
+        _write(args[2], revert_patch(_read(args[0]), load_patch(args[1])))
+        print(f"✓ Reverted {args[0]} -> {args[2]}")
+    elif command == "retarget":
+        patch_file, old_name, new_name, new_patch_file = args[:4]
+        save_patch(retarget_patch(load_patch(patch_file), {old_name: new_name}), new_patch_file)
+        print(f"✓ Retargeted {old_name} -> {new_name}: {new_patch_file}")
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,208 @@
+#######
+# Progress and metrics reporting for the pipelines
+# Replaces free-form prints: on a terminal it draws one live status line
+# (chapters, chunks, tokens/sec, ETA) under the log messages, otherwise it
+# prints the messages as plain lines. On request it writes one JSON object per
+# line instead, so a scheduler can follow a long run and alert when the events
+# (including the periodic heartbeat) stop.
+#
+# Events (all carry "event" and "ts", a unix timestamp):
+#   start        {"total", "unit", "label"}
+#   item_start   {"name", "index"}
+#   item_done    {"name", "index", "done", "total", ...metrics}   index as given at item_start
+#   chunks       {"total"}            chunks of the current item
+#   chunk_done   {"done", "total"}
+#   log          {"level": "info"|"warning", "message"}
+#   heartbeat    {"done", "total", "tokens", "tokens_per_s", "eta_s"}
+#   finish       {"done", "total", "elapsed_s", "tokens", "tokens_per_s"}
+#
+# USAGE:
+#   By default stdout gets the live bar on a terminal and plain log lines
+#   otherwise. --progress json (regender_v1.py, regender_v2.py, export.py)
+#   writes the JSON lines on stdout instead:
+#     python src/regender_v2.py inputs/adamo --progress json > outputs/progress.jsonl
+#   To keep the usual output and send the events elsewhere, name a file
+#   descriptor in PROGRESS_FD:
+#     PROGRESS_FD=3 python src/regender_v2.py inputs/adamo 3>outputs/progress.jsonl
+#######
+
+import json
+import os
+import sys
+import threading
+import time
+
+
+HEARTBEAT_SECONDS = 15
+BAR_WIDTH = 24
+
+# 'auto': live bar on a terminal, plain lines otherwise; 'json': JSON lines on stdout
+MODES = ('auto', 'json')
+
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """Run-level progress: items (chapters, formats), chunks within an item, and tokens"""
+
+    def __init__(self, stream=None, events=None, mode='auto'):
+        self.stream = stream or sys.stdout
+        self.events = events
+        self._lock = threading.Lock()
+        self.set_mode(mode)
+        self._heartbeat = None
+        self._reset(0, "items", "")
+
+    def _reset(self, total, unit, label):
+        self.total = total
+        self.unit = unit
+        self.label = label
+        self.done = 0
+        self.index = 0
+        self.current = None
+        self._indices = {}  # name -> index of items in flight (export runs several at once)
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.tokens = 0
+        self.started = time.monotonic()
+
+    def set_mode(self, mode):
+        """Switch output mode (see MODES); call before start()"""
+        if mode not in MODES:
+            raise ValueError(f"Progress mode must be one of {', '.join(MODES)} (got {mode!r})")
+        self.live = mode == 'auto' and self.stream.isatty()
+        if mode == 'json' and self.events is None:
+            self.events = self.stream
+
+    # --- derived metrics ---
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def tokens_per_s(self):
+        return round(self.tokens / max(self.elapsed(), 1e-6), 1)
+
+    def eta(self):
+        """Seconds left, from the average time per finished item (and chunk progress of the current one)"""
+        finished = self.done + (self.chunks_done / self.chunks_total if self.chunks_total else 0)
+        if not finished or not self.total:
+            return None
+        return self.elapsed() / finished * max(self.total - finished, 0)
+
+    # --- output ---
+
+    def _emit(self, event, **fields):
+        if self.events is None:
+            return
+        self.events.write(json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, ensure_ascii=False) + '\n')
+        self.events.flush()
+
+    def _status_line(self):
+        filled = int(BAR_WIDTH * self.done / self.total) if self.total else 0
+        parts = [f"[{'#' * filled}{'.' * (BAR_WIDTH - filled)}] {self.done}/{self.total} {self.unit}"]
+        if self.chunks_total > 1:
+            parts.append(f"chunk {self.chunks_done}/{self.chunks_total}")
+        if self.tokens:
+            parts.append(f"{self.tokens_per_s():.0f} tok/s")
+        parts.append(f"ETA {_format_duration(self.eta())}")
+        return ' | '.join(parts)
+
+    def _redraw(self):
+        if self.live and self.total:
+            self.stream.write('\r\x1b[K' + self._status_line())
+            self.stream.flush()
+
+    # --- public API ---
+
+    def start(self, total, unit="chapters", label=""):
+        with self._lock:
+            self._reset(total, unit, label)
+            self._emit('start', total=total, unit=unit, label=label)
+            self._redraw()
+        if self.events is not None and self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+            self._heartbeat.start()
+
+    def item_start(self, name):
+        with self._lock:
+            self.index += 1
+            self._indices[name] = self.index
+            self.current = name
+            self.chunks_total = self.chunks_done = 0
+            self._emit('item_start', name=name, index=self.index)
+            self._redraw()
+
+    def item_done(self, name, **metrics):
+        with self._lock:
+            self.done += 1
+            self.chunks_total = self.chunks_done = 0
+            index = self._indices.pop(name, self.index)
+            self._emit('item_done', name=name, index=index, done=self.done, total=self.total, **metrics)
+            self._redraw()
+
+    def set_chunks(self, total):
+        with self._lock:
+            self.chunks_total = total
+            self.chunks_done = 0
+            self._emit('chunks', total=total)
+            self._redraw()
+
+    def chunk_done(self):
+        with self._lock:
+            self.chunks_done += 1
+            self._emit('chunk_done', done=self.chunks_done, total=self.chunks_total)
+            self._redraw()
+
+    def add_tokens(self, count):
+        with self._lock:
+            self.tokens += count
+            self._redraw()
+
+    def log(self, message=""):
+        """A progress message; warnings are recognized by their ⚠️ marker"""
+        with self._lock:
+            if self.live:
+                self.stream.write('\r\x1b[K' + message + '\n')
+                self._redraw()
+            elif self.events is not self.stream:
+                self.stream.write(message + '\n')
+                self.stream.flush()
+            if not self.live and self.events is not None and message.strip().strip('='):
+                level = 'warning' if '⚠️' in message else 'info'
+                self._emit('log', level=level, message=message.strip())
+
+    def finish(self):
+        with self._lock:
+            self._emit('finish', done=self.done, total=self.total, elapsed_s=round(self.elapsed(), 1),
+                       tokens=self.tokens, tokens_per_s=self.tokens_per_s())
+            if self.live and self.total:
+                self.stream.write('\r\x1b[K' + self._status_line() + '\n')
+                self.stream.flush()
+            self.total = 0
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                if self.total and self.done < self.total:
+                    eta = self.eta()
+                    self._emit('heartbeat', done=self.done, total=self.total, tokens=self.tokens,
+                               tokens_per_s=self.tokens_per_s(), eta_s=None if eta is None else round(eta))
+
+
+def _events_stream():
+    fd = os.getenv("PROGRESS_FD")
+    if not fd:
+        return None
+    return os.fdopen(int(fd), 'w', buffering=1, encoding='utf-8')
+
+
+# One reporter per process, shared by every module
+progress = Progress(events=_events_stream())
+log = progress.log
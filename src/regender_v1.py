@@ -13,44 +13,32 @@
 #     python src/regender_v1.py                    # Uses default: inputs/rekindling
 #     python src/regender_v1.py inputs/adamo       # Process adamo chapters
 #     python src/regender_v1.py inputs/custom      # Process custom directory
+#     python src/regender_v1.py inputs/adamo --votes 5   # Majority vote on ambiguous references
+#     python src/regender_v1.py inputs/adamo --refresh-registry   # Rebuild the character registry
 #
 #   Output will be saved to outputs/{directory_name}/
 #   Analysis logs will be saved to outputs/analysis_log/
+#   The book's characters are listed once in outputs/{directory_name}.characters.json
+#   and sent with every request (see src/character_registry.py; --no-registry to skip)
+#   --progress json prints one JSON event per line instead of the log (see src/progress.py)
+#   Set TRACE_FILE to also record a timing trace (see src/tracing.py)
+#   Set LLM_CASSETTE to record the model calls, or replay them offline (see src/cassette.py)
 ####### 
 
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import json
 from pathlib import Path
 import unicodedata
 import re
-import os
-import sys
-from dotenv import load_dotenv
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-if __name__ == "__main__":
-    # Parse command line arguments
-    if len(sys.argv) > 1:
-        input_dir = Path(sys.argv[1])
-    else:
-        input_dir = Path("inputs/rekindling")
-    
-    # Derive output directory from input directory name
-    input_name = input_dir.name
-    output_dir = Path("outputs") / input_name
-    analysis_dir = Path("outputs/analysis_log")
-    
-    # Create directories
-    output_dir.mkdir(exist_ok=True, parents=True)
-    analysis_dir.mkdir(exist_ok=True, parents=True)
-    
-    print(f"Input directory: {input_dir}")
-    print(f"Output directory: {output_dir}")
-    print(f"Analysis logs: {analysis_dir}")
-    
-    chapter_files = sorted(input_dir.glob("*.txt"))
+from chapter_index import ChapterIndex
+from character_registry import load_registry, registry_block
+from coref_index import CorefIndex, paragraph_hash, paragraph_spans
+from backends import ROUTES
+from llm import create_response
+from progress import MODES as PROGRESS_MODES, log, progress
+from tracing import span
 
 # Stage 1: Identify all Shepard references
 IDENTIFICATION_PROMPT = """Read this text carefully. The protagonist is "John Shepard" - a Commander, Spectre, and war hero who is currently male but will be changed to female.
@@ -67,44 +55,39 @@ Your task: Identify EVERY reference to John Shepard in the text. This includes:
 - Pronouns after John Shepard's dialogue typically refer to Shepard
 - Use narrative context and proximity to determine referents
 
+The text is split into numbered paragraphs, each starting with its id: [P0], [P1], ...
+Paragraphs marked [context] only surround the numbered ones, for reference: never report references or edits in them.
+
 For each reference, provide:
-1. The phrase with surrounding context (10-20 words on each side)
-2. The specific word(s) that refer to Shepard
-3. Your confidence this refers to Shepard (high/medium/low)
-
-Return as JSON array:
-[
-  {
-    "context": "longer phrase with context",
-    "reference": "the specific word(s)",
-    "confidence": "high/medium/low",
-    "explanation": "why this refers to Shepard"
-  }
-]
+1. The paragraph id number
+2. The specific word(s) that refer to Shepard, exactly as written
+3. Which occurrence of those word(s) in that paragraph it is (1 for the first; count whole-word matches, ignoring case)
+4. Your confidence this refers to Shepard (high/medium/low)
+
+Return as a JSON array with one compact row per reference:
+[[paragraph, "word(s)", occurrence, "high/medium/low"]]
+For example: [[0, "he", 2, "high"], [3, "John", 1, "medium"]]
 
 Return ONLY valid JSON, no other text."""
 
 # Stage 2: Generate edits
 EDIT_GENERATION_PROMPT = """Based on the identified references to male John Shepard, generate precise edits to make Shepard female.
 
+The text is split into numbered paragraphs, each starting with its id: [P0], [P1], ...
+Paragraphs marked [context] only surround the numbered ones, for reference: never report references or edits in them.
+Each reference is given as a row [reference_index, paragraph, "word(s)", occurrence]: the occurrence-th whole-word match (ignoring case) of the word(s) in that paragraph.
+
 **CRITICAL**: 
 - You MUST generate exactly ONE edit for EVERY reference provided
-- **DO NOT create overlapping edits** - if two references are in the same sentence/passage, create ONE edit that covers both
-- If reference N is contained within reference N+1, SKIP reference N and only edit reference N+1
+- **DO NOT create overlapping edits** - if two references are in the same phrase, create ONE edit that covers both
 - Use STRAIGHT quotes (") not curly quotes (" ")
 - Use three dots (...) not ellipsis (…)
 
-Example of what NOT to do:
-Reference 0: "A man feels the name"
-Reference 1: "A man feels the name wash over him. He hears..."
-BAD: Create separate edits for both (they overlap!)
-GOOD: Create ONE edit for reference 1 (it contains reference 0)
-
-For each reference (in the same order as provided), create an edit with:
-- "reference_index": the index number from the input list (0, 1, 2, etc.)
-- "original": unique phrase to find (include enough context to be unique, 15-30 words)
-- "replacement": the corrected version
-- "reason": brief explanation
+For each reference (in the same order as provided), create one row:
+[reference_index, paragraph, "original", occurrence, "replacement"]
+- "original": the exact text to replace, as written in that paragraph - usually just the reference word(s), or a few words when the change needs them ("this man" → "this woman")
+- occurrence: which whole-word match of "original" in that paragraph (1 for the first, ignoring case)
+- "replacement": the corrected version of "original"
 
 Rules:
 - he/him/his (John Shepard) → she/her/hers
@@ -117,11 +100,9 @@ Rules:
 
 **IMPORTANT**: 
 - Generate edits for ALL {num_refs} references provided
-- Use the "context" field from each reference to construct your "original" text
-- Include enough surrounding words to make each edit unique in the document
-- If a reference seems unclear, still generate an edit based on the context provided
+- If a reference seems unclear, still generate an edit based on the paragraph
 
-Return ONLY valid JSON array with exactly {num_refs} edits, no other text."""
+Return ONLY a valid JSON array with exactly {num_refs} rows, no other text."""
 
 # Add this new stage between identification and edit generation
 
@@ -131,8 +112,7 @@ Your task: For each identified reference with "medium" or "low" confidence, perf
 
 For the following text and identified references, determine:
 1. Is this reference actually to Shepard, or to another character?
-2. What clues in the surrounding context help determine this?
-3. Should this reference be included in edits (high confidence) or excluded (refers to someone else)?
+2. How confident is that reading, given the surrounding context?
 
 Pay special attention to:
 - Pronouns that appear far from Shepard's name
@@ -141,78 +121,203 @@ Pay special attention to:
 - Logical flow of who is performing actions
 - The romantic context (is Shepard the boyfriend/girlfriend mentioned?)
 
-For each reference, return:
-{
-  "original_reference": "the identified reference",
-  "context": "the surrounding text",
-  "refers_to_shepard": true/false,
-  "reasoning": "explanation of your determination",
-  "confidence": "high/medium/low"
-}
+The text is split into numbered paragraphs, each starting with its id: [P0], [P1], ...
+Paragraphs marked [context] only surround the numbered ones, for reference: never report references or edits in them.
+Each reference is given as a row [index, paragraph, "word(s)", occurrence]: the occurrence-th whole-word match (ignoring case) of the word(s) in that paragraph.
+
+For each reference, return one row:
+[index, refers_to_shepard, "high/medium/low"]
+where refers_to_shepard is true or false.
+
+Return ONLY a valid JSON array of rows, e.g. [[0, true, "high"], [1, false, "medium"]]."""
+
+DISAMBIGUATION_SYSTEM = (
+    "You are an expert at pronoun disambiguation.\n"
+    "Return ONLY valid JSON.\n"
+    "Do not include markdown, code fences, or explanations."
+)
+
+# Self-consistency voting: cheap samples ("vote" stage) at this temperature,
+# ties go to the larger model of the "tiebreak" stage (see src/backends.py)
+VOTE_TEMPERATURE = 0.7
+
+
+def number_paragraphs(text, spans, stale, context=()):
+    """The text every stage reads: the stale paragraphs, each prefixed with its [P<n>] id
+
+    Context paragraphs (the unchanged neighbours of stale ones) are
+    interleaved in chapter order, marked [context], so a paragraph opening
+    with a pronoun still has its antecedent.
+    """
+    numbers = {i: n for n, i in enumerate(stale)}
+    parts = []
+    for i in sorted({*stale, *context}):
+        start, end = spans[i]
+        label = f"[P{numbers[i]}]" if i in numbers else "[context]"
+        parts.append(f"{label} {text[start:end]}")
+    return '\n\n'.join(parts)
+
+def with_characters(characters):
+    """The character registry block ahead of the text, if there is one"""
+    return f"{characters}\nOnly call a reference medium or low confidence if it stays ambiguous with this list.\n\n" \
+        if characters else ''
+
+def reference_rows(references):
+    """References on the wire: one compact [index, paragraph, word(s), occurrence] row per line"""
+    return '\n'.join(json.dumps([i, r['paragraph'], r['reference'], r['occurrence']], ensure_ascii=False)
+                     for i, r in enumerate(references))
+
+def parse_rows(output_text):
+    """JSON array of rows from a model answer (code fences tolerated)"""
+    output = output_text.strip()
+    if output.startswith("```"):
+        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
+    rows = json.loads(output)
+    return [row for row in rows if isinstance(row, list)]
 
-Return ONLY valid JSON array."""
+def request_disambiguation(text, to_disambiguate, stage="disambiguate", temperature=0, characters=''):
+    """One disambiguation call over numbered text
 
-def stage1_5_disambiguate(text, references):
-    """Stage 1.5: Disambiguate tricky references"""
-    print("  Stage 1.5: Disambiguating references...")
-    
-    # Only disambiguate medium/low confidence ones
-    to_disambiguate = [r for r in references if r['confidence'] in ['medium', 'low']]
-    
-    if not to_disambiguate:
-        print("    No ambiguous references to check")
-        return references
-    
-    print(f"    Checking {len(to_disambiguate)} ambiguous references...")
-    
-    refs_summary = json.dumps(to_disambiguate, indent=2)
-    
-    response = client.responses.create(
-        model="gpt-4.1-mini",
+    Returns the model's judgements as dicts with the reference's index in
+    to_disambiguate, refers_to_shepard and confidence; malformed rows are dropped.
+    """
+    response = create_response(
+        stage,
         input=[
             {
                 "role": "system",
-                "content": (
-                    "You are an expert at pronoun disambiguation.\n"
-                    "Return ONLY valid JSON.\n"
-                    "Do not include markdown, code fences, or explanations."
-                )
+                "content": DISAMBIGUATION_SYSTEM
             },
             {
                 "role": "user",
-                "content": f"{DISAMBIGUATION_PROMPT}\n\nReferences to check:\n{refs_summary}\n\nOriginal text:\n{text}"
+                "content": (f"{DISAMBIGUATION_PROMPT}\n\nReferences to check:\n{reference_rows(to_disambiguate)}\n\n"
+                            f"{with_characters(characters)}Text:\n{text}")
             }
         ],
-        temperature=0
+        temperature=temperature
     )
     
-    output = response.output_text.strip()
-    if output.startswith("```"):
-        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
+    judgements = {}
+    for row in parse_rows(response.output_text):
+        if len(row) >= 2 and isinstance(row[0], int) and 0 <= row[0] < len(to_disambiguate) and isinstance(row[1], bool):
+            judgements[row[0]] = {'index': row[0], 'refers_to_shepard': row[1],
+                                  'confidence': row[2] if len(row) > 2 and isinstance(row[2], str) else 'medium'}
+    return list(judgements.values())
+
+def stage1_5_disambiguate(text, references, characters=''):
+    """Stage 1.5: Disambiguate tricky references"""
+    log("  Stage 1.5: Disambiguating references...")
+    
+    # Only disambiguate medium/low confidence ones
+    to_disambiguate = [r for r in references if r['confidence'] in ['medium', 'low']]
+    
+    if not to_disambiguate:
+        log("    No ambiguous references to check")
+        return references
     
-    disambiguated = json.loads(output)
+    log(f"    Checking {len(to_disambiguate)} ambiguous references...")
+    
+    try:
+        disambiguated = request_disambiguation(text, to_disambiguate, characters=characters)
+    except (json.JSONDecodeError, TypeError, IndexError, KeyError) as e:
+        # Same fallback as a failed tiebreak: keep stage 1's reading
+        log(f"    ⚠️  Disambiguation answer wasn't usable ({e}), keeping stage 1's reading")
+        return references
     
     # Update original references with disambiguation results
     high_conf_refs = [r for r in references if r['confidence'] == 'high']
     
     for d in disambiguated:
         if d['refers_to_shepard']:
+            high_conf_refs.append({**to_disambiguate[d['index']], 'confidence': d['confidence']})
+    
+    log(f"    Confirmed {len(high_conf_refs)} total references")
+    return high_conf_refs
+
+def collect_votes(judgements, count):
+    """Map each ambiguous reference (by index) to its refers_to_shepard answer
+
+    A sample abstains for the references it gave no valid judgement for.
+    """
+    votes = [None] * count
+    for d in judgements:
+        votes[d['index']] = d['refers_to_shepard']
+    return votes
+
+def stage1_5_vote(text, references, samples=5, characters=''):
+    """Stage 1.5 with self-consistency: majority vote of concurrent samples
+
+    Only medium/low confidence references are voted on. Each sample is an
+    independent "vote" call at VOTE_TEMPERATURE; references whose votes tie
+    (or where every sample abstained) get one "tiebreak" call at temperature 0;
+    their result is labelled 'low' confidence. If the tiebreak answer can't be
+    parsed, the tied references keep stage 1's reading (a Shepard reference).
+    """
+    log(f"  Stage 1.5: Disambiguating references ({samples} votes each)...")
+    
+    to_disambiguate = [r for r in references if r['confidence'] in ['medium', 'low']]
+    
+    if not to_disambiguate:
+        log("    No ambiguous references to check")
+        return references
+    
+    log(f"    Checking {len(to_disambiguate)} ambiguous references...")
+    
+    def sample(_):
+        try:
+            return request_disambiguation(text, to_disambiguate, "vote", VOTE_TEMPERATURE, characters)
+        except (json.JSONDecodeError, TypeError, IndexError):
+            return []
+    
+    with ThreadPoolExecutor(max_workers=samples) as pool:
+        ballots = [collect_votes(judgements, len(to_disambiguate)) for judgements in pool.map(sample, range(samples))]
+    
+    decisions = []
+    ties = []
+    for n in range(len(to_disambiguate)):
+        yes = sum(1 for ballot in ballots if ballot[n] is True)
+        no = sum(1 for ballot in ballots if ballot[n] is False)
+        decisions.append((yes > no, max(yes, no), yes + no))
+        if yes == no:
+            ties.append(n)
+    
+    tiebreaker = ROUTES['tiebreak'].model
+    if ties:
+        log(f"    Escalating {len(ties)} tied references to {tiebreaker}...")
+        tied_refs = [to_disambiguate[n] for n in ties]
+        try:
+            tiebreak = collect_votes(request_disambiguation(text, tied_refs, "tiebreak", 0, characters), len(ties))
+        except (json.JSONDecodeError, TypeError, IndexError) as e:
+            log(f"    ⚠️  Tiebreak answer wasn't usable ({e}), keeping stage 1's reading")
+            tiebreak = [True] * len(ties)
+            tiebreaker = "stage 1 (tiebreak failed)"
+        for n, vote in zip(ties, tiebreak):
+            decisions[n] = (vote is True, 0, 0)
+    
+    high_conf_refs = [r for r in references if r['confidence'] == 'high']
+    
+    for ref, (refers_to_shepard, agreeing, voting) in zip(to_disambiguate, decisions):
+        if refers_to_shepard:
+            tally = f"vote {agreeing}/{voting}" if voting else f"tie broken by {tiebreaker}"
             high_conf_refs.append({
-                'context': d['context'],
-                'reference': d['original_reference'],
-                'confidence': d['confidence'],
-                'explanation': d['reasoning']
+                **ref,
+                'confidence': 'low' if not voting else 'high' if agreeing == voting else 'medium',
+                'explanation': f"{ref.get('explanation', '')} ({tally})".strip()
             })
     
-    print(f"    Confirmed {len(high_conf_refs)} total references")
+    log(f"    Confirmed {len(high_conf_refs)} total references")
     return high_conf_refs
 
-def stage1_identify_references(text):
-    """Stage 1: Identify all references to Shepard"""
-    print("  Stage 1: Identifying Shepard references...")
+def stage1_identify_references(text, paragraph_count, characters=''):
+    """Stage 1: Identify all references to Shepard in numbered text
+
+    Each reference is addressed as (paragraph, word(s), occurrence); rows
+    pointing outside the text are dropped.
+    """
+    log("  Stage 1: Identifying Shepard references...")
     
-    response = client.responses.create(
-        model="gpt-4.1-mini",
+    response = create_response(
+        "identify",
         input=[
             {
                 "role": "system",
@@ -224,44 +329,35 @@ def stage1_identify_references(text):
             },
             {
                 "role": "user",
-                "content": f"{IDENTIFICATION_PROMPT}\n\nText:\n{text}"
+                "content": f"{IDENTIFICATION_PROMPT}\n\n{with_characters(characters)}Text:\n{text}"
             }
         ],
         temperature=0
     )
     
-    output = response.output_text.strip()
-    
-    # Defensive cleanup (rare, but safe)
-    if output.startswith("```"):
-        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
-    
-    references = json.loads(output)
-    print(f"    Found {len(references)} references")
+    references = []
+    for row in parse_rows(response.output_text):
+        if len(row) >= 4 and isinstance(row[0], int) and 0 <= row[0] < paragraph_count \
+                and isinstance(row[1], str) and isinstance(row[2], int) and row[2] >= 1:
+            references.append({'paragraph': row[0], 'reference': row[1], 'occurrence': row[2],
+                               'confidence': str(row[3]), 'explanation': ''})
+    log(f"    Found {len(references)} references")
     
     # Filter to high/medium confidence
     filtered = [r for r in references if r['confidence'] in ['high', 'medium']]
-    print(f"    {len(filtered)} are high/medium confidence")
+    log(f"    {len(filtered)} are high/medium confidence")
     
     return filtered
 
-def stage2_generate_edits(text, references):
-    """Stage 2: Generate specific edits based on identified references"""
-    print("  Stage 2: Generating edits...")
+def stage2_generate_edits(text, references, characters=''):
+    """Stage 2: Generate edits for the identified references, addressed like them"""
+    log("  Stage 2: Generating edits...")
     
     num_refs = len(references)
-    references_summary = json.dumps(references, indent=2)
-    
-    # Add index to each reference for tracking
-    indexed_refs = [
-        {**ref, "index": i} 
-        for i, ref in enumerate(references)
-    ]
-    
     prompt = EDIT_GENERATION_PROMPT.format(num_refs=num_refs)
     
-    response = client.responses.create(
-        model="gpt-4.1-mini",
+    response = create_response(
+        "edits",
         input=[
             {
                 "role": "system",
@@ -274,241 +370,306 @@ def stage2_generate_edits(text, references):
             },
             {
                 "role": "user",
-                "content": f"{prompt}\n\nIdentified references:\n{json.dumps(indexed_refs, indent=2)}\n\nOriginal text:\n{text}"
+                "content": (f"{prompt}\n\nIdentified references:\n{reference_rows(references)}\n\n"
+                            f"{with_characters(characters)}Text:\n{text}")
             }
         ],
         temperature=0
     )
     
-    output = response.output_text.strip()
-    
-    if output.startswith("```"):
-        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
-    
-    edits = json.loads(output)
+    edits = []
+    for row in parse_rows(response.output_text):
+        if len(row) >= 5 and all(isinstance(v, int) for v in (row[0], row[1], row[3])) \
+                and isinstance(row[2], str) and isinstance(row[4], str):
+            edits.append({'reference_index': row[0], 'paragraph': row[1], 'original': row[2],
+                          'occurrence': row[3], 'replacement': row[4]})
     
     # Verify we got the right number
     if len(edits) != num_refs:
-        print(f"    ⚠️  WARNING: Expected {num_refs} edits, got {len(edits)}")
-        print(f"    Missing edits for references: {set(range(num_refs)) - {e.get('reference_index', -1) for e in edits}}")
+        log(f"    ⚠️  WARNING: Expected {num_refs} edits, got {len(edits)}")
+        log(f"    Missing edits for references: {set(range(num_refs)) - {e['reference_index'] for e in edits}}")
     else:
-        print(f"    ✓ Generated all {len(edits)} edits")
+        log(f"    ✓ Generated all {len(edits)} edits")
     
     return edits
 
 
+# Common unicode variants and their ASCII equivalents
+UNICODE_REPLACEMENTS = {
+    '\u201c': '"',  # Left double quote
+    '\u201d': '"',  # Right double quote
+    '\u2018': "'",  # Left single quote
+    '\u2019': "'",  # Right single quote
+    '\u2026': '...',  # Ellipsis
+    '\u2013': '-',  # En dash
+    '\u2014': '--', # Em dash
+    '\xa0': ' ',    # Non-breaking space
+    '\u202f': ' ',  # Narrow no-break space
+    '\u2009': ' ',  # Thin space
+}
+
 def normalize_text(text):
     """Normalize unicode characters, whitespace, and newlines for matching"""
     # Normalize unicode (NFC form)
     text = unicodedata.normalize('NFC', text)
     
-    # Replace common unicode variants with ASCII equivalents
-    replacements = {
-        '\u201c': '"',  # Left double quote
-        '\u201d': '"',  # Right double quote
-        '\u2018': "'",  # Left single quote
-        '\u2019': "'",  # Right single quote
-        '\u2026': '...',  # Ellipsis
-        '\u2013': '-',  # En dash
-        '\u2014': '--', # Em dash
-        '\xa0': ' ',    # Non-breaking space
-        '\u202f': ' ',  # Narrow no-break space
-        '\u2009': ' ',  # Thin space
-    }
-    
-    for old, new in replacements.items():
+    for old, new in UNICODE_REPLACEMENTS.items():
         text = text.replace(old, new)
     
     return text
 
-def normalize_whitespace(text):
-    """Normalize all whitespace to single spaces, preserve structure"""
-    # Replace all whitespace (spaces, tabs, newlines) with single space
-    # But keep paragraph breaks (multiple newlines) as single newline
-    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces/tabs -> single space
-    text = re.sub(r'\n\n+', '\n\n', text)  # Multiple newlines -> double newline
-    return text.strip()
-
-def apply_edits_robust(text, edits):
-    """Apply edits with normalization, flexible whitespace matching, and overlap handling"""
-    applied = 0
-    skipped = 0
+def normalize_text_with_offsets(text):
+    """Like normalize_text, but also return where each normalized character came from
+
+    Replacements such as "\u2026" -> "..." change the length of the text, so
+    positions found in the normalized text must be mapped back through
+    offsets[i] (original index of normalized character i) before editing the
+    original. offsets has one extra entry for the end of the text.
+    """
+    parts = []
+    offsets = []
+    for i, ch in enumerate(text):
+        replacement = UNICODE_REPLACEMENTS.get(ch, ch)
+        parts.append(replacement)
+        offsets.extend([i] * len(replacement))
+    offsets.append(len(text))
+    return ''.join(parts), offsets
+
+def to_original_span(offsets, start, end):
+    """Map a [start, end) span in normalized text back to the original text"""
+    original_end = offsets[end - 1] + 1 if end > start else offsets[start]
+    return offsets[start], original_end
+
+def find_occurrence(paragraph, phrase, occurrence):
+    """Exact [start, end) of the occurrence-th whole-word, case-insensitive match of phrase
+
+    Matching is done on normalized text (curly quotes, ellipses, ...), so a
+    phrase quoted with straight quotes still lands on the original characters.
+    Returns None if there is no such occurrence.
+    """
+    normalized, offsets = normalize_text_with_offsets(paragraph)
+    pattern = re.compile(rf'(?<!\w){re.escape(normalize_text(phrase))}(?!\w)', re.IGNORECASE)
+    for n, match in enumerate(pattern.finditer(normalized), 1):
+        if n == occurrence:
+            return to_original_span(offsets, match.start(), match.end())
+    return None
+
+def locate_edits(paragraphs, edits):
+    """Place each edit in its paragraph, dropping unplaceable and overlapping ones
+
+    Returns (located, failed_edits); located holds (paragraph, start, end, edit)
+    with offsets relative to the paragraph. Of two overlapping edits, the one
+    for the earlier reference is kept.
+    """
+    located = []
     failed_edits = []
     
-    # First pass: Find all match positions without applying
-    edit_positions = []
-    normalized_text = normalize_text(text)
-    
-    for idx, edit in enumerate(edits):
-        original = edit["original"]
-        normalized_original = normalize_text(original)
-        ref_idx = edit.get('reference_index', idx)
-        
-        position = find_match_position(text, normalized_text, normalized_original)
-        
-        if position is not None:
-            edit_positions.append({
-                'index': idx,
-                'position': position['start'],
-                'end': position['end'],
-                'edit': edit,
-                'ref_idx': ref_idx
-            })
-        else:
-            print(f"    ⚠️  Failed to match (ref {ref_idx}): '{original[:50]}...'")
-            failed_edits.append({
-                'reference_index': ref_idx,
-                'original': original,
-                'replacement': edit['replacement'],
-                'reason': edit.get('reason', 'unknown')
-            })
-            skipped += 1
-    
-    # Sort by position (REVERSE order so we apply from end to start)
-    # This prevents position shifts from affecting later edits
-    edit_positions.sort(key=lambda x: x['position'], reverse=True)
-    
-    # Check for overlaps
-    for i in range(len(edit_positions) - 1):
-        current = edit_positions[i]
-        next_edit = edit_positions[i + 1]
-        
-        if current['position'] < next_edit['end']:
-            print(f"    ⚠️  Overlap detected between ref {current['ref_idx']} and {next_edit['ref_idx']}")
-            # Keep the earlier one (lower ref_idx), skip the later one
-            if current['ref_idx'] > next_edit['ref_idx']:
-                failed_edits.append({
-                    'reference_index': current['ref_idx'],
-                    'original': current['edit']['original'],
-                    'replacement': current['edit']['replacement'],
-                    'reason': f"Overlaps with edit {next_edit['ref_idx']}"
-                })
-                edit_positions[i] = None
-                skipped += 1
-            else:
-                failed_edits.append({
-                    'reference_index': next_edit['ref_idx'],
-                    'original': next_edit['edit']['original'],
-                    'replacement': next_edit['edit']['replacement'],
-                    'reason': f"Overlaps with edit {current['ref_idx']}"
-                })
-                edit_positions[i + 1] = None
-                skipped += 1
-    
-    # Remove skipped edits
-    edit_positions = [e for e in edit_positions if e is not None]
-    
-    # Apply edits from end to start (so positions don't shift)
-    for edit_pos in edit_positions:
-        edit = edit_pos['edit']
-        start = edit_pos['position']
-        end = edit_pos['end']
-        
-        normalized_replacement = normalize_text(edit['replacement'])
-        
-        text = text[:start] + normalized_replacement + text[end:]
-        applied += 1
-    
-    print(f"    Applied {applied} edits, skipped {skipped}")
-    
-    return text, failed_edits
+    for edit in edits:
+        span = None
+        if 0 <= edit['paragraph'] < len(paragraphs):
+            span = find_occurrence(paragraphs[edit['paragraph']], edit['original'], edit['occurrence'])
+        if span is None:
+            log(f"    ⚠️  Failed to place (ref {edit['reference_index']}): '{edit['original'][:50]}' "
+                f"#{edit['occurrence']} in paragraph {edit['paragraph']}")
+            failed_edits.append({**edit, 'reason': 'No such occurrence in the paragraph'})
+            continue
+        located.append((edit['paragraph'], *span, edit))
+    
+    located.sort(key=lambda e: (e[0], e[1]))
+    kept = []
+    for current in located:
+        previous = kept[-1] if kept else None
+        if previous is None or previous[0] != current[0] or current[1] >= previous[2]:
+            kept.append(current)
+            continue
+        log(f"    ⚠️  Overlap detected between ref {previous[3]['reference_index']} and {current[3]['reference_index']}")
+        if current[3]['reference_index'] < previous[3]['reference_index']:
+            kept[-1], current = current, previous
+        failed_edits.append({**current[3], 'reason': f"Overlaps with edit {kept[-1][3]['reference_index']}"})
+    
+    return kept, failed_edits
+
+def apply_positioned_edits(text, edit_positions):
+    """Apply located edits from the end of the text to the start (so positions don't shift)"""
+    for edit_pos in sorted(edit_positions, key=lambda e: e['position'], reverse=True):
+        normalized_replacement = normalize_text(edit_pos['edit']['replacement'])
+        text = text[:edit_pos['position']] + normalized_replacement + text[edit_pos['end']:]
+    return text
 
-def find_match_position(text, normalized_text, normalized_original):
-    """Find match position using various strategies, return start/end positions"""
+def resolve_stale_paragraphs(text, spans, stale, coref_index, votes=0, characters=''):
+    """Run stages 1, 1.5 and 2 on only the stale paragraphs and store the results
+
+    The stages read the stale paragraphs numbered [P0], [P1], ..., with their
+    unchanged neighbours as [context], and address references and edits as
+    (paragraph, word(s), occurrence), so placement is
+    exact. With votes > 1, stage 1.5 uses self-consistency voting instead of
+    one call. characters is the registry block sent with every request.
+    Paragraphs with a reference that couldn't be placed, a missing edit or
+    an edit that failed are stored unresolved, so the next run retries them.
+    Returns the edits that couldn't be placed.
+    """
+    paragraphs = [text[spans[i][0]:spans[i][1]] for i in stale]
+    stale_set = set(stale)
+    context = [j for j in sorted({j for i in stale for j in (i - 1, i + 1)})
+               if 0 <= j < len(spans) and j not in stale_set and text[spans[j][0]:spans[j][1]].strip()]
+    numbered = number_paragraphs(text, spans, stale, context)
+    log(f"  Resolving {len(stale)}/{len(spans)} new or edited paragraphs ({len(numbered)} chars)...")
+    
+    # Stage 1: Identify references
+    references = stage1_identify_references(numbered, len(paragraphs), characters)
+    
+    # Stage 1.5: Disambiguate medium/low confidence references
+    if votes > 1:
+        references = stage1_5_vote(numbered, references, votes, characters)
+    else:
+        references = stage1_5_disambiguate(numbered, references, characters)
     
-    # Try 1: Exact match on normalized text
-    if normalized_text.count(normalized_original) == 1:
-        pos = normalized_text.find(normalized_original)
-        return {'start': pos, 'end': pos + len(normalized_original)}
+    # Stage 2: Generate edits
+    edits = stage2_generate_edits(numbered, references, characters) if references else []
     
-    # Try 2: Whitespace-flexible matching
-    original_ws_norm = normalize_whitespace(normalized_original)
-    pattern_parts = re.escape(original_ws_norm).split(r'\ ')
-    pattern = r'\s+'.join(pattern_parts)
+    mentions_by_para = [[] for _ in stale]
+    edits_by_para = [[] for _ in stale]
+    unresolved = set()
     
-    matches = list(re.finditer(pattern, normalized_text, re.DOTALL))
+    for ref in references:
+        n = ref['paragraph']
+        span = find_occurrence(paragraphs[n], ref['reference'], ref['occurrence'])
+        if span is None:
+            log(f"    ⚠️  Could not place reference '{ref['reference']}' #{ref['occurrence']} in paragraph {n}")
+            unresolved.add(n)
+            continue
+        start, end = span
+        mentions_by_para[n].append({
+            'start': start,
+            'end': end,
+            'text': paragraphs[n][start:end],
+            'referent': 'shepard',
+            'confidence': ref['confidence'],
+            'explanation': ref.get('explanation', ''),
+        })
+    
+    located, failed_edits = locate_edits(paragraphs, edits)
+    for n, start, end, edit in located:
+        edits_by_para[n].append({
+            'start': start,
+            'end': end,
+            'original': paragraphs[n][start:end],
+            'replacement': edit['replacement'],
+        })
+    
+    # A reference without an edit, or whose edit failed, leaves its paragraph unresolved
+    edited = {edit['reference_index'] for edit in edits}
+    unresolved.update(ref['paragraph'] for k, ref in enumerate(references) if k not in edited)
+    for edit in failed_edits:
+        if 0 <= edit['paragraph'] < len(paragraphs):
+            unresolved.add(edit['paragraph'])
+        elif 0 <= edit['reference_index'] < len(references):
+            unresolved.add(references[edit['reference_index']]['paragraph'])
+    if unresolved:
+        log(f"    ⚠️  {len(unresolved)} paragraphs left unresolved, they will be retried next run")
+    
+    # Store every stale paragraph, including ones with nothing to change, so
+    # the next run skips the resolved ones
+    for n, i in enumerate(stale):
+        coref_index.store(text, spans, i, mentions_by_para[n], edits_by_para[n], n not in unresolved)
+    
+    return failed_edits
+
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Regender a directory of chapters with located edits")
+    parser.add_argument("input_dir", nargs="?", default="inputs/rekindling", help="Directory of chapter .txt files")
+    parser.add_argument("--votes", type=int, default=0,
+                        help="Disambiguate with N concurrent samples and a majority vote (ties go to a larger model)")
+    parser.add_argument("--no-registry", action="store_true", help="Don't build or send the character registry")
+    parser.add_argument("--refresh-registry", action="store_true", help="Rebuild the character registry")
+    parser.add_argument("--progress", choices=PROGRESS_MODES, default="auto",
+                        help="json: one JSON event per line on stdout (see src/progress.py)")
+    args = parser.parse_args()
+    progress.set_mode(args.progress)
+    input_dir = Path(args.input_dir)
     
-    if len(matches) == 1:
-        match = matches[0]
-        return {'start': match.start(), 'end': match.end()}
+    # Derive output directory from input directory name
+    input_name = input_dir.name
+    output_dir = Path("outputs") / input_name
+    analysis_dir = Path("outputs/analysis_log")
     
-    # Try 3: Line-break agnostic (more complex, similar to before)
-    original_no_newlines = re.sub(r'\s+', ' ', normalized_original)
-    text_no_newlines = re.sub(r'\s+', ' ', normalized_text)
+    # Create directories
+    output_dir.mkdir(exist_ok=True, parents=True)
+    analysis_dir.mkdir(exist_ok=True, parents=True)
     
-    if text_no_newlines.count(original_no_newlines) == 1:
-        # Find approximate position
-        approx_pos = text_no_newlines.find(original_no_newlines)
+    log(f"Input directory: {input_dir}")
+    log(f"Output directory: {output_dir}")
+    log(f"Analysis logs: {analysis_dir}")
+    
+    # Same natural order as v2 and the export scripts (ch1, ch2, ..., ch10)
+    chapter_index = ChapterIndex.load(input_dir)
+    characters = '' if args.no_registry else registry_block(load_registry(input_name, chapter_index, args.refresh_registry))
+    # Stored resolutions only hold for the prompts and registry they came from
+    index_namespace = paragraph_hash('\0'.join([IDENTIFICATION_PROMPT, DISAMBIGUATION_PROMPT,
+                                                 EDIT_GENERATION_PROMPT, characters]))
+    progress.start(len(chapter_index), "chapters", input_name)
+
+    for i, entry in enumerate(chapter_index, 1):
+        progress.item_start(entry.relpath)
+        log(f"\n{'='*60}")
+        log(f"Processing {entry.relpath} ({i}/{len(chapter_index)})")
+        log('='*60)
         
-        # Map back to real position (accounting for whitespace differences)
-        real_start = map_position_with_whitespace(normalized_text, text_no_newlines, approx_pos)
-        real_end = real_start + len(normalized_original)
+        with span("read", chapter=entry.relpath), open(chapter_index.path(entry), 'r', encoding='utf-8') as f:
+            text = f.read()
         
-        return {'start': real_start, 'end': real_end}
-    
-    return None
-
-def map_position_with_whitespace(original_text, collapsed_text, collapsed_pos):
-    """Map position in whitespace-collapsed text back to original text"""
-    orig_idx = 0
-    collapsed_idx = 0
-    
-    while collapsed_idx < collapsed_pos and orig_idx < len(original_text):
-        if original_text[orig_idx].isspace():
-            # Skip whitespace in original, it's collapsed in the other
-            if collapsed_idx < len(collapsed_text) and collapsed_text[collapsed_idx] == ' ':
-                collapsed_idx += 1
-            orig_idx += 1
-        else:
-            orig_idx += 1
-            collapsed_idx += 1
-    
-    return orig_idx
-
-    for i, chapter_file in enumerate(chapter_files, 1):
-        if i == 1:
-            continue
-        print(f"\n{'='*60}")
-        print(f"Processing {chapter_file.name} ({i}/{len(chapter_files)})")
-        print('='*60)
+        # Only paragraphs that are new or changed since the last run go to the API
+        coref_index = CorefIndex.load(analysis_dir / f"{entry.slug}_coref.json", index_namespace)
+        spans = paragraph_spans(text)
+        stale = coref_index.stale_paragraphs(text, spans)
         
-        with open(chapter_file, 'r', encoding='utf-8') as f:
-            text = f.read()
+        failed_edits = []
+        if stale:
+            with span("resolve", chapter=entry.relpath, paragraphs=len(stale)):
+                failed_edits = resolve_stale_paragraphs(text, spans, stale, coref_index, args.votes, characters)
+        else:
+            log("  All paragraphs already resolved, reusing the coreference index")
         
-        # Stage 1: Identify references
-        references = stage1_identify_references(text)
+        coref_index.prune(text, spans)
+        coref_index.save()
         
-        # Save references for review
-        with open(analysis_dir / f"{chapter_file.stem}_references.json", 'w') as f:
+        # Save references and edits for review
+        references = coref_index.chapter_records(text, spans, 'mentions')
+        with open(analysis_dir / f"{entry.slug}_references.json", 'w') as f:
             json.dump(references, f, indent=2)
         
-        # Stage 2: Generate edits
-        edits = stage2_generate_edits(text, references)
-        
-        # Save edits for review
-        with open(analysis_dir / f"{chapter_file.stem}_edits.json", 'w') as f:
+        edits = coref_index.chapter_records(text, spans, 'edits')
+        with open(analysis_dir / f"{entry.slug}_edits.json", 'w') as f:
             json.dump(edits, f, indent=2)
-
-        with open(analysis_dir / f"{chapter_file.stem}_edits.json", 'r') as f:
-            edits = json.load(f)
         
-        # Apply edits with robust matching
-        print("  Applying edits...")
-        edited_text, failed_edits = apply_edits_robust(text, edits)
+        # Apply the indexed edits at their exact offsets
+        log("  Applying edits...")
+        with span("apply", chapter=entry.relpath, edits=len(edits)):
+            edited_text = apply_positioned_edits(text, [{'position': e['start'], 'end': e['end'], 'edit': e} for e in edits])
+        log(f"    Applied {len(edits)} edits")
         
-        # Save failed edits if any
+        # Save this run's failed edits; a clean run removes an earlier run's file
+        failed_path = analysis_dir / f"{entry.slug}_failed_edits.json"
         if failed_edits:
-            with open(analysis_dir / f"{chapter_file.stem}_failed_edits.json", 'w') as f:
+            with open(failed_path, 'w') as f:
                 json.dump(failed_edits, f, indent=2)
+        else:
+            failed_path.unlink(missing_ok=True)
         
         # Save result
-        output_file = output_dir / chapter_file.name
-        with open(output_file, 'w', encoding='utf-8') as f:
+        output_file = output_dir / entry.relpath
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+        with span("write", chapter=entry.relpath), open(output_file, 'w', encoding='utf-8') as f:
             f.write(edited_text)
         
-        print(f"✓ Saved to {output_file}")
-
-    print(f"\n{'='*60}")
-    print(f"Done! Processed {len(chapter_files)} chapters.")
-    print(f"Review analysis files in '{analysis_dir}/' for any failed edits")
-    print('='*60)
\ No newline at end of file
+        log(f"✓ Saved to {output_file}")
+        progress.item_done(entry.relpath, stale_paragraphs=len(stale), edits=len(edits),
+                           failed_edits=len(failed_edits))
+
+    progress.finish()
+    log(f"\n{'='*60}")
+    log(f"Done! Processed {len(chapter_index)} chapters.")
+    log(f"Review analysis files in '{analysis_dir}/' for any failed edits")
+    log('='*60)
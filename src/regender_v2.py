@@ -7,27 +7,53 @@
 #
 # USAGE:
 #   From the project root directory:
-#     python src/regender_v2.py [input_directory]
+#     python src/regender_v2.py [input_directory] [--parallel-chunks] [--hedge [BUDGET]] [--memory [PATH]] [--spec FILE]
 #
 #   Examples:
 #     python src/regender_v2.py                      # Uses default: inputs/adamo
 #     python src/regender_v2.py inputs/rekindling    # Process rekindling chapters
 #     python src/regender_v2.py inputs/custom        # Process custom directory
+#     python src/regender_v2.py inputs/adamo --parallel-chunks   # Long chapters: summary, then all chunks at once
+#     python src/regender_v2.py inputs/adamo --hedge 0.1         # Duplicate stragglers, up to 10% extra tokens
+#     python src/regender_v2.py inputs/adamo --spec specs/shepard_female.json   # Several characters in one pass
+#     python src/regender_v2.py inputs/adamo --memory            # Reuse translated paragraphs
 #
 #   Output will be saved to outputs/{directory_name}/
+#   Paragraphs still flagged with male pronouns near Shepard get one targeted retry
+#   Answers cut off at the output limit are continued from the last whole paragraph,
+#   and the model's chunk size is lowered for later chapters (outputs/.model_tuning.json);
+#   it grows back after a run of answers that weren't cut off
+#   The book's characters are listed once in outputs/{directory_name}.characters.json
+#   and sent with every request (see src/character_registry.py; --no-registry to skip)
+#   With --memory, paragraphs of chapters that pass verification are kept in
+#   outputs/translation_memory.sqlite and reused wherever the same paragraph
+#   appears in the same context (long chapters then translate only the misses)
+#   Patches (see src/patches.py) will be saved to outputs/patches/{directory_name}/
 #   Verification logs will be saved to outputs/verification_log/
+#   Token usage (and hedging overhead) will be saved to outputs/usage_report.json
+#   --progress json prints one JSON event per line instead of the log (see src/progress.py)
+#   Set TRACE_FILE to also record a timing trace (see src/tracing.py)
+#   Set LLM_CASSETTE to record the model calls, or replay them offline (see src/cassette.py)
 ####### 
 
-from openai import OpenAI
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import argparse
+import json
 import re
-import os
-import sys
-from dotenv import load_dotenv
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from chapter_index import ChapterIndex
+from character_registry import load_registry, registry_block
+from backends import route_for
+from limiter import chunk_budget, grow_chunk_budget, reduce_chunk_budget
+from llm import create_response, enable_hedging, is_truncated, stage_model, DEFAULT_HEDGE_BUDGET
+from progress import MODES as PROGRESS_MODES, log, progress
+from patches import make_patch, save_patch, patch_path
+from scanning import ChapterScan
+from tracing import span
+from transform_spec import compile_prompt, describe_rules, load_spec, verification_rules
+from translation_memory import TranslationMemory, paragraph_key, DEFAULT_PATH as MEMORY_PATH
+from verify import verify_translation
 
 
 TRANSLATION_PROMPT = """Transform this text to make the protagonist "John Shepard" female instead of male.
@@ -71,12 +97,35 @@ Sometimes the change creates repeated pronouns, for example: "Several minutes pa
 
 Return ONLY the transformed text, nothing else."""
 
-def translate_chapter(text):
-    """Send entire chapter and get back translated version"""
-    print("  Sending text for translation...")
+# Characters of input per request, until a model's answers get cut off
+# (see limiter.chunk_budget)
+DEFAULT_CHUNK_SIZE = 12000
+
+CONTEXT_PROMPT = """This chapter will be split into excerpts that are edited independently, without seeing each other. The start of each excerpt is marked [[CHUNK n]].
+
+For every excerpt, write a short "who is who" note for an editor who only sees that excerpt:
+- which characters are present in the scene at that point
+- who the male pronouns (he/him/his) near the start of the excerpt refer to, especially whether they mean Shepard
+
+Return ONLY a JSON array with one object per excerpt, in order:
+[{"chunk": 0, "context": "one to three sentences"}]"""
+
+def translate_chapter(text, context=None, prompt=TRANSLATION_PROMPT):
+    """Send entire chapter and get back translated version
+
+    context is an optional note about the surrounding story (see
+    build_chunk_contexts), sent ahead of the text and not part of the output.
+    prompt is replaced by a compiled transformation spec when one is given.
+    """
+    log("  Sending text for translation...")
     
-    response = client.responses.create(
-        model="gpt-4.1",  # Use full GPT-4.1 for longer context and better quality
+    content = f"{prompt}\n\n{text}"
+    if context:
+        content = (f"{prompt}\n\nContext from the rest of the chapter "
+                   f"(for reference only, do not include it in your output): {context}\n\nText:\n\n{text}")
+    
+    response = create_response(
+        "translate",  # Full GPT-4.1 by default, for longer context and better quality
         input=[
             {
                 "role": "system",
@@ -88,108 +137,427 @@ def translate_chapter(text):
             },
             {
                 "role": "user",
-                "content": f"{TRANSLATION_PROMPT}\n\n{text}"
+                "content": content
             }
         ],
         temperature=0
     )
     
     translated_text = response.output_text
+    if is_truncated(response):
+        translated_text = continue_truncated(text, translated_text, context, prompt)
+    else:
+        model = stage_model("translate")
+        budget = grow_chunk_budget(model, len(text), DEFAULT_CHUNK_SIZE)
+        if budget:
+            log(f"    Answers complete again, chunk size for {model} back up to {budget}")
     
-    print(f"  Received {len(translated_text)} characters (original: {len(text)})")
+    log(f"  Received {len(translated_text)} characters (original: {len(text)})")
     
     # Sanity check - warn if length changed dramatically
     length_ratio = len(translated_text) / len(text)
     if length_ratio < 0.9 or length_ratio > 1.1:
-        print(f"    ⚠️  WARNING: Length changed by {(length_ratio - 1) * 100:.1f}%")
+        log(f"    ⚠️  WARNING: Length changed by {(length_ratio - 1) * 100:.1f}%")
     
     return translated_text
 
-def translate_chapter_chunked(text, chunk_size=12000):
-    """Translate long chapters in overlapping chunks"""
-    
-    if len(text) < chunk_size:
-        return translate_chapter(text)
+def translation_chunk_size():
+    """Current chunk budget of the translate model"""
+    return chunk_budget(stage_model("translate"), DEFAULT_CHUNK_SIZE)
+
+def excerpt_context(context, previous):
+    """Context for a later part of a cut-off translation: the chunk's note plus the paragraph before it"""
+    note = f"Paragraph before this excerpt: {previous}"
+    return f"{context}\n\n{note}" if context else note
+
+def continue_truncated(text, partial, context=None, prompt=TRANSLATION_PROMPT):
+    """Finish a translation the model cut off at its output limit
+
+    The unfinished last paragraph of the answer is dropped and only the
+    source paragraphs after the finished ones are sent again, so the two
+    parts join at a paragraph boundary. Later chunks for the model are kept
+    under what it managed to finish.
+    """
+    paragraphs = text.split('\n\n')
+    finished = partial.split('\n\n')[:-1]
+    model = stage_model("translate")
     
-    print(f"  Chapter is long ({len(text)} chars), using chunked approach...")
+    if not finished or len(finished) >= len(paragraphs):
+        # No usable paragraph boundary: translate the two halves separately
+        if len(paragraphs) < 2:
+            log("    ⚠️  Output cut off inside a single paragraph, keeping the partial translation")
+            return partial
+        half = len(paragraphs) // 2
+        budget = reduce_chunk_budget(model, len('\n\n'.join(paragraphs[:half])), DEFAULT_CHUNK_SIZE)
+        log(f"    ⚠️  Output cut off, translating in two halves (chunk size for {model} now {budget})")
+        first = translate_chapter('\n\n'.join(paragraphs[:half]), context, prompt)
+        second = translate_chapter('\n\n'.join(paragraphs[half:]),
+                                   excerpt_context(context, paragraphs[half - 1]), prompt)
+        return first.strip('\n') + '\n\n' + second.strip('\n')
     
-    # Split into paragraphs
+    done = len(finished)
+    budget = reduce_chunk_budget(model, len('\n\n'.join(paragraphs[:done])), DEFAULT_CHUNK_SIZE)
+    log(f"    ⚠️  Output cut off after {done}/{len(paragraphs)} paragraphs, continuing "
+        f"(chunk size for {model} now {budget})")
+    remainder = translate_chapter('\n\n'.join(paragraphs[done:]),
+                                  excerpt_context(context, paragraphs[done - 1]), prompt)
+    return '\n\n'.join(finished) + '\n\n' + remainder.strip('\n')
+
+RETRY_PROMPT = """Some paragraphs of a chapter were transformed to make "John Shepard" female, but a male pronoun (he/him/his) may still refer to Shepard in them.
+
+Each paragraph to redo is given in its ORIGINAL form between [[P<n>]] and [[/P<n>]] markers, with the flagged sentence of the previous attempt and the already-transformed neighbouring paragraphs as context.
+
+Apply the same rules as before: only Shepard becomes female (she/her/hers, John -> Jane, man -> woman, ...), other characters keep their gender, and everything else stays exactly as written.
+
+Return every paragraph between the same [[P<n>]] and [[/P<n>]] markers, and nothing else."""
+
+RETRY_SPEC_PROMPT = """Some paragraphs of a chapter were transformed with the rules below, but a pronoun of a character's former gender may still refer to them.
+
+Each paragraph to redo is given in its ORIGINAL form between [[P<n>]] and [[/P<n>]] markers, with the flagged sentence of the previous attempt and the already-transformed neighbouring paragraphs as context.
+
+Apply the same rules as before, and keep everything else exactly as written:
+
+{rules}
+
+Return every paragraph between the same [[P<n>]] and [[/P<n>]] markers, and nothing else."""
+
+RETRY_BLOCK_RE = re.compile(r'\[\[P(\d+)\]\]\n?(.*?)\n?\[\[/P\1\]\]', re.DOTALL)
+
+
+def retry_flagged_paragraphs(text, translated_text, spec=None):
+    """Re-translate only the paragraphs with a male pronoun near Shepard and splice them back
+
+    Much cheaper than redoing the chapter: the request holds the flagged
+    paragraphs plus one neighbour on each side as context. Needs the
+    translation to have kept the paragraph structure, otherwise the
+    translation is returned unchanged. With a transformation spec, every
+    character is checked for pronouns of their former gender instead.
+    """
+    scan = ChapterScan(translated_text)
+    if spec is None:
+        flagged = scan.locate_flagged_pronouns()
+        prompt = RETRY_PROMPT
+    else:
+        flagged = [hit for rule in verification_rules(spec)
+                   for hit in scan.locate_flagged_pronouns(rule['anchor'], rule['residual_pronouns'])]
+        prompt = RETRY_SPEC_PROMPT.format(rules=describe_rules(spec))
+    if not flagged:
+        return translated_text
+
+    original_paragraphs = text.split('\n\n')
+    translated_paragraphs = translated_text.split('\n\n')
+    if len(original_paragraphs) != len(translated_paragraphs):
+        log("    ⚠️  Paragraph count changed, can't target a retry")
+        return translated_text
+
+    sentences = {}
+    for hit in flagged:
+        sentences.setdefault(hit['paragraph'], []).append(hit['sentence'])
+
+    blocks = []
+    for n, flagged_sentences in sentences.items():
+        before = translated_paragraphs[n - 1] if n > 0 else ''
+        after = translated_paragraphs[n + 1] if n + 1 < len(translated_paragraphs) else ''
+        blocks.append(
+            f"Context before:\n{before}\n\n"
+            f"Flagged in previous attempt: {' / '.join(flagged_sentences)}\n\n"
+            f"[[P{n}]]\n{original_paragraphs[n]}\n[[/P{n}]]\n\n"
+            f"Context after:\n{after}"
+        )
+
+    log(f"  Retrying {len(sentences)} flagged paragraphs ({len(flagged)} pronouns)...")
+    response = create_response(
+        "retry",
+        input=[
+            {"role": "system", "content": "You are a precise text editor. Return ONLY the marked paragraphs."},
+            {"role": "user", "content": prompt + "\n\n" + "\n\n---\n\n".join(blocks)}
+        ],
+        temperature=0
+    )
+
+    replaced = 0
+    for match in RETRY_BLOCK_RE.finditer(response.output_text):
+        n = int(match.group(1))
+        if n in sentences:
+            translated_paragraphs[n] = match.group(2)
+            replaced += 1
+
+    log(f"  ✓ Replaced {replaced}/{len(sentences)} paragraphs")
+    return '\n\n'.join(translated_paragraphs)
+
+
+# Hits this close together are re-sent with the misses around them, rather
+# than paying the prompt for another request
+MEMORY_GAP = 2
+
+
+def paragraph_keys(paragraphs):
+    """Translation memory key of every paragraph, with its neighbours as context"""
+    return [paragraph_key(p, paragraphs[i - 1] if i > 0 else '', paragraphs[i + 1] if i + 1 < len(paragraphs) else '')
+            for i, p in enumerate(paragraphs)]
+
+def remember_chapter(memory, text, translated_text):
+    """Store every paragraph of a finished chapter; needs the paragraph structure to be intact"""
     paragraphs = text.split('\n\n')
+    translated = translated_text.split('\n\n')
+    if len(paragraphs) != len(translated):
+        return 0
+    entries = [(key, t) for key, p, t in zip(paragraph_keys(paragraphs), paragraphs, translated) if p.strip()]
+    memory.store(entries)
+    return len(entries)
+
+def translate_with_memory(text, memory, chunk_size=None, prompt=TRANSLATION_PROMPT):
+    """Translate only the paragraphs the translation memory doesn't have
+
+    Misses are grouped into runs of neighbouring paragraphs (up to
+    chunk_size characters) and each run is sent with the paragraphs around
+    it as context, so re-chunking or a small edit costs only what changed.
+    """
+    chunk_size = chunk_size or translation_chunk_size()
+    paragraphs = text.split('\n\n')
+    keys = paragraph_keys(paragraphs)
+    content = [i for i, p in enumerate(paragraphs) if p.strip()]
+    result = list(paragraphs)
     
-    chunks = []
-    current_chunk = []
-    current_length = 0
+    missing = []
+    for i, translation in zip(content, memory.lookup([keys[i] for i in content])):
+        if translation is None:
+            missing.append(i)
+        else:
+            result[i] = translation
+    log(f"  Translation memory: {len(content) - len(missing)}/{len(content)} paragraphs reused")
+    if not missing:
+        return '\n\n'.join(result)
+    
+    # Runs of missing paragraphs, merged across small gaps and split at chunk_size
+    runs = []
+    for i in missing:
+        if runs and i - runs[-1][-1] <= MEMORY_GAP + 1 and \
+                sum(len(paragraphs[j]) for j in range(runs[-1][0], i + 1)) <= chunk_size:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    runs = [(run[0], run[-1] + 1) for run in runs]
+    progress.set_chunks(len(runs))
+    
+    def translate(run):
+        start, end = run
+        context = (f"Paragraph before this excerpt: {paragraphs[start - 1] if start > 0 else '(start of chapter)'}\n"
+                   f"Paragraph after this excerpt: {paragraphs[end] if end < len(paragraphs) else '(end of chapter)'}")
+        translated = translate_chapter('\n\n'.join(paragraphs[start:end]), context, prompt)
+        progress.chunk_done()
+        return translated
     
-    for para in paragraphs:
-        para_length = len(para)
+    with ThreadPoolExecutor(max_workers=len(runs)) as pool:
+        translations = list(pool.map(translate, runs))
+    
+    with span("stitch", chunks=len(runs)):
+        for (start, end), translated in zip(reversed(runs), reversed(translations)):
+            parts = translated.strip('\n').split('\n\n')
+            if len(parts) != end - start:
+                log(f"    ⚠️  Paragraph count changed in paragraphs {start}-{end - 1}, keeping the run as one block")
+                parts = ['\n\n'.join(parts)]
+            result[start:end] = parts
+    return '\n\n'.join(result)
+
+def translate_chapter_chunked(text, chunk_size=None, memory=None, prompt=TRANSLATION_PROMPT):
+    """Translate long chapters in overlapping chunks
+
+    With a translation memory, only paragraphs it doesn't have are sent
+    (see translate_with_memory).
+    """
+    
+    chunk_size = chunk_size or translation_chunk_size()
+    if memory is not None:
+        return translate_with_memory(text, memory, chunk_size, prompt)
+    if len(text) < chunk_size:
+        return translate_chapter(text, prompt=prompt)
+    
+    log(f"  Chapter is long ({len(text)} chars), using chunked approach...")
+    
+    with span("chunk", chars=len(text)) as args:
+        # Split into paragraphs
+        paragraphs = text.split('\n\n')
         
-        if current_length + para_length > chunk_size and current_chunk:
-            # Save current chunk
-            chunks.append('\n\n'.join(current_chunk))
-            # Start new chunk with overlap (last 2 paragraphs)
-            current_chunk = current_chunk[-2:] if len(current_chunk) > 2 else []
-            current_length = sum(len(p) for p in current_chunk)
+        chunks = []
+        current_chunk = []
+        current_length = 0
         
-        current_chunk.append(para)
-        current_length += para_length
-    
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
+        for para in paragraphs:
+            para_length = len(para)
+            
+            if current_length + para_length > chunk_size and current_chunk:
+                # Save current chunk
+                chunks.append('\n\n'.join(current_chunk))
+                # Start new chunk with overlap (last 2 paragraphs)
+                current_chunk = current_chunk[-2:] if len(current_chunk) > 2 else []
+                current_length = sum(len(p) for p in current_chunk)
+            
+            current_chunk.append(para)
+            current_length += para_length
+        
+        if current_chunk:
+            chunks.append('\n\n'.join(current_chunk))
+        args['chunks'] = len(chunks)
     
-    print(f"  Split into {len(chunks)} chunks")
+    log(f"  Split into {len(chunks)} chunks")
+    progress.set_chunks(len(chunks))
     
     # Translate each chunk
     translated_chunks = []
     
     for idx, chunk in enumerate(chunks):
-        print(f"  Translating chunk {idx + 1}/{len(chunks)}...")
-        translated = translate_chapter(chunk)
+        log(f"  Translating chunk {idx + 1}/{len(chunks)}...")
+        translated = translate_chapter(chunk, prompt=prompt)
         translated_chunks.append(translated)
+        progress.chunk_done()
     
     # Merge chunks (remove overlapping parts)
     # This is approximate - just take first chunk fully, then append rest
-    result = translated_chunks[0]
-    
-    for i in range(1, len(translated_chunks)):
-        # Skip the overlapping paragraphs (rough heuristic)
-        chunk_paras = translated_chunks[i].split('\n\n')
-        result += '\n\n' + '\n\n'.join(chunk_paras[2:])
+    with span("stitch", chunks=len(translated_chunks)):
+        result = translated_chunks[0]
+        
+        for i in range(1, len(translated_chunks)):
+            # Skip the overlapping paragraphs (rough heuristic)
+            chunk_paras = translated_chunks[i].split('\n\n')
+            result += '\n\n' + '\n\n'.join(chunk_paras[2:])
     
     return result
 
-def verify_translation(original, translated):
-    """Quick verification checks"""
-    issues = []
+def split_into_chunks(text, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Whole paragraphs grouped into chunks of about chunk_size characters, without overlap"""
+    chunks = []
+    current_chunk = []
+    current_length = 0
     
-    # Check for common problems
-    if len(translated) < len(original) * 0.8:
-        issues.append("Text appears truncated")
+    for para in text.split('\n\n'):
+        if current_length + len(para) > chunk_size and current_chunk:
+            chunks.append('\n\n'.join(current_chunk))
+            current_chunk = []
+            current_length = 0
+        current_chunk.append(para)
+        current_length += len(para)
     
-    if "..." in translated and "..." not in original:
-        issues.append("May contain ellipsis indicating skipped content")
+    if current_chunk:
+        chunks.append('\n\n'.join(current_chunk))
+    return chunks
+
+def build_chunk_contexts(chunks):
+    """One cheap call over the whole chapter: a "who is who" note for the start of every chunk
+
+    Returns a list with one note per chunk ('' where the model gave none).
+    """
+    log("  Building chunk context summary...")
     
-    # Count Shepard mentions (should be roughly the same)
-    orig_shepard_count = original.lower().count("shepard")
-    trans_shepard_count = translated.lower().count("shepard")
+    marked = '\n\n'.join(f"[[CHUNK {i}]]\n{chunk}" for i, chunk in enumerate(chunks))
+    response = create_response(
+        "context",
+        input=[
+            {
+                "role": "system",
+                "content": (
+                    "You are a careful reader tracking who is who in a story.\n"
+                    "Return ONLY valid JSON.\n"
+                    "Do not include markdown, code fences, or explanations."
+                )
+            },
+            {
+                "role": "user",
+                "content": f"{CONTEXT_PROMPT}\n\nChapter:\n{marked}"
+            }
+        ],
+        temperature=0
+    )
+    
+    output = response.output_text.strip()
+    if output.startswith("```"):
+        output = output.split("\n", 1)[1].rsplit("\n", 1)[0]
     
-    if abs(orig_shepard_count - trans_shepard_count) > 2:
-        issues.append(f"Shepard mention count changed: {orig_shepard_count} → {trans_shepard_count}")
+    contexts = [''] * len(chunks)
+    try:
+        notes = json.loads(output)
+    except json.JSONDecodeError:
+        log("    ⚠️  Context summary wasn't valid JSON, translating chunks without it")
+        return contexts
+    if not isinstance(notes, list):
+        log("    ⚠️  Context summary wasn't a JSON array, translating chunks without it")
+        return contexts
     
-    # Check for leftover male pronouns near Shepard
-    shepard_contexts = re.finditer(r'Shepard[^.!?]{0,100}?\b(he|him|his)\b', translated, re.IGNORECASE)
-    male_pronouns_near_shepard = list(shepard_contexts)
+    for note in notes:
+        if isinstance(note, dict) and isinstance(note.get('chunk'), int) and 0 <= note['chunk'] < len(chunks):
+            contexts[note['chunk']] = str(note.get('context', ''))
+    return contexts
+
+def translate_chapter_parallel(text, chunk_size=None, prompt=TRANSLATION_PROMPT):
+    """Translate long chapters as independent chunks, all at once
+
+    Instead of overlapping paragraphs, each chunk carries a short context note
+    from build_chunk_contexts(), so no chunk waits for the one before it and
+    the chapter takes about as long as its slowest chunk.
+    """
+    
+    chunk_size = chunk_size or translation_chunk_size()
+    if len(text) < chunk_size:
+        return translate_chapter(text, prompt=prompt)
+    
+    with span("chunk", chars=len(text)) as args:
+        chunks = split_into_chunks(text, chunk_size)
+        args['chunks'] = len(chunks)
+    
+    log(f"  Chapter is long ({len(text)} chars), translating {len(chunks)} chunks in parallel...")
+    progress.set_chunks(len(chunks))
+    
+    contexts = build_chunk_contexts(chunks)
     
-    if male_pronouns_near_shepard:
-        issues.append(f"Found {len(male_pronouns_near_shepard)} potential male pronouns near Shepard")
+    def translate(item):
+        chunk, context = item
+        translated = translate_chapter(chunk, context, prompt)
+        progress.chunk_done()
+        return translated
     
-    return issues
+    # create_response() bounds the requests actually in flight
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        translated_chunks = list(pool.map(translate, zip(chunks, contexts)))
+    
+    # No overlap to remove: chunks are consecutive runs of whole paragraphs
+    with span("stitch", chunks=len(translated_chunks)):
+        return '\n\n'.join(chunk.strip('\n') for chunk in translated_chunks)
 
 if __name__ == "__main__":
     # Parse command line arguments
-    if len(sys.argv) > 1:
-        input_dir = Path(sys.argv[1])
-    else:
-        input_dir = Path("inputs/adamo")
+    parser = argparse.ArgumentParser(description="Regender a directory of chapters with whole-text passes")
+    parser.add_argument("input_dir", nargs="?", default="inputs/adamo", help="Directory of chapter .txt files")
+    parser.add_argument("--parallel-chunks", action="store_true",
+                        help="Translate the chunks of long chapters concurrently, with a context summary instead of overlap")
+    parser.add_argument("--hedge", type=float, nargs="?", const=DEFAULT_HEDGE_BUDGET, default=None, metavar="BUDGET",
+                        help="Duplicate requests still running at their p95 latency; BUDGET caps the extra "
+                             f"tokens as a fraction (default {DEFAULT_HEDGE_BUDGET})")
+    parser.add_argument("--memory", nargs="?", const=str(MEMORY_PATH), default=None, metavar="PATH",
+                        help=f"Reuse translated paragraphs from a memory shared across chapters and books "
+                             f"(default {MEMORY_PATH})")
+    parser.add_argument("--no-registry", action="store_true", help="Don't build or send the character registry")
+    parser.add_argument("--refresh-registry", action="store_true", help="Rebuild the character registry")
+    parser.add_argument("--spec", help="Transformation spec with every character to change (see src/transform_spec.py); "
+                                       "default: John Shepard to female")
+    parser.add_argument("--progress", choices=PROGRESS_MODES, default="auto",
+                        help="json: one JSON event per line on stdout (see src/progress.py)")
+    args = parser.parse_args()
+    progress.set_mode(args.progress)
+    input_dir = Path(args.input_dir)
+    if args.hedge:
+        enable_hedging(args.hedge)
+    
+    # All characters of a spec are changed in the same pass and verified one by one
+    spec = load_spec(args.spec) if args.spec else None
+    prompt = compile_prompt(spec) if spec else TRANSLATION_PROMPT
+    rules = verification_rules(spec) if spec else None
+    if spec:
+        log(f"Spec: {args.spec} ({', '.join(c.name for c in spec.characters)})")
+    
+    # Translations only carry over between runs with the same prompt and model
+    memory = None
+    if args.memory:
+        memory = TranslationMemory(args.memory, namespace=f"{route_for('translate')[1]}:{paragraph_key(prompt)[0]}")
     
     # Derive output directory from input directory name
     input_name = input_dir.name
@@ -200,18 +568,29 @@ if __name__ == "__main__":
     output_dir.mkdir(exist_ok=True, parents=True)
     verification_dir.mkdir(exist_ok=True, parents=True)
     
-    print(f"Input directory: {input_dir}")
-    print(f"Output directory: {output_dir}")
-    print(f"Verification logs: {verification_dir}")
+    log(f"Input directory: {input_dir}")
+    log(f"Output directory: {output_dir}")
+    log(f"Verification logs: {verification_dir}")
+    
+    # Same natural order as the export scripts (ch1, ch2, ..., ch10), nested dirs included
+    chapter_index = ChapterIndex.load(input_dir)
     
-    chapter_files = sorted(input_dir.glob("*.txt"))
+    # Who's who in this book goes with every translation request. It only adds
+    # context, so the translation memory namespace above leaves it out and
+    # stays shared across books
+    if not args.no_registry:
+        characters = registry_block(load_registry(input_name, chapter_index, args.refresh_registry))
+        if characters:
+            prompt = f"{prompt}\n\n{characters}"
+    progress.start(len(chapter_index), "chapters", input_name)
 
-    for i, chapter_file in enumerate(chapter_files, 1):
-        print(f"\n{'='*60}")
-        print(f"Processing {chapter_file.name} ({i}/{len(chapter_files)})")
-        print('='*60)
+    for i, entry in enumerate(chapter_index, 1):
+        progress.item_start(entry.relpath)
+        log(f"\n{'='*60}")
+        log(f"Processing {entry.relpath} ({i}/{len(chapter_index)})")
+        log('='*60)
         
-        with open(chapter_file, 'r', encoding='utf-8') as f:
+        with span("read", chapter=entry.relpath), open(chapter_index.path(entry), 'r', encoding='utf-8') as f:
             text = f.read()
         
         # Check if chapter is too long for context window
@@ -220,36 +599,61 @@ if __name__ == "__main__":
         estimated_tokens = len(text) / 4
         
         if estimated_tokens > 90000:  # Leave room for prompt + response
-            print(f"  ⚠️  Chapter may be too long ({estimated_tokens:.0f} estimated tokens)")
-            print(f"  Consider splitting this chapter or using a chunked approach")
+            log(f"  ⚠️  Chapter may be too long ({estimated_tokens:.0f} estimated tokens)")
+            log(f"  Consider splitting this chapter or using a chunked approach")
+            progress.item_done(entry.relpath, status="skipped")
             continue
         
         # Translate
-        translated_text = translate_chapter_chunked(text)
+        with span("chapter", chapter=entry.relpath, chars=len(text)):
+            if args.parallel_chunks:
+                translated_text = translate_chapter_parallel(text, prompt=prompt)
+            else:
+                translated_text = translate_chapter_chunked(text, memory=memory, prompt=prompt)
         
-        # Verify
-        print("  Verifying translation...")
-        issues = verify_translation(text, translated_text)
+        # Redo just the paragraphs the proximity check flags, then verify
+        translated_text = retry_flagged_paragraphs(text, translated_text, spec)
+        log("  Verifying translation...")
+        with span("verify", chapter=entry.relpath):
+            issues = verify_translation(text, translated_text, rules)
         
         if issues:
-            print("  ⚠️  Verification issues found:")
+            log("  ⚠️  Verification issues found:")
             for issue in issues:
-                print(f"    - {issue}")
+                log(f"    - {issue}")
             
             # Save verification report
-            with open(verification_dir / f"{chapter_file.stem}_issues.json", 'w') as f:
+            with open(verification_dir / f"{entry.slug}_issues.json", 'w') as f:
                 json.dump(issues, f, indent=2)
         else:
-            print("  ✓ Verification passed")
+            log("  ✓ Verification passed")
+            # Only verified output is worth reusing
+            if memory is not None:
+                remember_chapter(memory, text, translated_text)
         
         # Save result
-        output_file = output_dir / chapter_file.name
-        with open(output_file, 'w', encoding='utf-8') as f:
+        output_file = output_dir / entry.relpath
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+        with span("write", chapter=entry.relpath), open(output_file, 'w', encoding='utf-8') as f:
             f.write(translated_text)
         
-        print(f"✓ Saved to {output_file}")
+        log(f"✓ Saved to {output_file}")
+        
+        # Save the change as a patch, so it can be reverted or re-targeted without the API
+        with span("patch", chapter=entry.relpath):
+            patch = make_patch(text, translated_text)
+            save_patch(patch, patch_path(input_name, entry))
+        log(f"  Patch: {len(patch['edits'])} edits -> {patch_path(input_name, entry)}")
+        progress.item_done(entry.relpath, status="issues" if issues else "ok", issues=len(issues),
+                           chars=len(translated_text))
 
-    print(f"\n{'='*60}")
-    print(f"Done! Processed {len(chapter_files)} chapters.")
-    print(f"Check '{verification_dir}/' for any issues")
-    print('='*60)
+    progress.finish()
+    log(f"\n{'='*60}")
+    log(f"Done! Processed {len(chapter_index)} chapters.")
+    log(f"Check '{verification_dir}/' for any issues")
+    if memory is not None:
+        evicted = memory.evict()
+        report = memory.report()
+        log(f"Translation memory: {report['hits']}/{report['hits'] + report['misses']} paragraphs reused "
+            f"({report['reuse_rate'] * 100:.1f}%), {report['entries']} entries, {evicted} evicted")
+    log('='*60)
@@ -0,0 +1,166 @@
+#######
+# Chapter scanning for the local verification heuristics
+# Tokenizes a chapter once into arrays of the words the heuristics care about
+# and of sentence boundaries, using one pattern compiled at import, and answers
+# every heuristic query (male pronouns near Shepard, pronoun counts, gendered
+# nouns) from those arrays with bisect instead of running a separate
+# backtracking regex per query.
+#
+# pronouns_near_name() returns exactly the matches of the old
+#   re.finditer(r'Shepard[^.!?]{0,100}?\b(he|him|his)\b', text, re.IGNORECASE)
+# see benchmarks/bench_scanning.py for the comparison on inputs/adamo.
+#######
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import re
+
+
+MALE_PRONOUNS = frozenset({'he', 'him', 'his', 'himself'})
+FEMALE_PRONOUNS = frozenset({'she', 'her', 'hers', 'herself'})
+MALE_NOUNS = frozenset({'man', 'guy', 'male', 'boyfriend', 'husband', 'sir', 'gentleman', 'boy'})
+FEMALE_NOUNS = frozenset({'woman', 'girl', 'female', 'girlfriend', 'wife', 'madam', 'lady'})
+
+# The pronouns the original proximity heuristic looks for
+PROXIMITY_PRONOUNS = frozenset({'he', 'him', 'his'})
+PROXIMITY_WINDOW = 100
+
+TRACKED_WORDS = MALE_PRONOUNS | FEMALE_PRONOUNS | MALE_NOUNS | FEMALE_NOUNS
+
+# Whole-word match of any tracked word, longest first so "his" isn't cut to "hi"
+_TRACKED_RE = re.compile(r'\b(?:' + '|'.join(sorted(TRACKED_WORDS, key=len, reverse=True)) + r')\b')
+_TERMINATOR_RE = re.compile(r'[.!?]')
+_WORD_END_RE = re.compile(r'\w+')
+
+
+class ChapterScan:
+    """One pass over a chapter; all queries afterwards are array lookups"""
+
+    def __init__(self, text):
+        self.text = text
+        lowered = text.lower()
+        # str.lower() can change the length of a few characters (e.g. "İ");
+        # offsets must stay comparable with the original text
+        self.lowered = lowered if len(lowered) == len(text) else ''.join(c.lower()[0] for c in text)
+
+        # Only the tracked vocabulary is tokenized; every other word is skipped in C
+        self.words = []
+        self.word_starts = array('l')
+        for match in _TRACKED_RE.finditer(self.lowered):
+            self.words.append(match.group())
+            self.word_starts.append(match.start())
+
+        self.terminators = array('l', (m.start() for m in _TERMINATOR_RE.finditer(self.lowered)))
+        self.word_counts = Counter(self.words)
+        self._positions = {}
+        self._paragraph_starts = None
+
+    def word_positions(self, words):
+        """Start offsets of every whole-word occurrence of words (a frozenset), cached per set"""
+        positions = self._positions.get(words)
+        if positions is None:
+            if words <= TRACKED_WORDS:
+                positions = array('l', (start for word, start in zip(self.words, self.word_starts) if word in words))
+            else:
+                pattern = r'\b(?:' + '|'.join(sorted(map(re.escape, words), key=len, reverse=True)) + r')\b'
+                positions = array('l', (m.start() for m in re.finditer(pattern, self.lowered)))
+            self._positions[words] = positions
+        return positions
+
+    def substring_positions(self, needle):
+        """Start offsets of a case-insensitive substring (like an unanchored regex literal)"""
+        needle = needle.lower()
+        positions = array('l')
+        i = self.lowered.find(needle)
+        while i != -1:
+            positions.append(i)
+            i = self.lowered.find(needle, i + 1)
+        return positions
+
+    def count(self, words):
+        if words <= TRACKED_WORDS:
+            return sum(self.word_counts[w] for w in words)
+        return len(self.word_positions(words))
+
+    def has_terminator(self, start, end):
+        """True if a sentence-ending mark lies in [start, end)"""
+        i = bisect_left(self.terminators, start)
+        return i < len(self.terminators) and self.terminators[i] < end
+
+    def sentence_bounds(self, position):
+        """(start, end) of the sentence containing position, by terminator marks"""
+        i = bisect_left(self.terminators, position)
+        start = self.terminators[i - 1] + 1 if i > 0 else 0
+        end = self.terminators[i] + 1 if i < len(self.terminators) else len(self.text)
+        return start, end
+
+    def pronouns_near_name(self, name="shepard", pronouns=PROXIMITY_PRONOUNS, window=PROXIMITY_WINDOW):
+        """(name_start, pronoun_start, pronoun_end) for each pronoun following the name
+        within window characters and the same sentence
+
+        Same semantics as a non-overlapping, case-insensitive finditer of
+        name[^.!?]{0,window}?\\b(pronoun)\\b.
+        """
+        name_positions = self.substring_positions(name)
+        pronoun_positions = self.word_positions(pronouns)
+        hits = []
+        last_end = 0
+
+        for name_start in name_positions:
+            if name_start < last_end:
+                continue
+            name_end = name_start + len(name)
+            i = bisect_left(pronoun_positions, name_end)
+            if i == len(pronoun_positions):
+                break
+            pronoun_start = pronoun_positions[i]
+            if pronoun_start - name_end > window or self.has_terminator(name_end, pronoun_start):
+                continue
+            pronoun_end = _WORD_END_RE.match(self.lowered, pronoun_start).end()
+            hits.append((name_start, pronoun_start, pronoun_end))
+            last_end = pronoun_end
+
+        return hits
+
+    def paragraph_starts(self):
+        """Start offsets of the blank-line separated paragraphs"""
+        if self._paragraph_starts is None:
+            starts = array('l', [0])
+            i = self.text.find('\n\n')
+            while i != -1:
+                starts.append(i + 2)
+                i = self.text.find('\n\n', i + 2)
+            self._paragraph_starts = starts
+        return self._paragraph_starts
+
+    def paragraph_of(self, position):
+        """Index of the blank-line separated paragraph containing position"""
+        return bisect_right(self.paragraph_starts(), position) - 1
+
+    def locate_flagged_pronouns(self, name="shepard", pronouns=PROXIMITY_PRONOUNS, window=PROXIMITY_WINDOW):
+        """Every pronoun the proximity heuristic flags, with its paragraph and sentence
+
+        Each hit is a dict with the paragraph index, the sentence span and text,
+        and the pronoun span and word, so a retry can target just that paragraph.
+        """
+        flagged = []
+        for name_start, pronoun_start, pronoun_end in self.pronouns_near_name(name, pronouns, window):
+            sentence_start, sentence_end = self.sentence_bounds(name_start)
+            # The hit can't cross a terminator, so the pronoun is in the same sentence
+            flagged.append({
+                'paragraph': self.paragraph_of(pronoun_start),
+                'sentence_start': sentence_start,
+                'sentence_end': sentence_end,
+                'sentence': self.text[sentence_start:sentence_end].strip(),
+                'pronoun_start': pronoun_start,
+                'pronoun_end': pronoun_end,
+                'pronoun': self.text[pronoun_start:pronoun_end],
+            })
+        return flagged
+
+
+def regex_pronouns_near_name(text, name="Shepard", window=PROXIMITY_WINDOW):
+    """Reference implementation: the regex the verifier used before ChapterScan"""
+    pattern = rf'{re.escape(name)}[^.!?]{{0,{window}}}?\b(he|him|his)\b'
+    return [(m.start(), m.start(1), m.end(1)) for m in re.finditer(pattern, text, re.IGNORECASE)]
@@ -0,0 +1,118 @@
+#######
+# Pipeline instrumentation
+# Records timed spans (chapter read, chunking, each API call, stitching,
+# verification, write, export renderers) and writes them as Chrome trace JSON,
+# viewable in chrome://tracing or https://ui.perfetto.dev, plus a p50/p95
+# summary per span name.
+#
+# API calls go through src/llm.py, which records for every request:
+#   <stage>.queue   time waiting for a free request slot
+#   <stage>.api     the call itself; args split it into server processing time
+#                   (openai-processing-ms) and the rest (network, TLS, queueing
+#                   upstream), with the token counts
+#
+# USAGE:
+#   Set TRACE_FILE (environment or .env) before running any pipeline script:
+#     TRACE_FILE=outputs/trace.json python src/regender_v2.py inputs/adamo
+#     TRACE_FILE=outputs/trace.json python scripts/export.py outputs/adamo
+#
+#   The trace is written and the summary printed when the script exits.
+#######
+
+from contextlib import contextmanager
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+
+_events = []
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+def _micros(t):
+    return round((t - _origin) * 1e6, 1)
+
+
+def record(name, start, end, **args):
+    """Add a completed span from two time.perf_counter() readings"""
+    event = {
+        'name': name,
+        'cat': name.split('.', 1)[0],
+        'ph': 'X',
+        'ts': _micros(start),
+        'dur': round((end - start) * 1e6, 1),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+@contextmanager
+def span(name, **args):
+    """Time the body of a with block; yields the args dict so it can be filled in"""
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        record(name, start, time.perf_counter(), **args)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, round(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summary():
+    """{span name: {count, total_ms, p50_ms, p95_ms}}"""
+    durations = {}
+    with _lock:
+        for event in _events:
+            durations.setdefault(event['name'], []).append(event['dur'] / 1000)
+
+    return {
+        name: {
+            'count': len(values),
+            'total_ms': round(sum(values), 1),
+            'p50_ms': round(percentile(values, 50), 1),
+            'p95_ms': round(percentile(values, 95), 1),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+
+def print_summary(stream=None):
+    """Span table on stderr (stdout may carry progress events, see src/progress.py)"""
+    stream = stream or sys.stderr
+    stats = summary()
+    if not stats:
+        return
+    width = max(len(name) for name in stats)
+    print(f"\n{'span':<{width}} {'count':>6} {'total ms':>10} {'p50 ms':>9} {'p95 ms':>9}", file=stream)
+    for name, s in stats.items():
+        print(f"{name:<{width}} {s['count']:>6} {s['total_ms']:>10.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f}", file=stream)
+
+
+def save(path):
+    """Write every span so far as a Chrome trace file"""
+    with _lock:
+        events = list(_events)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+@atexit.register
+def _save_on_exit():
+    path = os.getenv("TRACE_FILE")
+    if path and _events:
+        save(path)
+        print_summary()
+        print(f"Trace: {path}", file=sys.stderr)
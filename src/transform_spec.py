@@ -0,0 +1,202 @@
+#######
+# Declarative transformation specs
+# Describes every character to change in a book, so all of them are applied
+# in one LLM pass per chunk instead of one full pass per character. A spec
+# compiles into one translation prompt (compile_prompt) and one set of
+# per-character verification rules (verification_rules), used by
+# regender_v2.py --spec and verify.py --spec.
+#
+# Spec format (JSON, or YAML if PyYAML is installed):
+#   {"characters": [
+#      {"name": "John Shepard",               # how the prompt refers to them
+#       "from": "male", "to": "female",       # male | female | nonbinary
+#       "anchor": "Shepard",                  # name the verifier looks for (default: last word of name)
+#       "aliases": ["Commander Shepard", "the Commander", "the Spectre"],
+#       "keep": ["Shepard", "Commander Shepard"],      # references left unchanged
+#       "names": {"John": "Jane"},            # first names and nicknames to replace
+#       "nouns": {"boyfriend": "girlfriend"}, # extra gendered nouns (on top of the defaults)
+#       "traits": ["Remove or adapt masculine-only traits (beard, etc.)"]},
+#      {"name": "Kaidan Alenko", "from": "male", "to": "female", "names": {"Kaidan": "Kaila"}}],
+#    "notes": ["Rules for the whole text, one per item"]}
+#
+# USAGE:
+#   From the project root directory:
+#     python src/regender_v2.py inputs/adamo --spec specs/shepard_female.json
+#     python src/verify.py adamo --spec specs/shepard_female.json
+#######
+
+from dataclasses import dataclass
+from pathlib import Path
+import json
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Whole-word pronouns per gender: (subject, object, possessive, possessive pronoun, reflexive)
+PRONOUNS = {
+    'male': ('he', 'him', 'his', 'his', 'himself'),
+    'female': ('she', 'her', 'her', 'hers', 'herself'),
+    'nonbinary': ('they', 'them', 'their', 'theirs', 'themself'),
+}
+
+# Gendered nouns in (male, female, nonbinary) form; the defaults for every character
+GENDERED_NOUNS = [
+    ('man', 'woman', 'person'),
+    ('guy', 'woman', 'person'),
+    ('boy', 'girl', 'kid'),
+    ('gentleman', 'lady', 'person'),
+    ('boyfriend', 'girlfriend', 'partner'),
+    ('husband', 'wife', 'spouse'),
+    ('brother', 'sister', 'sibling'),
+    ('son', 'daughter', 'child'),
+]
+
+_GENDER_COLUMN = {'male': 0, 'female': 1, 'nonbinary': 2}
+
+
+@dataclass(frozen=True, slots=True)
+class CharacterSpec:
+    name: str
+    from_gender: str
+    to_gender: str
+    anchor: str
+    aliases: tuple = ()
+    keep: tuple = ()
+    names: tuple = ()      # (old, new) pairs
+    nouns: tuple = ()      # (old, new) pairs, defaults included
+    traits: tuple = ()
+
+
+@dataclass(frozen=True, slots=True)
+class TransformSpec:
+    characters: tuple
+    notes: tuple = ()
+
+
+def _character(fields):
+    name = fields.get('name')
+    if not name:
+        raise ValueError("Every character in a spec needs a name")
+    from_gender, to_gender = fields.get('from'), fields.get('to')
+    for gender in (from_gender, to_gender):
+        if gender not in PRONOUNS:
+            raise ValueError(f"'{name}': gender must be one of {', '.join(PRONOUNS)} (got {gender!r})")
+    if from_gender == to_gender:
+        raise ValueError(f"'{name}': 'from' and 'to' are both {from_gender}")
+
+    old, new = _GENDER_COLUMN[from_gender], _GENDER_COLUMN[to_gender]
+    nouns = {row[old]: row[new] for row in GENDERED_NOUNS}
+    nouns.update(fields.get('nouns', {}))
+
+    return CharacterSpec(
+        name=name,
+        from_gender=from_gender,
+        to_gender=to_gender,
+        anchor=fields.get('anchor') or name.split()[-1],
+        aliases=tuple(fields.get('aliases', ())),
+        keep=tuple(fields.get('keep', ())),
+        names=tuple(fields.get('names', {}).items()),
+        nouns=tuple(nouns.items()),
+        traits=tuple(fields.get('traits', ())),
+    )
+
+
+def parse_spec(config):
+    """TransformSpec from an already-loaded JSON/YAML document"""
+    characters = tuple(_character(fields) for fields in config.get('characters', ()))
+    if not characters:
+        raise ValueError("A spec needs at least one character")
+    anchors = [c.anchor.lower() for c in characters]
+    if len(set(anchors)) != len(anchors):
+        raise ValueError("Characters need distinct anchors to be verified separately")
+    return TransformSpec(characters, tuple(config.get('notes', ())))
+
+
+def load_spec(path):
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ValueError(f"{path} is YAML, which needs PyYAML (pip install pyyaml); or use JSON")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    return parse_spec(config)
+
+
+def _pronoun_map(character):
+    # "her" is both object and possessive, so it can map to two forms
+    mapping = {}
+    for old, new in zip(PRONOUNS[character.from_gender], PRONOUNS[character.to_gender]):
+        forms = mapping.setdefault(old, [])
+        if new not in forms:
+            forms.append(new)
+    return ', '.join(f"{old} → {'/'.join(forms)}" for old, forms in mapping.items())
+
+
+def describe_character(character):
+    """The rules for one character, as prompt lines"""
+    lines = [f'"{character.name}" is currently {character.from_gender} and becomes {character.to_gender}.']
+    references = ', '.join(f'"{a}"' for a in (character.anchor, *character.aliases))
+    lines.append(f"- References to them include: {references}, first names and pronouns")
+    lines.append(f"- Pronouns referring to {character.name}: {_pronoun_map(character)}")
+    for old, new in character.names:
+        lines.append(f'- Name: "{old}" → "{new}"')
+    nouns = ', '.join(f'"{old}" → "{new}"' for old, new in character.nouns)
+    lines.append(f"- Gendered nouns describing {character.name}: {nouns}")
+    for trait in character.traits:
+        lines.append(f"- {trait}")
+    if character.keep:
+        lines.append(f"- DO NOT change {', '.join(f'"{k}"' for k in character.keep)}")
+    return '\n'.join(lines)
+
+
+def describe_rules(spec):
+    """Every character's rules, plus the notes, for use inside a prompt"""
+    sections = [describe_character(c) for c in spec.characters]
+    if spec.notes:
+        sections.append('\n'.join(f"- {note}" for note in spec.notes))
+    return '\n\n'.join(sections)
+
+
+def compile_prompt(spec):
+    """One translation prompt applying every character's transformation in the same pass"""
+    names = ', '.join(f'"{c.name}"' for c in spec.characters)
+    return f"""Transform this text so that the following characters change gender: {names}.
+
+Read this text carefully and identify EVERY reference to each of these characters: names, aliases and titles, pronouns and gendered nouns. Then apply all of the changes below in this single pass.
+
+{describe_rules(spec)}
+
+Only change a pronoun or noun when it refers to one of these characters; every other character keeps their gender.
+
+Sometimes the change creates repeated pronouns that are ambiguous (e.g. "with her on top of her"). If so, replace one of them with a name or a noun so it's clear who is who.
+
+**CRITICAL RULES**:
+- Return the COMPLETE text with all changes applied
+- Preserve ALL formatting, whitespace, line breaks, and punctuation exactly
+- Do NOT summarize, skip sections, or add commentary
+- Do NOT change the plot, dialogue (except the changes above), or any content beyond gender changes
+
+Return ONLY the transformed text, nothing else."""
+
+
+def verification_rules(spec):
+    """One rule per character for the verifier: where to look and what shouldn't be left
+
+    residual_pronouns are the former gender's pronouns that still flag a
+    sentence when they follow the anchor; old_names should be gone.
+    """
+    rules = []
+    for character in spec.characters:
+        subject, obj, possessive = PRONOUNS[character.from_gender][:3]
+        rules.append({
+            'character': character.name,
+            'anchor': character.anchor.lower(),
+            'residual_pronouns': frozenset({subject, obj, possessive}),
+            'old_names': frozenset(old.lower() for old, _ in character.names),
+        })
+    return rules
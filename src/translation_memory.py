@@ -0,0 +1,127 @@
+#######
+# Paragraph translation memory
+# A sqlite store of transformed paragraphs, shared by every chapter and book.
+# An entry is keyed by the paragraph's normalized text plus its neighbours
+# (pronouns depend on them) and a namespace for the prompt and model, so a
+# paragraph is reused wherever it appears again in the same surroundings:
+# after re-chunking, in a lightly edited chapter, or in another book.
+#
+# Least recently used entries are evicted past max_entries.
+#######
+
+from pathlib import Path
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+DEFAULT_PATH = Path("outputs/translation_memory.sqlite")
+DEFAULT_MAX_ENTRIES = 200_000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_paragraph(paragraph):
+    """NFC, collapsed whitespace, no leading/trailing space"""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', paragraph)).strip()
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def paragraph_key(paragraph, previous='', following=''):
+    """(source hash, context hash) of a paragraph in its surroundings"""
+    return (_digest(normalize_paragraph(paragraph)),
+            _digest(normalize_paragraph(previous), normalize_paragraph(following)))
+
+
+class TranslationMemory:
+    """Paragraph -> transformed paragraph, persisted in sqlite"""
+
+    def __init__(self, path=DEFAULT_PATH, namespace="", max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS memory (
+            namespace TEXT NOT NULL,
+            source_hash TEXT NOT NULL,
+            context_hash TEXT NOT NULL,
+            translation TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            uses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (namespace, source_hash, context_hash))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS memory_last_used ON memory (last_used)")
+        self._db.commit()
+
+    def lookup(self, keys):
+        """Translations for a list of (source hash, context hash) keys, None for each miss"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 400):
+                batch = keys[i:i + 400]
+                condition = ' OR '.join(['(source_hash = ? AND context_hash = ?)'] * len(batch))
+                rows = self._db.execute(
+                    f"SELECT source_hash, context_hash, translation FROM memory WHERE namespace = ? AND ({condition})",
+                    [self.namespace, *(h for key in batch for h in key)])
+                found.update(((source, context), translation) for source, context, translation in rows)
+
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE memory SET last_used = ?, uses = uses + 1 "
+                    "WHERE namespace = ? AND source_hash = ? AND context_hash = ?",
+                    [(now, self.namespace, *key) for key in found])
+                self._db.commit()
+
+        results = [found.get(key) for key in keys]
+        hits = sum(1 for r in results if r is not None)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return results
+
+    def store(self, entries):
+        """Save (key, translation) pairs"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO memory (namespace, source_hash, context_hash, translation, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, *key, translation, now) for key, translation in entries])
+            self._db.commit()
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries; returns how many"""
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM memory").fetchone()
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._db.execute(
+                "DELETE FROM memory WHERE rowid IN (SELECT rowid FROM memory ORDER BY last_used LIMIT ?)", (excess,))
+            self._db.commit()
+            return excess
+
+    def reuse_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM memory").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'reuse_rate': round(self.reuse_rate(), 4), 'entries': entries}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,244 @@
+#######
+# Verification for regendered chapters
+# Local, API-free checks that compare each output chapter with its input.
+# regender_v2.py runs verify_translation inline after every chapter; this script
+# also runs standalone over every inputs/<book> / outputs/<book> pair in
+# parallel and writes one structured report.
+#
+# USAGE:
+#   From the project root directory:
+#     python src/verify.py [book ...] [--max-pronoun-hits N] [...]
+#
+#   Examples:
+#     python src/verify.py                        # Every book that has outputs
+#     python src/verify.py adamo                  # Only adamo
+#     python src/verify.py --max-pronoun-hits 5   # Looser gate on residual pronouns
+#     python src/verify.py adamo --spec specs/shepard_female.json   # Gate every character of a spec
+#
+#   Report will be saved to outputs/verification_log/report.json
+#   Exit status is 1 if any chapter is outside the thresholds
+#######
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import sys
+
+from chapter_index import ChapterIndex
+from scanning import ChapterScan
+from tracing import span
+from transform_spec import load_spec, verification_rules
+
+
+# Gate used by the standalone command; override any of them on the command line
+DEFAULT_THRESHOLDS = {
+    'min_length_ratio': 0.9,
+    'max_length_ratio': 1.1,
+    'max_shepard_delta': 2,
+    'max_pronoun_hits': 10,
+    'max_paragraph_delta': 0,
+    'max_old_name_hits': 0,
+}
+
+
+def character_metrics(original_scan, translated_scan, rule):
+    """Checks for one character of a transformation spec (see transform_spec.verification_rules)"""
+    anchor = rule['anchor']
+    return {
+        'character': rule['character'],
+        'anchor_count_delta': (len(translated_scan.substring_positions(anchor))
+                               - len(original_scan.substring_positions(anchor))),
+        'residual_pronoun_hits': len(translated_scan.pronouns_near_name(anchor, rule['residual_pronouns'])),
+        'old_name_hits': len(translated_scan.word_positions(rule['old_names'])) if rule['old_names'] else 0,
+    }
+
+
+def verify_translation(original, translated, rules=None):
+    """Quick verification checks
+
+    With rules from a transformation spec, the Shepard checks are replaced
+    by the same checks for every character in it.
+    """
+    issues = []
+
+    # Check for common problems
+    if len(translated) < len(original) * 0.8:
+        issues.append("Text appears truncated")
+
+    if "..." in translated and "..." not in original:
+        issues.append("May contain ellipsis indicating skipped content")
+
+    if rules is not None:
+        original_scan, translated_scan = ChapterScan(original), ChapterScan(translated)
+        for rule in rules:
+            metrics = character_metrics(original_scan, translated_scan, rule)
+            name = metrics['character']
+            if abs(metrics['anchor_count_delta']) > 2:
+                issues.append(f"{name}: '{rule['anchor']}' mention count changed by {metrics['anchor_count_delta']:+}")
+            if metrics['residual_pronoun_hits']:
+                issues.append(f"{name}: found {metrics['residual_pronoun_hits']} potential former-gender pronouns nearby")
+            if metrics['old_name_hits']:
+                issues.append(f"{name}: former name still appears {metrics['old_name_hits']} times")
+        return issues
+
+    # Count Shepard mentions (should be roughly the same)
+    orig_shepard_count = original.lower().count("shepard")
+    trans_shepard_count = translated.lower().count("shepard")
+
+    if abs(orig_shepard_count - trans_shepard_count) > 2:
+        issues.append(f"Shepard mention count changed: {orig_shepard_count} → {trans_shepard_count}")
+
+    # Check for leftover male pronouns near Shepard
+    male_pronouns_near_shepard = ChapterScan(translated).pronouns_near_name("shepard")
+
+    if male_pronouns_near_shepard:
+        issues.append(f"Found {len(male_pronouns_near_shepard)} potential male pronouns near Shepard")
+
+    return issues
+
+
+def chapter_metrics(original, translated, rules=None):
+    """Numbers the gate is applied to, for one chapter
+
+    With spec rules, per-character metrics are added under 'characters'.
+    """
+    original_paragraphs = original.count('\n\n') + 1
+    translated_paragraphs = translated.count('\n\n') + 1
+
+    original_scan = ChapterScan(original)
+    translated_scan = ChapterScan(translated)
+    orig_shepard_count = len(original_scan.substring_positions("shepard"))
+    trans_shepard_count = len(translated_scan.substring_positions("shepard"))
+    residual = translated_scan.pronouns_near_name("shepard")
+
+    metrics = {
+        'original_chars': len(original),
+        'translated_chars': len(translated),
+        'length_ratio': round(len(translated) / len(original), 4) if original else 1.0,
+        'shepard_count_delta': trans_shepard_count - orig_shepard_count,
+        'residual_pronoun_hits': len(residual),
+        'paragraph_count_delta': translated_paragraphs - original_paragraphs,
+    }
+    if rules is not None:
+        metrics['characters'] = [character_metrics(original_scan, translated_scan, rule) for rule in rules]
+    return metrics
+
+
+def check_thresholds(metrics, thresholds):
+    """Names of the thresholds a chapter's metrics violate"""
+    failures = []
+    if metrics['length_ratio'] < thresholds['min_length_ratio']:
+        failures.append('min_length_ratio')
+    if metrics['length_ratio'] > thresholds['max_length_ratio']:
+        failures.append('max_length_ratio')
+    if abs(metrics['shepard_count_delta']) > thresholds['max_shepard_delta']:
+        failures.append('max_shepard_delta')
+    if metrics['residual_pronoun_hits'] > thresholds['max_pronoun_hits']:
+        failures.append('max_pronoun_hits')
+    if abs(metrics['paragraph_count_delta']) > thresholds['max_paragraph_delta']:
+        failures.append('max_paragraph_delta')
+    # Spec characters share the name and pronoun thresholds
+    for character in metrics.get('characters', ()):
+        name = character['character']
+        if abs(character['anchor_count_delta']) > thresholds['max_shepard_delta']:
+            failures.append(f"max_shepard_delta:{name}")
+        if character['residual_pronoun_hits'] > thresholds['max_pronoun_hits']:
+            failures.append(f"max_pronoun_hits:{name}")
+        if character['old_name_hits'] > thresholds['max_old_name_hits']:
+            failures.append(f"max_old_name_hits:{name}")
+    return failures
+
+
+def verify_chapter(book, relpath, input_file, output_file, thresholds, rules=None):
+    """Worker: metrics and gate result for one chapter pair"""
+    result = {'book': book, 'chapter': relpath}
+
+    if not Path(output_file).exists():
+        return {**result, 'status': 'missing', 'failures': ['missing_output']}
+
+    # The scans need each whole chapter as a str anyway, so a plain read is all it takes
+    original = Path(input_file).read_text(encoding='utf-8')
+    translated = Path(output_file).read_text(encoding='utf-8')
+    metrics = chapter_metrics(original, translated, rules=rules)
+    failures = check_thresholds(metrics, thresholds)
+    return {**result, **metrics, 'status': 'fail' if failures else 'pass', 'failures': failures}
+
+
+def find_books(inputs_root, outputs_root, names=None):
+    """Books that exist both as inputs/<book> and outputs/<book>"""
+    books = []
+    for input_dir in sorted(Path(inputs_root).iterdir()):
+        if not input_dir.is_dir() or (names and input_dir.name not in names):
+            continue
+        output_dir = Path(outputs_root) / input_dir.name
+        if output_dir.is_dir():
+            books.append((input_dir, output_dir))
+    return books
+
+
+def verify_corpus(books, thresholds, workers=None, rules=None):
+    """Verify every chapter of every book in parallel, in stable chapter order"""
+    jobs = []
+    for input_dir, output_dir in books:
+        chapter_index = ChapterIndex.load(input_dir)
+        for entry in chapter_index:
+            jobs.append((input_dir.name, entry.relpath, str(chapter_index.path(entry)),
+                         str(output_dir / entry.relpath), thresholds, rules))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(verify_chapter, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def print_summary(results):
+    """Per-chapter table followed by totals"""
+    header = f"{'book':<12} {'chapter':<16} {'ratio':>6} {'shep Δ':>6} {'pron':>5} {'para Δ':>6}  status"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        if r['status'] == 'missing':
+            print(f"{r['book']:<12} {r['chapter']:<16} {'':>6} {'':>6} {'':>5} {'':>6}  missing")
+            continue
+        flag = '✓' if r['status'] == 'pass' else '✗ ' + ', '.join(r['failures'])
+        print(f"{r['book']:<12} {r['chapter']:<16} {r['length_ratio']:>6.3f} {r['shepard_count_delta']:>6} "
+              f"{r['residual_pronoun_hits']:>5} {r['paragraph_count_delta']:>6}  {flag}")
+        for c in r.get('characters', ()):
+            print(f"{'':<12}   {c['character']:<23} {c['anchor_count_delta']:>6} {c['residual_pronoun_hits']:>5}"
+                  f"{'':>7}  old names: {c['old_name_hits']}")
+
+    failed = sum(1 for r in results if r['status'] != 'pass')
+    print('-' * len(header))
+    print(f"{len(results)} chapters, {len(results) - failed} passed, {failed} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify every outputs/<book> against inputs/<book>")
+    parser.add_argument("books", nargs="*", help="Book names to check (default: all with outputs)")
+    parser.add_argument("--inputs", default="inputs", help="Root of the input books")
+    parser.add_argument("--outputs", default="outputs", help="Root of the output books")
+    parser.add_argument("--report", default="outputs/verification_log/report.json", help="JSON report path")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--spec", help="Transformation spec (see src/transform_spec.py): also gate every character in it")
+    for name, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+    books = find_books(args.inputs, args.outputs, set(args.books))
+    if not books:
+        print("  ⚠️  No inputs/<book> with matching outputs/<book> found")
+        sys.exit(1)
+
+    rules = verification_rules(load_spec(args.spec)) if args.spec else None
+    with span("verify", books=len(books)):
+        results = verify_corpus(books, thresholds, args.workers, rules)
+    print_summary(results)
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(exist_ok=True, parents=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'thresholds': thresholds, 'spec': args.spec, 'chapters': results}, f, indent=2, ensure_ascii=False)
+    print(f"Report: {report_path}")
+
+    sys.exit(1 if any(r['status'] != 'pass' for r in results) else 0)